@@ -1 +1,5 @@
 """Main command line interface for fm_device."""
+from fd_device.system.startup_profile import STARTUP_PROFILE
+
+# the start of the device is timed from the import of the CLI
+STARTUP_PROFILE.start()
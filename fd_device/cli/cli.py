@@ -1,22 +1,27 @@
 """Main command line interface entry point."""
 import click
 
-from .db import commands as db_commands
-from .manage import commands as manage_commands
-from .manage import setup_commands
-from .testing import commands as testing_commands
+from fd_device.system.startup_profile import STARTUP_PROFILE
 
+from .lazy import LazyGroup
 
-@click.group()
-def entry_point():
-    """Entry point for CLI."""
-
+STARTUP_PROFILE.mark("cli_import")
 
-entry_point.add_command(manage_commands.run)
-entry_point.add_command(setup_commands.first_setup)
 
-entry_point.add_command(testing_commands.test)
-entry_point.add_command(testing_commands.lint)
-entry_point.add_command(testing_commands.docstring)
-
-entry_point.add_command(db_commands.database)
+@click.group(
+    cls=LazyGroup,
+    lazy_commands={
+        "run": "fd_device.cli.manage.commands:run",
+        "first-setup": "fd_device.cli.manage.setup_commands:first_setup",
+        "test": "fd_device.cli.testing.commands:test",
+        "lint": "fd_device.cli.testing.commands:lint",
+        "docstring": "fd_device.cli.testing.commands:docstring",
+        "benchmark": "fd_device.cli.testing.commands:benchmark",
+        "simulate": "fd_device.cli.testing.commands:simulate",
+        "footprint": "fd_device.cli.testing.commands:footprint",
+        "heartbeat-responder": "fd_device.cli.testing.commands:heartbeat_responder",
+        "database": "fd_device.cli.db.commands:database",
+    },
+)
+def entry_point():
+    """Entry point for CLI."""
@@ -0,0 +1,38 @@
+"""A click group that imports the module of a subcommand only when it is used."""
+import importlib
+
+import click
+
+
+class LazyGroup(click.Group):
+    """A click group whose subcommands are imported on first use.
+
+    Some command modules import heavy dependencies (pytest, alembic, every
+    database model), so importing them all slows every invocation down.
+    The subcommands are given as 'module:attribute' import paths by name.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        """Create the LazyGroup object.
+
+        :param dict lazy_commands: Command names to the 'module:attribute' of the command.
+        """
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        """Return the names of the loaded and the lazy commands, sorted."""
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        """Return a command, importing it first if it is a lazy command."""
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            self.add_command(self._import_command(cmd_name), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _import_command(self, cmd_name):
+        module_name, attribute = self.lazy_commands[cmd_name].split(":")
+        command = getattr(importlib.import_module(module_name), attribute)
+        if not isinstance(command, click.BaseCommand):
+            raise ValueError(f"{self.lazy_commands[cmd_name]} is not a click command")
+        return command
@@ -2,11 +2,21 @@
 
 import click
 
-from fd_device.main import main
+from fd_device.system.startup_profile import STARTUP_PROFILE
 
 
 @click.command()
-def run():
+@click.option(
+    "--profile-startup",
+    is_flag=True,
+    help="Print how long each phase of the start took, once the first heartbeat is acked.",
+)
+def run(profile_startup):
     """Run the server."""
+    # imported here, so the help of every command does not load the whole device
+    from fd_device.main import main  # pylint: disable=import-outside-toplevel
+
+    STARTUP_PROFILE.mark("device_import")
     click.echo("Starting server.")
+    STARTUP_PROFILE.echo = profile_startup
     main()
@@ -5,6 +5,7 @@ import click
 from sqlalchemy.orm.exc import NoResultFound
 
 from fd_device.database.base import get_session
+from fd_device.database.database import SINGLETON_CACHE
 from fd_device.database.device import Device, Grainbin
 from fd_device.database.system import Hardware, Software, SystemSetup
 from fd_device.device.temperature import get_connected_sensors
@@ -148,10 +149,9 @@ def initialize_device():
     """
     session = get_session()
 
-    try:
-        hd = session.query(Hardware).one()
-        sd = session.query(Software).one()
-    except NoResultFound:
+    hd = SINGLETON_CACHE.get(session, Hardware)
+    sd = SINGLETON_CACHE.get(session, Software)
+    if hd is None or sd is None:
         session.close()
         return
 
@@ -172,8 +172,21 @@ def initialize_device():
 
     # set grainbin info
     grainbins = initialize_grainbin(device.device_id, hd.grainbin_reader_count)
-    for grainbin in grainbins:
-        session.merge(grainbin)
+    Grainbin.bulk_upsert(
+        session,
+        [
+            {
+                "name": grainbin.name,
+                "bus_number": grainbin.bus_number,
+                "device_id": grainbin.device_id,
+                "average_temp": grainbin.average_temp,
+            }
+            for grainbin in grainbins
+        ],
+        index_elements=["name"],
+        update_columns=["bus_number", "device_id"],
+        commit=False,
+    )
     device.grainbin_count = len(grainbins)
 
     session.commit()
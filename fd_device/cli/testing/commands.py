@@ -10,7 +10,11 @@ import click
 import pytest
 from pyment import PyComment
 
+from fd_device.device.benchmark import run_benchmark
+from fd_device.device.heartbeat import UdpHeartbeatResponder
+from fd_device.device.simulate import run_simulation
 from fd_device.settings import get_config
+from fd_device.system.footprint import DAEMON_MODULES, footprint_report
 
 config = get_config()  # pylint: disable=invalid-name
 HERE = config.APP_DIR
@@ -233,3 +237,135 @@ def docstring(filename, write, verbose):
             f"{files_without_changes} files without changes."
         )
     )
+
+
+@click.command()
+@click.option(
+    "-r",
+    "--rates",
+    default="10,100,1000",
+    help="Comma separated publish rates (messages per second) to run.",
+)
+@click.option(
+    "-d",
+    "--duration",
+    default=5.0,
+    help="How long to run each rate for in seconds.",
+)
+@click.option(
+    "--confirm-delay",
+    default=0.0,
+    help="Simulated broker confirm delay in seconds.",
+)
+def benchmark(rates, duration, confirm_delay):
+    """Benchmark heartbeat messaging against an in-process broker."""
+
+    rate_list = [float(rate) for rate in rates.split(",")]
+    click.echo(
+        f"{'rate':>8} {'sent':>7} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'cpu us/msg':>10} {'peak kB':>9} {'rss kB':>8}"
+    )
+    for result in run_benchmark(rate_list, duration, confirm_delay):
+        click.echo(
+            f"{result['rate']:>8.0f} {result['sent']:>7} "
+            f"{result['messages_per_second']:>9.1f} "
+            f"{result['confirm_p50_ms']:>8.3f} {result['confirm_p99_ms']:>8.3f} "
+            f"{result['cpu_us_per_message']:>10.1f} "
+            f"{result['peak_memory_kb']:>9.1f} {result['max_rss_kb']:>8}"
+        )
+
+
+@click.command()
+@click.argument("modules", nargs=-1)
+def footprint(modules):
+    """Report the import time and resident memory of the daemon modules."""
+
+    click.echo(
+        f"{'module':<28} {'import ms':>9} {'modules':>7} {'rss kB':>8} "
+        f"{'added kB':>8}  heavy"
+    )
+    for result in footprint_report(modules or DAEMON_MODULES):
+        click.echo(
+            f"{result['module']:<28} {result['seconds'] * 1000:>9.1f} "
+            f"{result['modules']:>7} {result['rss_kb']:>8} "
+            f"{result['rss_kb'] - result['baseline_rss_kb']:>8}  "
+            f"{', '.join(result['heavy']) or '-'}"
+        )
+
+
+@click.command()
+@click.option("-n", "--devices", default=10, help="The number of virtual devices.")
+@click.option("-d", "--duration", default=60.0, help="How long to run for in seconds.")
+@click.option(
+    "--heartbeat-interval",
+    default=config.HEARTBEAT_INTERVAL,
+    type=float,
+    help="Seconds between the heartbeats of each device.",
+)
+@click.option(
+    "--sweep-interval",
+    default=config.SWEEP_INTERVAL,
+    type=float,
+    help="Seconds between the grainbin sweeps of each device.",
+)
+@click.option("--grainbins", default=4, help="The number of grainbins per device.")
+@click.option("--sensors", default=8, help="The number of sensors per grainbin.")
+@click.option(
+    "--host",
+    default=None,
+    help="The RabbitMQ server to connect to. Defaults to an in-process broker.",
+)
+# pylint: disable=too-many-arguments
+def simulate(
+    devices, duration, heartbeat_interval, sweep_interval, grainbins, sensors, host
+):
+    """Run a fleet of virtual devices in one process and report their publish rates."""
+
+    results = run_simulation(
+        devices,
+        duration,
+        heartbeat_interval=heartbeat_interval,
+        sweep_interval=sweep_interval,
+        grainbins=grainbins,
+        sensors=sensors,
+        host=host,
+    )
+    click.echo(
+        f"{'device':>10} {'state':>13} {'beats':>7} {'replies':>7} "
+        f"{'updates':>7} {'outbox':>6} {'msg/s':>8}"
+    )
+    for result in results["devices"]:
+        click.echo(
+            f"{result['device_id']:>10} {result['state']:>13} "
+            f"{result['heartbeats']:>7} {result['replies']:>7} "
+            f"{result['updates']:>7} {result['outbox']:>6} "
+            f"{result['messages_per_second']:>8.2f}"
+        )
+    total = results["total"]
+    click.echo(
+        f"{devices} devices ({total['connected']} connected) in {total['elapsed']:.1f}s: "
+        f"{total['heartbeats']} heartbeats, {total['replies']} replies, "
+        f"{total['updates']} updates, {total['messages_per_second']:.1f} msg/s"
+    )
+
+
+@click.command()
+@click.option("--host", default="0.0.0.0", help="The address to listen on.")
+@click.option(
+    "-p",
+    "--port",
+    default=config.UDP_HEARTBEAT_PORT,
+    help="The UDP port to listen on.",
+)
+def heartbeat_responder(host, port):
+    """Answer UDP heartbeats like the server does, for local testing."""
+
+    responder = UdpHeartbeatResponder(host, port)
+    click.echo(f"Answering UDP heartbeats on {host}:{port}, press Ctrl-C to stop")
+    try:
+        responder.run()
+    except KeyboardInterrupt:
+        responder.stop()
+    click.echo(
+        f"Answered {responder.received} heartbeats from {len(responder.devices)} devices"
+    )
@@ -0,0 +1,229 @@
+"""A ranked list of the known RabbitMQ brokers, for failing over between them."""
+import datetime as dt
+import logging
+import math
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from sqlalchemy.orm.session import Session
+
+from fd_device.database.device import BrokerAddress
+
+LOGGER = logging.getLogger("fd.controller.brokers")
+
+
+def probe_latency(
+    address: str, port: int = 5672, timeout: float = 2.0
+) -> Optional[float]:
+    """Measure how long a TCP connection to a broker takes to open.
+
+    Args:
+        address (str): The address of the broker.
+        port (int, optional): The AMQP port. Defaults to 5672.
+        timeout (float, optional): Give up after this many seconds. Defaults to 2.0.
+
+    Returns:
+        Optional[float]: The connect latency in seconds, or None if the broker could not be reached.
+    """
+    start = time.monotonic()
+    try:
+        with socket.create_connection((address, port), timeout=timeout):
+            return time.monotonic() - start
+    except OSError:
+        return None
+
+
+class BrokerStats:  # pylint: disable=too-few-public-methods
+    """The measured latency and recent results of one broker."""
+
+    def __init__(self, address, latency=None, failures=0, last_success=None):
+        """Create the BrokerStats object.
+
+        :param address: The address of the broker.
+        :param latency: The last measured connect latency in seconds.
+        :param failures: The number of failed connects since the last success.
+        :param last_success: When the last connect succeeded.
+        """
+        self.address = address
+        self.latency = latency
+        self.failures = failures
+        self.last_success = last_success
+
+    def rank(self):
+        """Sort key: brokers that work, then the fastest, then the most recently used."""
+        latency = math.inf if self.latency is None else self.latency
+        last_success = self.last_success.timestamp() if self.last_success else 0
+        return (self.failures, latency, -last_success)
+
+
+class BrokerList:
+    """Rank the known brokers by recent success and connect latency.
+
+    The connection uses best() to pick a broker, and records the result of
+    every connect. A broker that fails drops behind the others, so the next
+    reconnect goes to the next broker in the list. rerank() measures the
+    latency of every broker; it runs on a worker thread every rerank_interval
+    seconds once started, and saves the list to the database.
+    """
+
+    def __init__(self, port=5672, rerank_interval=300, probe_timeout=2.0):
+        """Create an empty BrokerList.
+
+        :param port: The AMQP port the latency is measured on.
+        :param rerank_interval: Seconds between background reranks.
+        :param probe_timeout: Seconds to wait for a broker to accept a TCP connection.
+        """
+        self.port = port
+        self.rerank_interval = rerank_interval
+        self.probe_timeout = probe_timeout
+
+        self._lock = threading.Lock()
+        self._brokers = {}
+        self._ioloop = None
+        self._timer = None
+        self._get_session = None
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="fd-brokers"
+        )
+
+    def __len__(self):
+        """Return the number of known brokers."""
+        return len(self._brokers)
+
+    def add(self, address, latency=None):
+        """Add a broker to the list, if it is not known yet."""
+        if not address:
+            return
+        with self._lock:
+            if address not in self._brokers:
+                self._brokers[address] = BrokerStats(address, latency)
+
+    def ranked(self) -> List[str]:
+        """Return the addresses of the brokers, best first."""
+        with self._lock:
+            return [
+                stats.address
+                for stats in sorted(self._brokers.values(), key=BrokerStats.rank)
+            ]
+
+    def best(self) -> Optional[str]:
+        """Return the address of the best broker, or None if there are none."""
+        ranked = self.ranked()
+        return ranked[0] if ranked else None
+
+    def stats(self, address) -> BrokerStats:
+        """Return the stats of a broker."""
+        with self._lock:
+            return self._brokers[address]
+
+    def record_success(self, address, latency=None):
+        """Record that a connect to a broker succeeded, and how long it took."""
+        if not address:
+            return
+        self.add(address)
+        with self._lock:
+            stats = self._brokers[address]
+            stats.failures = 0
+            stats.last_success = dt.datetime.now()
+            if latency is not None:
+                stats.latency = latency
+
+    def record_failure(self, address) -> Optional[str]:
+        """Record that a connect to a broker failed.
+
+        :return: The address of the broker to try next.
+        """
+        if not address:
+            return self.best()
+        self.add(address)
+        with self._lock:
+            self._brokers[address].failures += 1
+        next_address = self.best()
+        if next_address != address:
+            LOGGER.info(f"Failing over from broker {address} to {next_address}")
+        return next_address
+
+    def rerank(self):
+        """Measure the connect latency of every broker. This blocks, so use a worker thread."""
+        with self._lock:
+            addresses = list(self._brokers)
+        for address in addresses:
+            latency = probe_latency(address, self.port, self.probe_timeout)
+            with self._lock:
+                stats = self._brokers[address]
+                if latency is None:
+                    stats.failures += 1
+                else:
+                    stats.latency = latency
+                    stats.failures = 0
+        LOGGER.debug(f"Brokers ranked {self.ranked()}")
+
+    def load(self, session: Session):
+        """Add the brokers saved in the database."""
+        with self._lock:
+            for row in session.query(BrokerAddress).all():
+                self._brokers[row.address] = BrokerStats(
+                    row.address, row.latency, row.failures or 0, row.last_success
+                )
+
+    def save(self, session: Session):
+        """Save the brokers and their stats to the database."""
+        rows = {row.address: row for row in session.query(BrokerAddress).all()}
+        with self._lock:
+            brokers = list(self._brokers.values())
+        for stats in brokers:
+            row = rows.get(stats.address) or BrokerAddress(stats.address)
+            row.latency = stats.latency
+            row.failures = stats.failures
+            row.last_success = stats.last_success
+            session.add(row)
+        session.commit()
+
+    def start(self, ioloop, get_session):
+        """Rerank and save the list every rerank_interval seconds on the ioloop.
+
+        :param ioloop: The IOLoop used to schedule the reranks.
+        :param get_session: Returns a new database session for the worker thread.
+        """
+        if self._timer is not None:
+            self._ioloop.remove_timeout(self._timer)
+        self._ioloop = ioloop
+        self._get_session = get_session
+        self._stopping = False
+        self._timer = self._ioloop.call_later(self.rerank_interval, self._rerank_later)
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on the worker thread, for work that probes the brokers.
+
+        :return: The Future of the call.
+        """
+        return self._executor.submit(fn, *args)
+
+    def stop(self):
+        """Stop reranking."""
+        self._stopping = True
+        self._executor.shutdown(wait=False)
+
+    def _rerank_later(self):
+        """Submit a rerank to the worker thread and schedule the next one."""
+        self._timer = None
+        if self._stopping:
+            return
+        self._executor.submit(self._rerank_and_save)
+        self._timer = self._ioloop.call_later(self.rerank_interval, self._rerank_later)
+
+    def _rerank_and_save(self):
+        """Rerank, then save the list. This runs on the worker thread."""
+        try:
+            self.rerank()
+            session = self._get_session()
+            try:
+                self.save(session)
+            finally:
+                session.close()
+        except Exception:  # noqa: B902  pylint: disable=broad-except
+            LOGGER.exception("Error reranking the brokers")
@@ -0,0 +1,64 @@
+"""Manage a separate RabbitMQ channel for each kind of traffic."""
+import functools
+
+
+class ChannelManager:
+    """Open and track one channel per traffic lane.
+
+    Each lane (eg. heartbeats, alarms and bulk data) gets its own channel, so
+    a large publish on one lane does not hold up the frames of another, and
+    each lane can have its own publisher confirm mode.
+    """
+
+    def __init__(self, connection, logger, lanes, on_channels_open):
+        """Create the ChannelManager object.
+
+        :param connection: The open pika connection.
+        :param logger: The logger to use.
+        :param dict lanes: Lane name to whether publisher confirms are used on it.
+        :param on_channels_open: Called with no arguments once every lane is open.
+        """
+        self.LOGGER = logger
+        self.lanes = dict(lanes)
+
+        self._connection = connection
+        self._on_channels_open = on_channels_open
+        self._on_channel_closed = None
+        self._channels = {}
+
+    def open(self, on_channel_closed=None):
+        """Open a channel for every lane.
+
+        :param on_channel_closed: Called as on_channel_closed(channel, reason) if a lane channel closes.
+        """
+        self._on_channel_closed = on_channel_closed
+        for lane in self.lanes:
+            self.LOGGER.debug(f"Creating a new channel for {lane}")
+            self._connection.channel(
+                on_open_callback=functools.partial(self.on_channel_open, lane)
+            )
+
+    def on_channel_open(self, lane, channel):
+        """Invoked by pika when a lane's channel has been opened."""
+        self.LOGGER.debug(f"Channel {channel.channel_number} opened for {lane}")
+        self._channels[lane] = channel
+        if self._on_channel_closed:
+            channel.add_on_close_callback(self._on_channel_closed)
+        if len(self._channels) == len(self.lanes):
+            self._on_channels_open()
+
+    def get(self, lane):
+        """Return the channel for a lane."""
+        return self._channels[lane]
+
+    def confirm(self, lane) -> bool:
+        """Return True if publisher confirms should be used on a lane."""
+        return self.lanes[lane]
+
+    def close(self):
+        """Close the channel of every lane."""
+        for lane, channel in self._channels.items():
+            if channel.is_open:
+                self.LOGGER.debug(f"Closing the {lane} channel")
+                channel.close()
+        self._channels = {}
@@ -1,6 +1,12 @@
 """Connect to and receive messages from rabbitmq."""
+import collections
+import functools
+import json
+
 import pika
 
+from fd_device.controller.brokers import probe_latency
+from fd_device.controller.flow import FlowControl
 from fd_device.settings import get_config
 
 
@@ -24,13 +30,21 @@ class Connection:  # pylint: disable=too-many-instance-attributes
         self._password = config.RABBITMQ_PASSWORD
         # self._host = host - this is set in the overwritten function
         self._port = 5672
+        # if set, a BrokerList the connection fails over through
+        self.brokers = None
+        self._probe_timeout = config.BROKER_PROBE_TIMEOUT
         self._virtual_host = config.RABBITMQ_VHOST
+        self._blocked_connection_timeout = config.RABBITMQ_BLOCKED_TIMEOUT
+
+        # signal for publishers and producers when the broker blocks the connection
+        self.flow_control = FlowControl(resume_seconds=config.FLOW_RESUME_SECONDS)
 
     def connect(self):
         """This method connects to RabbitMQ, returning the connection handle.
 
         When the connection is established, the on_connection_open method
-        will be invoked by pika.
+        will be invoked by pika. The connection.blocked and connection.unblocked
+        callbacks are registered on the new connection.
 
         :rtype: pika.SelectConnection
 
@@ -42,13 +56,40 @@ class Connection:  # pylint: disable=too-many-instance-attributes
             port=self._port,
             virtual_host=self._virtual_host,
             credentials=creds,
+            blocked_connection_timeout=self._blocked_connection_timeout,
         )
-        return pika.SelectConnection(
+        connection = pika.SelectConnection(
             parameters=params,
             on_open_callback=self.on_connection_open,
             on_open_error_callback=self.on_connection_open_error,
             on_close_callback=self.on_connection_closed,
         )
+        self.add_on_connection_blocked_callbacks(connection)
+        return connection
+
+    def add_on_connection_blocked_callbacks(self, connection):
+        """Tell pika to call on_connection_blocked and on_connection_unblocked for this connection."""
+        connection.add_on_connection_blocked_callback(self.on_connection_blocked)
+        connection.add_on_connection_unblocked_callback(self.on_connection_unblocked)
+
+    def on_connection_blocked(self, _unused_connection, method_frame):
+        """Invoked by pika when RabbitMQ sends connection.blocked (eg. a memory or disk alarm).
+
+        :param pika.SelectConnection _unused_connection: The connection
+        :param pika.frame.Method method_frame: The Connection.Blocked frame
+        """
+        reason = method_frame.method.reason
+        self.LOGGER.warning(f"Connection blocked by RabbitMQ: {reason}")
+        self.flow_control.block(reason)
+
+    def on_connection_unblocked(self, _unused_connection, _method_frame):
+        """Invoked by pika when RabbitMQ sends connection.unblocked.
+
+        :param pika.SelectConnection _unused_connection: The connection
+        :param pika.frame.Method _method_frame: The Connection.Unblocked frame
+        """
+        self.LOGGER.info("Connection unblocked by RabbitMQ")
+        self.flow_control.unblock()
 
     def on_connection_open(self, _unused_connection):
         """This method is called by pika once the connection to RabbitMQ has been established.
@@ -60,6 +101,9 @@ class Connection:  # pylint: disable=too-many-instance-attributes
 
         """
         self.LOGGER.debug("Connection opened")
+        if self.brokers is not None:
+            self.brokers.record_success(self._host)
+        self.flow_control.reset()
         self.open_channel()
 
     def on_connection_open_error(self, _unused_connection, err):
@@ -69,7 +113,7 @@ class Connection:  # pylint: disable=too-many-instance-attributes
         :param Exception err: The error
         """
         self.LOGGER.error("Connection open failed: %s", err)
-        self.reconnect()
+        self.failover()
 
     def on_connection_closed(self, _unused_connection, reason):
         """This method is invoked by pika when the connection to RabbitMQ is closed unexpectedly.
@@ -85,7 +129,63 @@ class Connection:  # pylint: disable=too-many-instance-attributes
             self._connection.ioloop.stop()
         else:
             self.LOGGER.warning("Connection closed, reopening in 5 seconds: %s", reason)
-            self._connection.ioloop.call_later(5, self.reconnect)
+            self.failover(delay=5)
+
+    def failover(self, delay=0):
+        """Move to the next broker of the BrokerList (if any), then reconnect after delay seconds.
+
+        Finding the next broker probes the brokers, which blocks, so it runs
+        on the BrokerList worker thread. The chosen broker is applied and the
+        reconnect made on the IOLoop.
+
+        :param delay: Seconds to wait before reconnecting.
+        """
+        ioloop = self._connection.ioloop
+        if self.brokers is None:
+            self._use_broker(None, delay)
+            return
+        try:
+            self.brokers.submit(self._failover_on_worker, ioloop, self._host, delay)
+        except RuntimeError:
+            # the BrokerList was stopped, reconnect to the same broker
+            self._use_broker(None, delay)
+
+    def next_broker(self, failed):
+        """Record that the failed broker failed, and return the next reachable broker.
+
+        Brokers that do not accept a TCP connection within the probe timeout
+        are skipped, rather than waiting for their AMQP handshake to time out.
+        This blocks, so call it from a worker thread.
+
+        :param failed: The address of the broker that failed.
+        :return: The address of the broker to use, or None if there are no brokers.
+        """
+        host = self.brokers.record_failure(failed)
+        for _ in range(len(self.brokers) - 1):
+            if host is None:
+                break
+            if probe_latency(host, self._port, self._probe_timeout) is not None:
+                break
+            self.LOGGER.info(f"Broker {host} is not reachable, skipping it")
+            host = self.brokers.record_failure(host)
+        return host
+
+    def _failover_on_worker(self, ioloop, failed, delay):
+        """Find the next broker, and hand it to the IOLoop. This runs on the BrokerList worker thread."""
+        host = None
+        try:
+            host = self.next_broker(failed)
+        except Exception:  # noqa: B902  pylint: disable=broad-except
+            self.LOGGER.exception("Error finding the next broker")
+        ioloop.add_callback_threadsafe(functools.partial(self._use_broker, host, delay))
+
+    def _use_broker(self, host, delay):
+        """Use the broker (if any) and reconnect after delay seconds."""
+        self._host = host or self._host
+        if delay:
+            self._connection.ioloop.call_later(delay, self.reconnect)
+        else:
+            self.reconnect()
 
     def reconnect(self):
         """Will be invoked by the IOLoop timer if the connection is closed.
@@ -181,19 +281,33 @@ class Connection:  # pylint: disable=too-many-instance-attributes
 class Message:
     """Receive messages from RabbitMQ."""
 
-    def __init__(self, channel):
-        """Instantiate a Message instance."""
+    def __init__(
+        self, channel, flow_control=None, rate_limiter=None, traffic_class=None
+    ):
+        """Instantiate a Message instance.
+
+        :param channel: The channel to use.
+        :param FlowControl flow_control: Publishing is held back while it is blocked.
+        :param RateLimiter rate_limiter: Publishing is deferred when it is over the limit.
+        :param str traffic_class: The bucket of the rate_limiter used by this class.
+        """
 
         self.LOGGER = None
 
         self._channel = channel
+        self._flow_control = flow_control
+        self._rate_limiter = rate_limiter
+        self.traffic_class = traffic_class
         self._stopping = False
         self._consumer_tag = None
 
         self.exchange_name = None
         self.exchange_type = None
         self.routing_key = None
+        # set routing_keys to bind the queue with more than one routing key
+        self.routing_keys = []
         self.queue_name = None
+        self._pending_binds = 0
 
         # self.setup_exchange(self.exchange_name) must be called from the
         # class that inherits from this class.
@@ -202,6 +316,35 @@ class Message:
         """Set the _stopping state."""
         self._stopping = state
 
+    def can_publish(self):
+        """Return True unless the broker has blocked the connection."""
+        return not (self._flow_control and self._flow_control.blocked)
+
+    def publish(self, body, properties, routing_key=None, exchange=None):
+        """Publish a message if the connection is not blocked and the rate limit allows it.
+
+        :param str body: The message body
+        :param pika.BasicProperties properties: The message properties
+        :param str routing_key: Defaults to self.routing_key
+        :param str exchange: Defaults to self.exchange_name
+        :return: True if the message was published, False if it was held back.
+        """
+        if not self.can_publish():
+            return False
+
+        if self._rate_limiter is not None and not self._rate_limiter.try_acquire(
+            self.traffic_class
+        ):
+            return False
+
+        self._channel.basic_publish(
+            exchange=self.exchange_name if exchange is None else exchange,
+            routing_key=self.routing_key if routing_key is None else routing_key,
+            body=body,
+            properties=properties,
+        )
+        return True
+
     def setup_exchange(self, exchange_name):
         """Setup the exchange on RabbitMQ by invoking the Exchange.Declare RPC command.
 
@@ -240,25 +383,39 @@ class Message:
         """Method invoked by pika when the Queue.Declare RPC call made in setup_queue has completed.
 
         In this method we will bind the queue
-        and exchange together with the routing key by issuing the Queue.Bind
-        RPC command. When this command is complete, the on_bindok method will
-        be invoked by pika.
+        and exchange together with the routing key(s) by issuing the Queue.Bind
+        RPC command. When every bind is complete, the on_bindok method will
+        be invoked.
 
         :param pika.frame.Method method_frame: The Queue.DeclareOk frame
         """
         self.queue_name = method_frame.method.queue
-        self.LOGGER.info(
-            "Binding %s to %s with %s",
-            self.exchange_name,
-            self.queue_name,
-            self.routing_key,
-        )
-        self._channel.queue_bind(
-            callback=self.on_bindok,
-            queue=self.queue_name,
-            exchange=self.exchange_name,
-            routing_key=self.routing_key,
-        )
+        routing_keys = self.routing_keys or [self.routing_key]
+        self._pending_binds = len(routing_keys)
+        for routing_key in routing_keys:
+            self.LOGGER.info(
+                "Binding %s to %s with %s",
+                self.exchange_name,
+                self.queue_name,
+                routing_key,
+            )
+            self._channel.queue_bind(
+                callback=self.on_queue_bindok,
+                queue=self.queue_name,
+                exchange=self.exchange_name,
+                routing_key=routing_key,
+            )
+
+    def on_queue_bindok(self, frame):
+        """Invoked by pika when a Queue.Bind method has completed.
+
+        Once all routing keys are bound, on_bindok is called.
+
+        :param pika.frame.Method frame: The Queue.BindOk response frame
+        """
+        self._pending_binds -= 1
+        if self._pending_binds == 0:
+            self.on_bindok(frame)
 
     def on_bindok(self, unused_frame):
         """Invoked by pika when the Queue.Bind method has completed.
@@ -352,3 +509,226 @@ class Message:
         :param pika.frame.Method unused_frame: The Basic.CancelOk frame
         """
         self.LOGGER.debug("RabbitMQ acknowledged the cancellation of the consumer")
+
+
+class Publisher(Message):  # pylint: disable=too-many-instance-attributes
+    """Publish messages to an exchange, usually on a lane of its own.
+
+    Messages sent before the exchange is ready, while the broker has
+    blocked the connection or while the rate limit is used up, are kept in a
+    bounded outbox and published once publishing is possible again. If a durable queue_name is given it is
+    declared and bound so the messages are kept for the server, and if
+    max_priority is also given it is declared as a RabbitMQ priority queue,
+    so urgent messages (sent with a higher priority) are delivered first.
+    """
+
+    FLUSH_BATCH = 50
+    FLUSH_INTERVAL = 0.1
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        connection,
+        channel,
+        logger,
+        exchange_name,
+        routing_key,
+        app_id=None,
+        confirm=True,
+        queue_name=None,
+        queue_binding=None,
+        max_priority=None,
+        flow_control=None,
+        rate_limiter=None,
+        traffic_class=None,
+        max_outbox=1000,
+    ):
+        """Create the Publisher object and declare its exchange.
+
+        :param str queue_binding: The binding key for queue_name. Defaults to routing_key.
+        """
+        super().__init__(channel, flow_control, rate_limiter, traffic_class)
+
+        self.LOGGER = logger
+
+        self.exchange_name = exchange_name
+        self.exchange_type = "topic"
+        self.routing_key = routing_key
+        if queue_binding:
+            self.routing_keys = [queue_binding]
+        self.app_id = app_id
+        self.confirm = confirm
+        self.durable_queue = queue_name
+        self.max_priority = max_priority
+
+        self._connection = connection
+        self._ready = False
+        self._flushing = False
+        self._outbox = collections.deque(maxlen=max_outbox)
+        self._deliveries = set()
+        self._publish_number = 0
+        self.acked = 0
+        self.nacked = 0
+        self.dropped = 0
+
+        if flow_control is not None:
+            flow_control.add_listener(self.on_flow_control)
+
+        self.setup_exchange(self.exchange_name)
+
+    @property
+    def outbox_depth(self) -> int:
+        """Return the number of messages waiting to be published."""
+        return len(self._outbox)
+
+    @property
+    def pending_confirms(self) -> int:
+        """Return the number of published messages not yet confirmed."""
+        return len(self._deliveries)
+
+    def setup_queue(self):
+        """Declare the durable queue if there is one, otherwise the publisher is ready."""
+        if not self.durable_queue:
+            self.on_ready()
+            return
+
+        arguments = {}
+        if self.max_priority:
+            arguments["x-max-priority"] = self.max_priority
+        self.LOGGER.debug(f"Declaring queue {self.durable_queue}")
+        self._channel.queue_declare(
+            queue=self.durable_queue,
+            durable=True,
+            arguments=arguments,
+            callback=self.on_queue_declareok,
+        )
+
+    def on_bindok(self, unused_frame):
+        """Overwrite from the Message class. Publishers do not consume."""
+        self.LOGGER.debug("Queue bound")
+        self.on_ready()
+
+    def on_ready(self):
+        """Enable publisher confirms if required and publish anything in the outbox."""
+        if self.confirm:
+            self._channel.confirm_delivery(self.on_delivery_confirmation)
+        self._ready = True
+        self.flush_outbox()
+
+    def on_delivery_confirmation(self, method_frame):
+        """Invoked by pika when RabbitMQ confirms a publish.
+
+        :param pika.frame.Method method_frame: Basic.Ack or Basic.Nack frame
+        """
+        confirmation_type = method_frame.method.NAME.split(".")[1].lower()
+        delivery_tag = method_frame.method.delivery_tag
+        # with multiple set, every publish up to delivery_tag is confirmed
+        if method_frame.method.multiple:
+            confirmed = {tag for tag in self._deliveries if tag <= delivery_tag}
+        else:
+            confirmed = {delivery_tag} & self._deliveries
+        self._deliveries -= confirmed
+
+        if confirmation_type == "ack":
+            self.acked += len(confirmed)
+        else:
+            self.nacked += len(confirmed)
+            self.LOGGER.warning(
+                f"{len(confirmed)} publishes up to {delivery_tag} were nacked by RabbitMQ"
+            )
+
+    def set_stopping(self, state):
+        """Overwrite the set_stopping method to stop listening for flow control."""
+        super().set_stopping(state)
+        if state and self._flow_control is not None:
+            self._flow_control.remove_listener(self.on_flow_control)
+
+    def on_flow_control(self, blocked):
+        """Start publishing the outbox again once the broker unblocks the connection."""
+        if not blocked:
+            self.flush_outbox()
+
+    def send(self, message, routing_key=None, priority=None):
+        """Publish a message, or keep it in the outbox if publishing is not possible.
+
+        This must be called on the IOLoop thread.
+
+        :param message: The message. It is serialized as JSON.
+        :param str routing_key: Defaults to self.routing_key.
+        :param int priority: The message priority, for priority queues.
+        :return: True if the message was published, False if it was kept in the outbox.
+        """
+        if self._stopping:
+            return False
+
+        entry = (
+            json.dumps(message, ensure_ascii=False, default=str),
+            routing_key,
+            priority,
+        )
+        if self._outbox or not self._publish(*entry):
+            if len(self._outbox) == self._outbox.maxlen:
+                self.dropped += 1
+                self.LOGGER.warning("Outbox is full, dropping the oldest message")
+            self._outbox.append(entry)
+            self._schedule_flush()
+            return False
+        return True
+
+    def _publish(self, body, routing_key, priority):
+        """Publish a serialized message if the publisher is ready and not blocked."""
+        if not self._ready or self._channel.is_closed:
+            return False
+
+        properties = pika.BasicProperties(
+            app_id=self.app_id,
+            content_type="application/json",
+            delivery_mode=2,
+            priority=priority,
+        )
+        if not self.publish(body, properties, routing_key=routing_key):
+            return False
+
+        if self.confirm:
+            self._publish_number += 1
+            self._deliveries.add(self._publish_number)
+        return True
+
+    def flush_outbox(self):
+        """Publish the outbox in batches, so publishing resumes gradually."""
+        if self._flushing:
+            return
+
+        batch = self.FLUSH_BATCH
+        if self._flow_control is not None:
+            batch = max(int(batch * self._flow_control.throttle()), 1)
+
+        while self._outbox and batch > 0:
+            if not self._publish(*self._outbox[0]):
+                break
+            self._outbox.popleft()
+            batch -= 1
+
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Flush the rest of the outbox later, once the rate limit allows it.
+
+        Nothing is scheduled while not ready or blocked, as on_ready and
+        on_flow_control flush the outbox then.
+        """
+        if self._flushing or not self._outbox or not self._ready:
+            return
+        if not self.can_publish() or self._channel.is_closed:
+            return
+
+        delay = self.FLUSH_INTERVAL
+        if self._rate_limiter is not None:
+            delay = max(delay, self._rate_limiter.delay(self.traffic_class))
+        self._flushing = True
+        self._connection.ioloop.call_later(delay, self._flush_later)
+
+    def _flush_later(self):
+        """Continue flushing the outbox from an IOLoop timer."""
+        self._flushing = False
+        self.flush_outbox()
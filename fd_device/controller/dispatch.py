@@ -0,0 +1,163 @@
+"""Dispatch server commands to a bounded pool of worker threads."""
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CommandMetrics:
+    """Track queue depth and latency for each command."""
+
+    def __init__(self):
+        """Create the CommandMetrics object."""
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def _get(self, command):
+        """Return the stats dictionary for a command, creating it if needed."""
+        if command not in self._commands:
+            self._commands[command] = {
+                "queued": 0,
+                "running": 0,
+                "handled": 0,
+                "errors": 0,
+                "wait_total": 0.0,
+                "latency_total": 0.0,
+                "latency_max": 0.0,
+            }
+        return self._commands[command]
+
+    def queued(self, command):
+        """Record that a command has been queued for a worker."""
+        with self._lock:
+            self._get(command)["queued"] += 1
+
+    def started(self, command, wait):
+        """Record that a worker has picked up a command after waiting `wait` seconds."""
+        with self._lock:
+            stats = self._get(command)
+            stats["queued"] -= 1
+            stats["running"] += 1
+            stats["wait_total"] += wait
+
+    def finished(self, command, latency, error=False):
+        """Record that a worker has finished a command after `latency` seconds."""
+        with self._lock:
+            stats = self._get(command)
+            stats["running"] -= 1
+            stats["handled"] += 1
+            if error:
+                stats["errors"] += 1
+            stats["latency_total"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+
+    def queue_depth(self, command=None):
+        """Return the number of queued commands, for one command or all of them."""
+        with self._lock:
+            if command is not None:
+                return self._commands.get(command, {}).get("queued", 0)
+            return sum(stats["queued"] for stats in self._commands.values())
+
+    def snapshot(self) -> dict:
+        """Return a copy of the metrics for every command.
+
+        Returns:
+            dict: Keyed by command. Each value has the counters plus the
+                  average wait and latency in seconds.
+        """
+        with self._lock:
+            result = {}
+            for command, stats in self._commands.items():
+                info = dict(stats)
+                handled = stats["handled"]
+                info["latency_avg"] = (
+                    stats["latency_total"] / handled if handled else 0.0
+                )
+                info["wait_avg"] = stats["wait_total"] / handled if handled else 0.0
+                result[command] = info
+            return result
+
+
+class CommandDispatcher:
+    """Run command handlers away from the pika IOLoop.
+
+    Handlers are run on a bounded pool of worker threads. When a handler is
+    done, the completion callback is marshalled back onto the IOLoop thread
+    with `add_callback_threadsafe`, as pika objects are not thread safe.
+    """
+
+    def __init__(self, connection, logger, max_workers=2):
+        """Create the CommandDispatcher object.
+
+        :param connection: The pika connection whose IOLoop receives completions.
+        :param logger: The logger to use.
+        :param max_workers: The maximum number of worker threads.
+        """
+        self.LOGGER = logger
+        self.metrics = CommandMetrics()
+
+        self._connection = connection
+        self._handlers = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="fd-command"
+        )
+
+    def register(self, command, handler):
+        """Register a handler for a command.
+
+        The handler is called as `handler(payload, properties)` on a worker
+        thread and returns the reply to send back, or None for no reply.
+        """
+        self._handlers[command] = handler
+
+    def dispatch(self, command, payload, properties, on_complete):
+        """Queue a command to be handled by a worker.
+
+        `on_complete(reply)` is invoked on the IOLoop thread once the handler
+        has finished. Unknown commands complete straight away with no reply.
+
+        :return: True if the command was queued, otherwise False.
+        """
+        handler = self._handlers.get(command)
+        if handler is None:
+            self.LOGGER.warning(f"No handler for command {command}")
+            on_complete(None)
+            return False
+
+        self.metrics.queued(command)
+        self._executor.submit(
+            self._run,
+            command,
+            handler,
+            payload,
+            properties,
+            time.monotonic(),
+            on_complete,
+        )
+        return True
+
+    # pylint: disable=too-many-arguments
+    def _run(self, command, handler, payload, properties, queued_at, on_complete):
+        """Run a handler on a worker thread and send the result to the IOLoop."""
+        start = time.monotonic()
+        self.metrics.started(command, start - queued_at)
+
+        reply = None
+        error = False
+        try:
+            reply = handler(payload, properties)
+        except Exception:  # noqa: B902  pylint: disable=broad-except
+            error = True
+            self.LOGGER.exception(f"Error handling {command} command")
+
+        latency = time.monotonic() - start
+        self.metrics.finished(command, latency, error=error)
+        self.LOGGER.debug(f"{command} command handled in {latency:.3f} seconds")
+
+        self._connection.ioloop.add_callback_threadsafe(
+            functools.partial(on_complete, reply)
+        )
+
+    def shutdown(self, wait=True):
+        """Stop accepting commands and shut down the worker threads."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,94 @@
+"""Flow control signal for when the broker blocks the connection."""
+import threading
+import time
+
+
+class FlowControl:
+    """Track the connection.blocked and connection.unblocked notifications from RabbitMQ.
+
+    While blocked, publishers should hold back and producers (sweeps, outboxes)
+    should stop growing their buffers. After the broker unblocks, throttle()
+    ramps from 0 back up to 1 over resume_seconds so that throughput resumes
+    smoothly instead of in one burst.
+    """
+
+    def __init__(self, resume_seconds=10):
+        """Create the FlowControl object.
+
+        :param resume_seconds: Seconds to ramp back up to full throughput after an unblock.
+        """
+        self.resume_seconds = resume_seconds
+        self.reason = None
+        self.blocked_count = 0
+        self.blocked_seconds = 0.0
+
+        self._lock = threading.Lock()
+        self._unblocked = threading.Event()
+        self._unblocked.set()
+        self._blocked_at = None
+        self._unblocked_at = None
+        self._listeners = []
+
+    @property
+    def blocked(self) -> bool:
+        """Return True if the broker has blocked publishing."""
+        return not self._unblocked.is_set()
+
+    def add_listener(self, callback):
+        """Call callback(blocked) whenever the blocked state changes."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Stop calling callback, eg. for a publisher of a closed connection."""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def block(self, reason=None):
+        """Mark the connection as blocked."""
+        with self._lock:
+            if self.blocked:
+                return
+            self.reason = reason
+            self.blocked_count += 1
+            self._blocked_at = time.monotonic()
+            self._unblocked.clear()
+        for callback in self._listeners:
+            callback(True)
+
+    def unblock(self):
+        """Mark the connection as unblocked."""
+        with self._lock:
+            if not self.blocked:
+                return
+            self._unblocked_at = time.monotonic()
+            self.blocked_seconds += self._unblocked_at - self._blocked_at
+            self.reason = None
+            self._unblocked.set()
+        for callback in self._listeners:
+            callback(False)
+
+    def reset(self):
+        """Clear the blocked state without a resume ramp, eg. for a new connection."""
+        self.unblock()
+        self._unblocked_at = None
+
+    def wait(self, timeout=None) -> bool:
+        """Wait until the connection is unblocked.
+
+        This is for producers on worker threads. Never call it on the IOLoop thread.
+
+        :return: True if unblocked, False if the timeout expired first.
+        """
+        return self._unblocked.wait(timeout)
+
+    def throttle(self) -> float:
+        """Return the fraction of full throughput that producers should use.
+
+        0.0 while blocked, ramping linearly to 1.0 over resume_seconds after an unblock.
+        """
+        if self.blocked:
+            return 0.0
+        if self._unblocked_at is None or not self.resume_seconds:
+            return 1.0
+        elapsed = time.monotonic() - self._unblocked_at
+        return min(elapsed / self.resume_seconds, 1.0)
@@ -0,0 +1,572 @@
+"""An in-process stand-in for RabbitMQ.
+
+The LocalBroker, LocalConnection and LocalChannel classes implement the parts
+of the pika SelectConnection API used by the Connection and Message classes:
+exchanges, queues, bindings, consumers, acks, basic_qos, publisher confirms,
+reply queues and connection.blocked flow control. Callbacks receive real pika frames and properties, so the
+messaging classes can be exercised in tests and benchmarks without a server.
+
+All connections to one LocalBroker must run their IOLoops on the same thread.
+"""
+import collections
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+from pika import frame, spec
+from pika.exceptions import (
+    ChannelClosedByBroker,
+    ChannelClosedByClient,
+    ConnectionClosedByClient,
+)
+
+
+class LocalIOLoop:
+    """A minimal IOLoop with timers and thread safe callbacks."""
+
+    def __init__(self):
+        """Create the LocalIOLoop object."""
+        self._timers = []
+        self._counter = itertools.count()
+        self._cancelled = set()
+        self._ready = collections.deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+
+    def call_later(self, delay, callback):
+        """Call the callback after delay seconds. Returns a handle for remove_timeout."""
+        handle = next(self._counter)
+        with self._condition:
+            heapq.heappush(self._timers, (time.monotonic() + delay, handle, callback))
+            self._condition.notify()
+        return handle
+
+    def remove_timeout(self, handle):
+        """Cancel a callback scheduled with call_later."""
+        self._cancelled.add(handle)
+
+    def add_callback(self, callback):
+        """Call the callback on the next iteration of the loop."""
+        self.add_callback_threadsafe(callback)
+
+    def add_callback_threadsafe(self, callback):
+        """Call the callback on the next iteration of the loop. Safe from any thread."""
+        with self._condition:
+            self._ready.append(callback)
+            self._condition.notify()
+
+    def _next_callbacks(self):
+        """Wait for and return the callbacks that are ready to run."""
+        with self._condition:
+            while not self._ready and not self._stopping:
+                now = time.monotonic()
+                if self._timers and self._timers[0][0] <= now:
+                    break
+                timeout = self._timers[0][0] - now if self._timers else None
+                self._condition.wait(timeout)
+
+            callbacks = list(self._ready)
+            self._ready.clear()
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, handle, callback = heapq.heappop(self._timers)
+                if handle in self._cancelled:
+                    self._cancelled.discard(handle)
+                else:
+                    callbacks.append(callback)
+            return callbacks
+
+    def start(self):
+        """Run the loop until stop is called."""
+        self._stopping = False
+        while not self._stopping:
+            callbacks = self._next_callbacks()
+            while callbacks:
+                callbacks.pop(0)()
+                if self._stopping:
+                    # keep the callbacks that did not run for the next start
+                    with self._condition:
+                        self._ready.extendleft(reversed(callbacks))
+                    break
+
+    def stop(self):
+        """Stop the loop after the current callback."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+    def run_for(self, seconds):
+        """Run the loop for a number of seconds."""
+        self.call_later(seconds, self.stop)
+        self.start()
+
+
+class _Queue:  # pylint: disable=too-few-public-methods
+    """A queue on the LocalBroker."""
+
+    def __init__(self, name, exclusive=False, auto_delete=False, arguments=None):
+        """Create the _Queue object."""
+        self.name = name
+        self.exclusive = exclusive
+        self.auto_delete = auto_delete
+        self.arguments = arguments or {}
+        self.messages = []
+        self.consumers = []
+        self.counter = itertools.count()
+
+    def push(self, message, requeue=False):
+        """Add a message, keeping higher priority messages first if this is a priority queue.
+
+        Requeued messages go ahead of the other messages with the same priority.
+        """
+        max_priority = self.arguments.get("x-max-priority")
+        priority = 0
+        if max_priority:
+            priority = min(message["properties"].priority or 0, max_priority)
+        order = -next(self.counter) if requeue else next(self.counter)
+        heapq.heappush(self.messages, (-priority, order, message))
+
+    def pop(self):
+        """Remove and return the next message."""
+        return heapq.heappop(self.messages)[2]
+
+
+class LocalBroker:
+    """Route messages between LocalChannels, like a RabbitMQ virtual host."""
+
+    def __init__(self, confirm_delay=0.0):
+        """Create the LocalBroker object.
+
+        :param confirm_delay: Seconds to wait before confirming a publish.
+        """
+        self.confirm_delay = confirm_delay
+        self.exchanges = {"": "direct"}
+        self.queues = {}
+        self.bindings = collections.defaultdict(list)
+        self.published = 0
+        self.blocked = False
+        self.connections = []
+        self._responders = []
+
+    def block(self, reason="low on memory"):
+        """Block publishing, like a RabbitMQ memory or disk alarm.
+
+        Connections are sent connection.blocked and their publishes are held
+        until unblock is called.
+        """
+        self.blocked = True
+        method = spec.Connection.Blocked(reason=reason)
+        for connection in self.connections:
+            connection.notify_blocked(method)
+
+    def unblock(self):
+        """Unblock publishing and release the held publishes."""
+        self.blocked = False
+        method = spec.Connection.Unblocked()
+        for connection in self.connections:
+            connection.notify_blocked(method)
+
+    def declare_exchange(self, name, exchange_type):
+        """Declare an exchange. Returns False if it exists with a different type."""
+        if self.exchanges.setdefault(name, exchange_type) != exchange_type:
+            return False
+        return True
+
+    def declare_queue(self, name, **kwargs):
+        """Declare a queue and return its name. An empty name creates a unique name."""
+        if not name:
+            name = "amq.gen-" + uuid.uuid4().hex
+        if name not in self.queues:
+            self.queues[name] = _Queue(name, **kwargs)
+        return name
+
+    def delete_queue(self, name):
+        """Delete a queue and its bindings."""
+        self.queues.pop(name, None)
+        for bindings in self.bindings.values():
+            bindings[:] = [item for item in bindings if item[0] != name]
+
+    def bind(self, queue, exchange, routing_key):
+        """Bind a queue to an exchange with a routing key."""
+        self.bindings[exchange].append((queue, routing_key))
+
+    def add_responder(self, exchange, routing_key, handler, exchange_type="direct"):
+        """Answer messages like a server would.
+
+        handler(properties, body) is called for every message routed through the
+        exchange with the routing key. If it returns a body and the message has
+        a reply_to, the body is published to the reply_to queue with the same
+        correlation_id.
+        """
+        self.declare_exchange(exchange, exchange_type)
+        self._responders.append((exchange, routing_key, handler))
+
+    def route(self, exchange, routing_key):
+        """Return the names of the queues that a message would be delivered to."""
+        if exchange == "":
+            return [routing_key] if routing_key in self.queues else []
+
+        exchange_type = self.exchanges[exchange]
+        names = []
+        for queue, binding_key in self.bindings[exchange]:
+            if exchange_type == "fanout":
+                matches = True
+            elif exchange_type == "topic":
+                matches = topic_matches(binding_key, routing_key)
+            else:
+                matches = binding_key == routing_key
+            if matches and queue not in names:
+                names.append(queue)
+        return names
+
+    def publish(self, exchange, routing_key, body, properties, ioloop):
+        """Deliver a message to the queues and responders it is routed to."""
+        self.published += 1
+        message = {
+            "exchange": exchange,
+            "routing_key": routing_key,
+            "body": body,
+            "properties": properties or spec.BasicProperties(),
+            "redelivered": False,
+        }
+        for name in self.route(exchange, routing_key):
+            self.queues[name].push(message)
+            self.deliver(name)
+
+        for responder_exchange, responder_key, handler in self._responders:
+            if responder_exchange != exchange:
+                continue
+            if topic_matches(responder_key, routing_key):
+                ioloop.add_callback(
+                    lambda handler=handler: self._respond(handler, message, ioloop)
+                )
+
+    def _respond(self, handler, message, ioloop):
+        """Call a responder and publish its reply."""
+        properties = message["properties"]
+        reply = handler(properties, message["body"])
+        if reply is not None and properties.reply_to:
+            self.publish(
+                "",
+                properties.reply_to,
+                reply,
+                spec.BasicProperties(correlation_id=properties.correlation_id),
+                ioloop,
+            )
+
+    def deliver(self, name):
+        """Hand queued messages to consumers that have capacity."""
+        queue = self.queues.get(name)
+        while queue and queue.messages:
+            consumers = [c for c in queue.consumers if c[0].has_capacity()]
+            if not consumers:
+                return
+            channel, consumer_tag, callback, auto_ack = consumers[0]
+            # round robin between the consumers of the queue
+            queue.consumers.remove(consumers[0])
+            queue.consumers.append(consumers[0])
+            channel.deliver(name, queue.pop(), consumer_tag, callback, auto_ack)
+
+
+def topic_matches(pattern, routing_key):
+    """Return True if the routing key matches the topic binding pattern."""
+
+    def match(words, keys):
+        if not words:
+            return not keys
+        if words[0] == "#":
+            return any(match(words[1:], keys[i:]) for i in range(len(keys) + 1))
+        if not keys:
+            return False
+        return words[0] in ("*", keys[0]) and match(words[1:], keys[1:])
+
+    return match(pattern.split("."), routing_key.split("."))
+
+
+class LocalConnection:
+    """A stand-in for pika.SelectConnection connected to a LocalBroker."""
+
+    def __init__(
+        self,
+        broker,
+        on_open_callback=None,
+        on_open_error_callback=None,  # pylint: disable=unused-argument
+        on_close_callback=None,
+        ioloop=None,
+    ):
+        """Create the LocalConnection object. It is opened on the first loop iteration."""
+        self.broker = broker
+        self.ioloop = ioloop or LocalIOLoop()
+        self.is_open = True
+        self.is_closed = False
+
+        self._on_close_callback = on_close_callback
+        self._blocked_callbacks = []
+        self._unblocked_callbacks = []
+        self._channels = []
+        self._channel_numbers = itertools.count(1)
+
+        broker.connections.append(self)
+        if on_open_callback:
+            self.ioloop.add_callback(lambda: on_open_callback(self))
+
+    def add_on_connection_blocked_callback(self, callback):
+        """Call callback(connection, method_frame) on connection.blocked."""
+        self._blocked_callbacks.append(callback)
+
+    def add_on_connection_unblocked_callback(self, callback):
+        """Call callback(connection, method_frame) on connection.unblocked."""
+        self._unblocked_callbacks.append(callback)
+
+    def notify_blocked(self, method):
+        """Send a Connection.Blocked or Connection.Unblocked method to this connection."""
+        method_frame = frame.Method(0, method)
+        blocked = isinstance(method, spec.Connection.Blocked)
+        callbacks = self._blocked_callbacks if blocked else self._unblocked_callbacks
+        for callback in callbacks:
+            self.ioloop.add_callback_threadsafe(
+                lambda callback=callback: callback(self, method_frame)
+            )
+        if not blocked:
+            for channel in self._channels:
+                self.ioloop.add_callback_threadsafe(channel.release_held)
+
+    def channel(self, on_open_callback=None):
+        """Open a new channel."""
+        channel = LocalChannel(self, next(self._channel_numbers))
+        self._channels.append(channel)
+        if on_open_callback:
+            self.ioloop.add_callback(lambda: on_open_callback(channel))
+        return channel
+
+    def close(self, reply_code=200, reply_text="Normal shutdown"):
+        """Close the channels and the connection."""
+        if self.is_closed:
+            return
+        for channel in list(self._channels):
+            channel.close(reply_code, reply_text)
+        self.is_open = False
+        self.is_closed = True
+        if self in self.broker.connections:
+            self.broker.connections.remove(self)
+        if self._on_close_callback:
+            reason = ConnectionClosedByClient(reply_code, reply_text)
+            self.ioloop.add_callback(lambda: self._on_close_callback(self, reason))
+
+
+class LocalChannel:  # pylint: disable=too-many-instance-attributes
+    """A stand-in for pika.channel.Channel on a LocalConnection."""
+
+    def __init__(self, connection, channel_number):
+        """Create the LocalChannel object."""
+        self.connection = connection
+        self.channel_number = channel_number
+        self.is_open = True
+        self.is_closed = False
+        self.prefetch_count = 0
+
+        self._broker = connection.broker
+        self._ioloop = connection.ioloop
+        self._close_callbacks = []
+        self._cancel_callbacks = []
+        self._confirm_callback = None
+        self._publish_number = 0
+        self._delivery_tags = itertools.count(1)
+        self._unacked = {}
+        self._consumers = {}
+        self._exclusive_queues = []
+        self._held = []
+
+    def _reply(self, callback, method):
+        """Call the callback with a method frame on the next loop iteration."""
+        if callback:
+            method_frame = frame.Method(self.channel_number, method)
+            self._ioloop.add_callback(lambda: callback(method_frame))
+
+    def add_on_close_callback(self, callback):
+        """Call callback(channel, reason) when the channel is closed."""
+        self._close_callbacks.append(callback)
+
+    def add_on_cancel_callback(self, callback):
+        """Call callback(method_frame) if the broker cancels a consumer."""
+        self._cancel_callbacks.append(callback)
+
+    def exchange_declare(self, exchange, exchange_type="direct", callback=None, **_):
+        """Declare an exchange."""
+        if not self._broker.declare_exchange(exchange, exchange_type):
+            self._close_by_broker(406, f"PRECONDITION_FAILED - exchange '{exchange}'")
+            return
+        self._reply(callback, spec.Exchange.DeclareOk())
+
+    # pylint: disable=too-many-arguments
+    def queue_declare(
+        self,
+        queue,
+        passive=False,  # pylint: disable=unused-argument
+        durable=False,  # pylint: disable=unused-argument
+        exclusive=False,
+        auto_delete=False,
+        arguments=None,
+        callback=None,
+    ):
+        """Declare a queue."""
+        name = self._broker.declare_queue(
+            queue, exclusive=exclusive, auto_delete=auto_delete, arguments=arguments
+        )
+        if exclusive:
+            self._exclusive_queues.append(name)
+        self._reply(callback, spec.Queue.DeclareOk(queue=name))
+
+    def queue_bind(
+        self, queue, exchange, routing_key=None, arguments=None, callback=None
+    ):
+        """Bind a queue to an exchange."""
+        # pylint: disable=unused-argument
+        if exchange not in self._broker.exchanges:
+            self._close_by_broker(404, f"NOT_FOUND - no exchange '{exchange}'")
+            return
+        self._broker.bind(queue, exchange, routing_key or queue)
+        self._reply(callback, spec.Queue.BindOk())
+
+    def basic_qos(
+        self, prefetch_size=0, prefetch_count=0, global_qos=False, callback=None
+    ):
+        """Limit the number of unacknowledged messages delivered to this channel."""
+        # pylint: disable=unused-argument
+        self.prefetch_count = prefetch_count
+        self._reply(callback, spec.Basic.QosOk())
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        """Turn on publisher confirms."""
+        self._confirm_callback = ack_nack_callback
+        self._reply(callback, spec.Confirm.SelectOk())
+
+    def basic_consume(
+        self,
+        queue,
+        on_message_callback,
+        auto_ack=False,
+        exclusive=False,  # pylint: disable=unused-argument
+        consumer_tag=None,
+        arguments=None,  # pylint: disable=unused-argument
+        callback=None,
+    ):
+        """Start consuming from a queue. Returns the consumer tag."""
+        consumer_tag = consumer_tag or "ctag" + uuid.uuid4().hex
+        consumer = (self, consumer_tag, on_message_callback, auto_ack)
+        self._consumers[consumer_tag] = (queue, consumer)
+        self._broker.queues[queue].consumers.append(consumer)
+        self._reply(callback, spec.Basic.ConsumeOk(consumer_tag=consumer_tag))
+        self._ioloop.add_callback(lambda: self._broker.deliver(queue))
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag="", callback=None):
+        """Stop a consumer."""
+        self._remove_consumer(consumer_tag)
+        self._reply(callback, spec.Basic.CancelOk(consumer_tag=consumer_tag))
+
+    def _remove_consumer(self, consumer_tag):
+        """Remove a consumer, deleting its queue if it is auto_delete."""
+        queue_name, consumer = self._consumers.pop(consumer_tag, (None, None))
+        queue = self._broker.queues.get(queue_name)
+        if queue is None:
+            return
+        queue.consumers.remove(consumer)
+        if queue.auto_delete and not queue.consumers:
+            self._broker.delete_queue(queue_name)
+
+    def basic_publish(
+        self, exchange, routing_key, body, properties=None, mandatory=False
+    ):
+        """Publish a message. With confirms on, it is acked after the broker's confirm_delay.
+
+        While the broker is blocked the publish is held until it is unblocked.
+        """
+        # pylint: disable=unused-argument
+        if self._broker.blocked:
+            self._held.append((exchange, routing_key, body, properties))
+            return
+
+        if exchange not in self._broker.exchanges:
+            self._close_by_broker(404, f"NOT_FOUND - no exchange '{exchange}'")
+            return
+
+        self._broker.publish(exchange, routing_key, body, properties, self._ioloop)
+
+        if self._confirm_callback:
+            self._publish_number += 1
+            method = spec.Basic.Ack(delivery_tag=self._publish_number)
+            method_frame = frame.Method(self.channel_number, method)
+            callback = self._confirm_callback
+            self._ioloop.call_later(
+                self._broker.confirm_delay, lambda: callback(method_frame)
+            )
+
+    def release_held(self):
+        """Publish the messages held while the broker was blocked."""
+        held, self._held = self._held, []
+        for args in held:
+            if self.is_open:
+                self.basic_publish(*args)
+
+    def has_capacity(self):
+        """Return True if another message can be delivered under the prefetch limit."""
+        return self.is_open and (
+            not self.prefetch_count or len(self._unacked) < self.prefetch_count
+        )
+
+    # pylint: disable=too-many-arguments
+    def deliver(self, queue_name, message, consumer_tag, callback, auto_ack):
+        """Deliver a message to a consumer of this channel."""
+        delivery_tag = next(self._delivery_tags)
+        if not auto_ack:
+            self._unacked[delivery_tag] = (queue_name, message)
+        method = spec.Basic.Deliver(
+            consumer_tag=consumer_tag,
+            delivery_tag=delivery_tag,
+            redelivered=message["redelivered"],
+            exchange=message["exchange"],
+            routing_key=message["routing_key"],
+        )
+        self._ioloop.add_callback(
+            lambda: callback(self, method, message["properties"], message["body"])
+        )
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        """Acknowledge a delivered message."""
+        tags = [delivery_tag]
+        if multiple:
+            tags = [tag for tag in self._unacked if tag <= delivery_tag]
+        for tag in tags:
+            queue_name, _ = self._unacked.pop(tag, (None, None))
+            if queue_name:
+                self._broker.deliver(queue_name)
+
+    def _close_by_broker(self, reply_code, reply_text):
+        """Close the channel like the broker does on a protocol error."""
+        self._close(ChannelClosedByBroker(reply_code, reply_text))
+
+    def close(self, reply_code=0, reply_text="Normal shutdown"):
+        """Close the channel."""
+        self._close(ChannelClosedByClient(reply_code, reply_text))
+
+    def _close(self, reason):
+        """Close the channel, requeue unacked messages and call the close callbacks."""
+        if self.is_closed:
+            return
+        self.is_open = False
+        self.is_closed = True
+        for consumer_tag in list(self._consumers):
+            self._remove_consumer(consumer_tag)
+        for queue_name, message in self._unacked.values():
+            queue = self._broker.queues.get(queue_name)
+            if queue is not None:
+                queue.push(dict(message, redelivered=True), requeue=True)
+                self._broker.deliver(queue_name)
+        self._unacked.clear()
+        for name in self._exclusive_queues:
+            self._broker.delete_queue(name)
+        for callback in self._close_callbacks:
+            self._ioloop.add_callback(lambda callback=callback: callback(self, reason))
@@ -0,0 +1,168 @@
+"""The FarmMonitor presence beacon, and a listener that caches the beacons it hears.
+
+A beacon tells devices where the RabbitMQ broker is: its host, port and
+virtual host, and a load hint for picking between brokers. Older servers
+send a 2 byte beacon with none of this, and the broker is then assumed to
+be on the sender.
+"""
+import asyncio
+import struct
+import threading
+import time
+from collections import namedtuple
+from typing import List, Optional
+
+# magic, version, broker port, load hint, followed by the length prefixed
+# utf-8 host (empty for the sender's address) and virtual host
+BEACON = struct.Struct("!2sBHB")
+LENGTH = struct.Struct("!B")
+MAGIC = b"FM"
+VERSION = 1
+UNKNOWN_LOAD = 255
+MAX_BEACON = 1024
+
+Beacon = namedtuple("Beacon", ("host", "port", "vhost", "load", "version"))
+Beacon.__doc__ = "A broker announced by a beacon. version is 0 for the legacy beacon."
+
+
+def encode_beacon(host: str, port: int = 5672, vhost: str = "/", load=None) -> bytes:
+    """Pack a presence beacon.
+
+    Args:
+        host (str): The address of the broker. Empty for the sender's address.
+        port (int, optional): The AMQP port of the broker. Defaults to 5672.
+        vhost (str, optional): The RabbitMQ virtual host. Defaults to '/'.
+        load (int, optional): How busy the broker is, from 0 to 100. Defaults to unknown.
+
+    Returns:
+        bytes: The beacon.
+    """
+    load = UNKNOWN_LOAD if load is None else min(max(int(load), 0), 100)
+    parts = [BEACON.pack(MAGIC, VERSION, port, load)]
+    for text in (host, vhost):
+        encoded = text.encode("utf-8")[:255]
+        parts.extend((LENGTH.pack(len(encoded)), encoded))
+    return b"".join(parts)
+
+
+def decode_beacon(data: bytes, sender: str) -> Optional[Beacon]:
+    """Unpack a presence beacon.
+
+    Args:
+        data (bytes): The datagram.
+        sender (str): The address the datagram came from.
+
+    Returns:
+        Optional[Beacon]: The announced broker, or None if it is not a beacon.
+    """
+    if len(data) < BEACON.size:
+        return Beacon(sender, None, None, None, 0) if len(data) == 2 else None
+    magic, version, port, load = BEACON.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    texts = []
+    offset = BEACON.size
+    for _ in range(2):
+        if len(data) < offset + LENGTH.size:
+            return None
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        try:
+            texts.append(data[offset : offset + length].decode("utf-8"))
+        except UnicodeDecodeError:
+            return None
+        offset += length
+    host, vhost = texts
+    load = None if load == UNKNOWN_LOAD else load
+    return Beacon(host or sender, port, vhost, load, version)
+
+
+class BeaconCache:
+    """A thread safe cache of the latest beacon heard from each broker."""
+
+    def __init__(self):
+        """Create the BeaconCache object."""
+        self._lock = threading.Lock()
+        self._beacons = {}
+
+    def add(self, beacon: Beacon):
+        """Store a beacon, replacing the last one of its broker."""
+        with self._lock:
+            self._beacons[beacon.host] = (time.monotonic(), beacon)
+
+    def beacons(self, max_age: float) -> List[Beacon]:
+        """Return the beacons heard in the last max_age seconds, least loaded first."""
+        now = time.monotonic()
+        with self._lock:
+            fresh = [
+                beacon
+                for heard, beacon in self._beacons.values()
+                if now - heard <= max_age
+            ]
+        return sorted(
+            fresh,
+            key=lambda beacon: UNKNOWN_LOAD if beacon.load is None else beacon.load,
+        )
+
+    def clear(self):
+        """Remove all beacons."""
+        with self._lock:
+            self._beacons.clear()
+
+
+PRESENCE_CACHE = BeaconCache()
+
+
+class _BeaconProtocol(asyncio.DatagramProtocol):
+    """Cache every beacon received, and queue it for the listener."""
+
+    def __init__(self, queue, cache):
+        self._queue = queue
+        self._cache = cache
+
+    def datagram_received(self, data, addr):
+        beacon = decode_beacon(data[:MAX_BEACON], addr[0])
+        if beacon is not None:
+            self._cache.add(beacon)
+            self._queue.put_nowait(beacon)
+
+
+async def listen_for_beacons(  # pylint: disable=too-many-arguments
+    address, port, deadline, accept, cache=PRESENCE_CACHE, stop=None
+) -> Optional[Beacon]:
+    """Listen for presence beacons until one is accepted.
+
+    Args:
+        address (str): The address to listen on, eg. the broadcast address of an interface.
+        port (int): The presence port.
+        deadline (float): Give up after this many seconds.
+        accept: Called as accept(beacon) on a worker thread. Returns True to use the broker.
+        cache (BeaconCache, optional): Where every beacon heard is kept. Defaults to PRESENCE_CACHE.
+        stop (threading.Event, optional): Give up once it is set. Defaults to None.
+
+    Returns:
+        Optional[Beacon]: The accepted beacon, or None.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _BeaconProtocol(queue, cache),
+        local_addr=(address, int(port)),
+        allow_broadcast=True,
+    )
+    end = loop.time() + deadline
+    try:
+        while stop is None or not stop.is_set():
+            remaining = end - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                beacon = await asyncio.wait_for(queue.get(), min(remaining, 0.1))
+            except asyncio.TimeoutError:
+                continue
+            if await loop.run_in_executor(None, accept, beacon):
+                return beacon
+        return None
+    finally:
+        transport.close()
@@ -0,0 +1,94 @@
+"""Token bucket rate limiting of outbound messages."""
+import threading
+import time
+
+
+class TokenBucket:
+    """A token bucket that refills at `rate` tokens a second, up to `burst` tokens."""
+
+    def __init__(self, rate, burst):
+        """Create the TokenBucket object. It starts full.
+
+        :param rate: The number of tokens added per second.
+        :param burst: The most tokens the bucket can hold.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self._last = time.monotonic()
+
+    def _refill(self):
+        """Add the tokens earned since the last refill."""
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self._last) * self.rate, self.burst)
+        self._last = now
+
+    def try_consume(self, tokens=1) -> bool:
+        """Take tokens from the bucket if there are enough.
+
+        :return: True if the tokens were taken, otherwise False.
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens=1) -> float:
+        """Return the number of seconds until there will be enough tokens."""
+        self._refill()
+        if self.tokens >= tokens or not self.rate:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """A token bucket for each traffic class, with counters of deferred messages.
+
+    Traffic classes without a bucket are not limited.
+    """
+
+    def __init__(self, limits):
+        """Create the RateLimiter object.
+
+        :param dict limits: Traffic class to a (rate, burst) tuple.
+        """
+        self._lock = threading.Lock()
+        self._buckets = {
+            traffic_class: TokenBucket(rate, burst)
+            for traffic_class, (rate, burst) in limits.items()
+        }
+        self.allowed = {traffic_class: 0 for traffic_class in limits}
+        self.deferred = {traffic_class: 0 for traffic_class in limits}
+
+    def try_acquire(self, traffic_class) -> bool:
+        """Take a token for a message of the traffic class.
+
+        :return: True if the message can be published now, False if it should be deferred.
+        """
+        with self._lock:
+            bucket = self._buckets.get(traffic_class)
+            if bucket is None:
+                return True
+            if bucket.try_consume():
+                self.allowed[traffic_class] += 1
+                return True
+            self.deferred[traffic_class] += 1
+            return False
+
+    def delay(self, traffic_class) -> float:
+        """Return the number of seconds until a message of the traffic class can be published."""
+        with self._lock:
+            bucket = self._buckets.get(traffic_class)
+            return bucket.delay() if bucket else 0.0
+
+    def stats(self) -> dict:
+        """Return the allowed and deferred counts of each traffic class."""
+        with self._lock:
+            return {
+                traffic_class: {
+                    "allowed": self.allowed[traffic_class],
+                    "deferred": self.deferred[traffic_class],
+                }
+                for traffic_class in self._buckets
+            }
@@ -1,4 +1,7 @@
 """Database base configurations."""
+import os
+import threading
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
@@ -7,39 +10,120 @@ from ..settings import get_config
 
 Base = declarative_base()
 
+# one engine per process, and the sessionmaker bound to it
+_ENGINE_LOCK = threading.Lock()
+_ENGINE = None
+_ENGINE_KEY = None
+# the engines inherited from a parent process. Their pooled connections belong
+# to the parent, and closing them (even by garbage collection) would end the
+# parent's database sessions, so they are kept referenced and never used
+_INHERITED_ENGINES = []
+_SESSION_FACTORY = sessionmaker()
+# the session behind the Model.query property
+_QUERY_SESSION = scoped_session(_SESSION_FACTORY)
+
+
+class _QueryProperty:  # pylint: disable=too-few-public-methods
+    """The Model.query property, which creates the engine on first use rather than at import."""
+
+    def __init__(self):
+        """Create the _QueryProperty object."""
+        self._query_property = _QUERY_SESSION.query_property()
+
+    def __get__(self, instance, owner):
+        """Return a query of the model, eg. `User.query.get(1)`."""
+        get_engine()
+        return self._query_property.__get__(instance, owner)
+
+
+# Adds Query Property to Models - enables `User.query.query_method()`
+Base.query = _QueryProperty()
+
 
 def get_engine():
-    """Return the sqlalchemy engine."""
+    """Return the sqlalchemy engine of this process, creating it on first use.
+
+    The engine and its connection pool are shared by every session of the
+    process. A process started with multiprocessing gets an engine of its
+    own, rather than the pooled connections of its parent.
+    """
+    global _ENGINE, _ENGINE_KEY  # pylint: disable=global-statement
     config = get_config()
-    engine = create_engine(config.SQLALCHEMY_DATABASE_URI)
-    return engine
+    key = (os.getpid(), config.SQLALCHEMY_DATABASE_URI)
+    with _ENGINE_LOCK:
+        if _ENGINE_KEY != key:
+            if _ENGINE is not None and _ENGINE_KEY[0] != key[0]:
+                _forget_inherited_engine()
+            elif _ENGINE is not None:
+                _ENGINE.dispose()
+            _ENGINE = create_engine(
+                config.SQLALCHEMY_DATABASE_URI, **_pool_options(config)
+            )
+            _ENGINE_KEY = key
+            _SESSION_FACTORY.configure(bind=_ENGINE)
+        return _ENGINE
+
+
+def _forget_inherited_engine():
+    """Stop using the engine of the parent process, without closing its connections.
+
+    Engine.dispose(close=False) does this from SQLAlchemy 1.4.33, but the
+    deployed SQLAlchemy is older, so the engine is only set aside.
+    """
+    _INHERITED_ENGINES.append(_ENGINE)
+    # the sessions of the parent may hold its connections too
+    _QUERY_SESSION.registry.clear()
+
+
+def _pool_options(config) -> dict:
+    """Return the create_engine pool options of the config."""
+    options = {"pool_pre_ping": config.DB_POOL_PRE_PING}
+    # sqlite is not pooled by a QueuePool, which these options belong to
+    if not config.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+        options["pool_size"] = config.DB_POOL_SIZE
+        options["max_overflow"] = config.DB_MAX_OVERFLOW
+        options["pool_recycle"] = config.DB_POOL_RECYCLE
+    return options
+
+
+def dispose_engine():
+    """Close the pooled connections and forget the engine of this process."""
+    global _ENGINE, _ENGINE_KEY  # pylint: disable=global-statement
+    with _ENGINE_LOCK:
+        if _ENGINE is not None and _ENGINE_KEY[0] == os.getpid():
+            _QUERY_SESSION.remove()
+            _ENGINE.dispose()
+        elif _ENGINE is not None:
+            _forget_inherited_engine()
+        _ENGINE = None
+        _ENGINE_KEY = None
 
 
 def get_session():
-    """Return the sqlalchemy db_session."""
-    engine = get_engine()
-    session = sessionmaker(bind=engine)
-    db_session = scoped_session(session)
+    """Return the sqlalchemy db_session.
+
+    Every db_session comes from the shared sessionmaker, bound to the
+    engine of this process.
+    """
+    get_engine()
+    db_session = scoped_session(_SESSION_FACTORY)
 
     return db_session
 
 
-def get_base(with_query=False):
+def get_base(with_query=False):  # pylint: disable=unused-argument
     """Return the sqlalchemy base.
 
-    :param with_query=False. If True is passed, it adds the query property to models.
+    :param with_query=False. Kept for compatibility, the models always have
+        the query property, bound to the engine on first use.
     """
-    if with_query:
-        # Adds Query Property to Models - enables `User.query.query_method()`
-        db_session = get_session()
-        Base.query = db_session.query_property()
     return Base
 
 
 def create_all_tables():
     """Create all tables."""
     engine = get_engine()
-    base = get_base(with_query=True)
+    base = get_base()
     base.metadata.create_all(bind=engine)
 
 
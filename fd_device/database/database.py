@@ -1,14 +1,165 @@
 # -*- coding: utf-8 -*-
 """Database module, including the SQLAlchemy database object and DB-related utilities."""
-from sqlalchemy import Column, ForeignKey, Integer
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import Column, ForeignKey, Integer, String, event, func, inspect, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
 
 from fd_device.database.base import get_base
+from fd_device.settings import get_config
+
+Base = get_base()
+
+# the INSERT ... ON CONFLICT constructs of the dialects bulk_upsert supports
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class SyncVersion(Base):  # type: ignore[valid-type, misc]
+    """The version of a section of the device state, for incremental syncs with the server.
+
+    Every change to a section takes the next device wide version number, so
+    the sections changed since a version are those with a higher version.
+    The VERSION_COUNTER row holds the last version given out.
+    """
+
+    __tablename__ = "sync_version"
+
+    section = Column(String(20), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# the SyncVersion row locked to give out the next version
+VERSION_COUNTER = "_counter"
+
+
+def current_sync_version(session) -> int:
+    """Return the version of the latest change to the device state."""
+    return session.query(func.max(SyncVersion.version)).scalar() or 0
+
+
+def bump_sync_version(session, section: str) -> int:
+    """Give a section of the device state the next version.
+
+    The change is added to the session, and committed with it. The
+    VERSION_COUNTER row is locked with SELECT ... FOR UPDATE until then, so
+    concurrent writers take versions in the order they commit. The first
+    writer to create the counter wins, the others fail on its primary key.
+
+    Args:
+        session (Session): The database session.
+        section (str): The section that changed.
+
+    Returns:
+        int: The new version of the section.
+    """
+    # this also runs in before_flush, where the session must not autoflush
+    with session.no_autoflush:
+        counter = _sync_version_row(session, VERSION_COUNTER, lock=True)
+        if counter is None:
+            counter = SyncVersion(
+                section=VERSION_COUNTER, version=current_sync_version(session)
+            )
+            session.add(counter)
+        counter.version += 1
+
+        row = _sync_version_row(session, section)
+        if row is None:
+            row = SyncVersion(section=section)
+            session.add(row)
+        row.version = counter.version
+    return counter.version
+
+
+def _sync_version_row(session, section, lock=False):
+    # rows added since the last flush are not found by a query
+    for instance in session.new:
+        if isinstance(instance, SyncVersion) and instance.section == section:
+            return instance
+    query = session.query(SyncVersion).filter_by(section=section)
+    if lock:
+        query = query.with_for_update()
+    return query.one_or_none()
+
+
+class SingletonCache:
+    """A read-through cache of the models that have exactly one row.
+
+    The columns of the row are cached as a read only named tuple, so they can
+    be read from any session or thread without a database round trip. A
+    model is invalidated whenever one of its rows is inserted, updated or
+    deleted through the ORM, and again when that change is committed or
+    rolled back. Changes made by another process are picked up once the
+    cached row is SINGLETON_CACHE_MAX_AGE seconds old.
+    """
+
+    def __init__(self):
+        """Create the SingletonCache object."""
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._generations = {}
+        self._row_types = {}
+
+    def _row_type(self, model):
+        if model not in self._row_types:
+            names = [column.key for column in inspect(model).column_attrs]
+            self._row_types[model] = namedtuple(f"{model.__name__}Row", names)
+        return self._row_types[model]
+
+    def get(self, session, model):
+        """Return the columns of the row of a model, or None if it has no row.
+
+        Args:
+            session (Session): The database session used on a cache miss.
+            model: The model class, eg. Device.
 
-Base = get_base(with_query=True)
+        Returns:
+            The columns of the row as a named tuple, or None.
+        """
+        max_age = get_config().SINGLETON_CACHE_MAX_AGE
+        with self._lock:
+            cached = self._rows.get(model)
+            generation = self._generations.get(model, 0)
+        if cached is not None and time.monotonic() - cached[0] <= max_age:
+            return cached[1]
+
+        instance = session.query(model).first()
+        row = None
+        if instance is not None:
+            row_type = self._row_type(model)
+            row = row_type(*(getattr(instance, name) for name in row_type._fields))
+        with self._lock:
+            # a change since the query started makes the row stale
+            if self._generations.get(model, 0) == generation:
+                self._rows[model] = (time.monotonic(), row)
+        return row
+
+    def invalidate(self, model=None):
+        """Forget the cached row of a model, or of every model if None."""
+        with self._lock:
+            models = list(self._rows) if model is None else [model]
+            for name in models:
+                self._rows.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+
+SINGLETON_CACHE = SingletonCache()
 
 
 class CRUDMixin:
-    """Mixin that adds convenience methods for CRUD (create, read, update, delete) operations."""
+    """Mixin that adds convenience methods for CRUD (create, read, update, delete) operations.
+
+    Models with a sync_section bump the version of that section of the device
+    state whenever a flush or bulk_upsert changes one of their rows. Models
+    with cache_singleton set are read through the SINGLETON_CACHE.
+    """
+
+    # the section of the device state this model belongs to (see SyncVersion)
+    sync_section = None
+    # the model has exactly one row, cached by the SINGLETON_CACHE
+    cache_singleton = False
 
     @classmethod
     def create(cls, session, **kwargs):
@@ -16,15 +167,80 @@ class CRUDMixin:
         instance = cls(**kwargs)
         return instance.save(session)
 
+    @classmethod
+    def bulk_upsert(  # pylint: disable=too-many-arguments
+        cls, session, rows, index_elements, update_columns=None, commit=True
+    ):
+        """Insert rows, updating the ones that already exist, in one statement.
+
+        This is an INSERT ... ON CONFLICT, so index_elements must be the
+        columns of a unique constraint. Existing rows are only updated when
+        one of the update_columns changes, and columns with an onupdate (eg.
+        last_updated) are set on those rows too. The sync version is only
+        bumped if a row was inserted or updated.
+
+        Args:
+            session (Session): The database session.
+            rows (list): A dict of column values for each row. Every dict has the same keys.
+            index_elements (list): The columns that identify an existing row.
+            update_columns (list, optional): The columns to update on existing rows.
+                Defaults to every column given that is not in index_elements.
+            commit (bool, optional): Commit the session. Defaults to True.
+
+        Raises:
+            NotImplementedError: If the database is not PostgreSQL or SQLite.
+
+        Returns:
+            int: The number of rows inserted or changed.
+        """
+        if not rows:
+            return 0
+        dialect = session.get_bind().dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise NotImplementedError(f"bulk_upsert does not support {dialect}")
+
+        statement = UPSERT_INSERTS[dialect](cls.__table__).values(rows)
+        if update_columns is None:
+            update_columns = [name for name in rows[0] if name not in index_elements]
+        changes = {name: statement.excluded[name] for name in update_columns}
+        if changes:
+            changed = or_(
+                *(
+                    cls.__table__.c[name].is_distinct_from(value)
+                    for name, value in changes.items()
+                )
+            )
+            for column in cls.__table__.columns:
+                onupdate = column.onupdate
+                if onupdate is not None and onupdate.is_clause_element:
+                    changes.setdefault(column.name, onupdate.arg)
+            statement = statement.on_conflict_do_update(
+                index_elements=index_elements, set_=changes, where=changed
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+
+        count = session.execute(statement).rowcount
+        if cls.sync_section and count:
+            bump_sync_version(session, cls.sync_section)
+        if cls.cache_singleton:
+            SINGLETON_CACHE.invalidate(cls)
+        if commit:
+            session.commit()
+        return count
+
     def update(self, session, commit=True, **kwargs):
-        """Update specific fields of a record."""
+        """Update specific fields of a record. Fields that already have the value are left alone."""
         for attr, value in kwargs.items():
-            setattr(self, attr, value)
+            if getattr(self, attr) != value:
+                setattr(self, attr, value)
         return self.save(session) if commit else self
 
     def save(self, session, commit=True):
         """Save the record."""
         session.add(self)
+        if self.cache_singleton:
+            SINGLETON_CACHE.invalidate(type(self))
         if commit:
             session.commit()
         return self
@@ -32,9 +248,63 @@ class CRUDMixin:
     def delete(self, session, commit=True):
         """Remove the record from the database."""
         session.delete(self)
+        if self.cache_singleton:
+            SINGLETON_CACHE.invalidate(type(self))
         return commit and session.commit()
 
 
+@event.listens_for(CRUDMixin, "after_insert", propagate=True)
+@event.listens_for(CRUDMixin, "after_update", propagate=True)
+@event.listens_for(CRUDMixin, "after_delete", propagate=True)
+def _singleton_changed(mapper, _connection, target):
+    """Invalidate a flushed singleton, and again once its session commits or rolls back."""
+    model = mapper.class_
+    if model.cache_singleton:
+        SINGLETON_CACHE.invalidate(model)
+        object_session(target).info.setdefault("singletons_changed", set()).add(model)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_changed_sections(session, _flush_context, _instances):
+    """Bump the sync version of every section with a row changed in this flush.
+
+    This covers rows changed by setting attributes and committing, as well
+    as save and delete.
+    """
+    sections = {
+        instance.sync_section
+        for instance in session.new.union(session.deleted)
+        if getattr(instance, "sync_section", None)
+    }
+    sections.update(
+        instance.sync_section
+        for instance in session.dirty
+        if getattr(instance, "sync_section", None) and session.is_modified(instance)
+    )
+    for section in sorted(sections):
+        bump_sync_version(session, section)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_soft_rollback")
+def _singletons_settled(session, *_args):
+    for model in session.info.pop("singletons_changed", ()):
+        SINGLETON_CACHE.invalidate(model)
+
+
+@event.listens_for(Base.metadata, "after_create")
+@event.listens_for(Base.metadata, "after_drop")
+def _tables_recreated(*_args, **_kwargs):
+    SINGLETON_CACHE.invalidate()
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _singletons_bulk_changed(context):
+    if getattr(context.mapper.class_, "cache_singleton", False):
+        SINGLETON_CACHE.invalidate(context.mapper.class_)
+
+
 class Model(CRUDMixin, Base):  # type: ignore[valid-type, misc]
     """Base model class that includes CRUD convenience methods."""
 
@@ -1,5 +1,5 @@
 """The device models for the database."""
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, String
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -10,16 +10,54 @@ class Connection(SurrogatePK):
     """Represent the device's connecticon to the server."""
 
     __tablename__ = "connection"
+    cache_singleton = True
     address = Column(String(20))
     last_updated = Column(DateTime, onupdate=func.now())
     first_connected = Column(DateTime, default=func.now())
     is_connected = Column(Boolean, default=False)
 
 
+class BrokerAddress(SurrogatePK):
+    """Represent a known RabbitMQ broker, with its measured connect latency."""
+
+    __tablename__ = "broker_address"
+    address = Column(String(255), unique=True)
+    latency = Column(Float, nullable=True, default=None)
+    failures = Column(Integer, default=0)
+    last_success = Column(DateTime, nullable=True, default=None)
+    last_updated = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __init__(self, address, latency=None):
+        """Create the BrokerAddress object."""
+        self.address = address
+        self.latency = latency
+        self.failures = 0
+
+    def __repr__(self):
+        """Represent the broker address in a useful format."""
+        return f"<BrokerAddress address={self.address} latency={self.latency}>"
+
+
+class RuntimeConfig(SurrogatePK):
+    """Represent the settings the server can change while the device is running.
+
+    A column that is None uses the default from the settings Config.
+    """
+
+    __tablename__ = "runtime_config"
+    heartbeat_interval = Column(Float, nullable=True, default=None)
+    sweep_interval = Column(Float, nullable=True, default=None)
+    sweep_resolution = Column(String(20), nullable=True, default=None)
+    sweep_deadband = Column(Float, nullable=True, default=None)
+    sweep_batch_size = Column(Integer, nullable=True, default=None)
+    last_updated = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
 class Grainbin(SurrogatePK):
     """Represent a Grainbin that is connected to the device."""
 
     __tablename__ = "grainbin"
+    sync_section = "grainbins"
     name = Column(String(20), unique=True)
     bus_number = Column(Integer, nullable=False)
     creation_time = Column(DateTime, default=func.now())
@@ -44,6 +82,8 @@ class Device(SurrogatePK):
     """Represent the Device."""
 
     __tablename__ = "device"
+    sync_section = "device"
+    cache_singleton = True
     device_id = Column(String(20), unique=True)
     hardware_version = Column(String(20))
     software_version = Column(String(20))
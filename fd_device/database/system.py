@@ -10,6 +10,7 @@ class SystemSetup(SurrogatePK):
     """The state of the setup of the system."""
 
     __tablename__ = "system_setup"
+    cache_singleton = True
 
     first_setup = Column(Boolean, default=False)
     first_setup_time = Column(DateTime, default=func.now())
@@ -41,8 +42,9 @@ class Interface(SurrogatePK):
     """The interface connections of the device."""
 
     __tablename__ = "system_interface"
+    sync_section = "interfaces"
 
-    interface = Column(String(5), nullable=True)
+    interface = Column(String(5), nullable=True, unique=True)
     is_active = Column(Boolean, default=True)
     is_for_fm = Column(Boolean, default=False)
     is_external = Column(Boolean, default=False)
@@ -58,6 +60,8 @@ class Hardware(SurrogatePK):
     """The hardware representation of the device."""
 
     __tablename__ = "system_hardware"
+    sync_section = "hardware"
+    cache_singleton = True
 
     device_name = Column(String(20))
     hardware_version = Column(String(20))
@@ -77,6 +81,8 @@ class Software(SurrogatePK):
     """The software representation of the device."""
 
     __tablename__ = "system_software"
+    sync_section = "software"
+    cache_singleton = True
 
     software_version = Column(String(20))
     software_version_last = Column(String(20))
@@ -0,0 +1,136 @@
+"""Benchmark the device messaging classes against the LocalBroker."""
+import math
+import resource
+import time
+import tracemalloc
+from typing import List
+
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+from fd_device.device.service import HeartbeatMessage
+
+
+class BenchmarkHeartbeat(HeartbeatMessage):
+    """A HeartbeatMessage that publishes at a given rate and records latencies."""
+
+    def __init__(self, connection, channel, device_id, rate):
+        """Create the BenchmarkHeartbeat object.
+
+        :param rate: The number of heartbeats to publish per second.
+        """
+        self.publish_times = {}
+        self.last_publish = None
+        self.confirm_latencies = []
+        self.reply_latencies = []
+        self.replies = 0
+
+        super().__init__(connection, channel, device_id)
+        self.HEARTBEAT_INTERVAL = 1 / rate
+
+    def publish_message(self):
+        """Record the publish time, then publish the message."""
+        self.last_publish = time.perf_counter()
+        self.publish_times[self._message_number + 1] = self.last_publish
+        super().publish_message()
+
+    def on_delivery_confirmation(self, method_frame):
+        """Record the confirm latency, then handle the confirmation."""
+        published = self.publish_times.pop(method_frame.method.delivery_tag, None)
+        if published is not None:
+            self.confirm_latencies.append(time.perf_counter() - published)
+        super().on_delivery_confirmation(method_frame)
+
+    def on_reply_received(self, _channel, _method, header, _body):
+        """Record the reply latency, then handle the reply."""
+        if self._corr_id == header.correlation_id:
+            self.reply_latencies.append(time.perf_counter() - self.last_publish)
+            self.replies += 1
+        super().on_reply_received(_channel, _method, header, _body)
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Return the percentile of a list of values, using the nearest rank.
+
+    Args:
+        values (List[float]): The values.
+        percent (float): The percentile to return, eg. 99.
+
+    Returns:
+        float: The percentile, or 0.0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def run_rate(rate: float, duration: float, confirm_delay: float = 0.0) -> dict:
+    """Publish heartbeats at a rate for a duration and measure the results.
+
+    Args:
+        rate (float): The number of heartbeats to publish per second.
+        duration (float): How long to publish for in seconds.
+        confirm_delay (float, optional): Simulated broker confirm delay in seconds. Defaults to 0.0.
+
+    Returns:
+        dict: The results of the run.
+    """
+
+    broker = LocalBroker(confirm_delay=confirm_delay)
+    # answer heartbeats like the server does
+    broker.add_responder("heartbeat_messages", "heartbeat", lambda _, body: body)
+
+    state = {}
+
+    def on_channel_open(channel):
+        state["heartbeat"] = BenchmarkHeartbeat(connection, channel, "benchmark", rate)
+
+    def on_connection_open(_connection):
+        connection.channel(on_open_callback=on_channel_open)
+
+    connection = LocalConnection(broker, on_open_callback=on_connection_open)
+
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+
+    connection.ioloop.run_for(duration)
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    heartbeat = state["heartbeat"]
+    heartbeat.set_stopping(True)
+    connection.close()
+
+    sent = heartbeat.sent
+    return {
+        "rate": rate,
+        "sent": sent,
+        "confirmed": len(heartbeat.confirm_latencies),
+        "replies": heartbeat.replies,
+        "messages_per_second": sent / elapsed,
+        "confirm_p50_ms": percentile(heartbeat.confirm_latencies, 50) * 1000,
+        "confirm_p99_ms": percentile(heartbeat.confirm_latencies, 99) * 1000,
+        "reply_p50_ms": percentile(heartbeat.reply_latencies, 50) * 1000,
+        "reply_p99_ms": percentile(heartbeat.reply_latencies, 99) * 1000,
+        "cpu_us_per_message": cpu / sent * 1_000_000 if sent else 0.0,
+        "peak_memory_kb": peak_memory / 1024,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_benchmark(rates: List[float], duration: float, confirm_delay: float = 0.0):
+    """Run the benchmark for each rate.
+
+    Args:
+        rates (List[float]): The publish rates to run, in messages per second.
+        duration (float): How long to run each rate for in seconds.
+        confirm_delay (float, optional): Simulated broker confirm delay in seconds. Defaults to 0.0.
+
+    Returns:
+        List[dict]: The results of each run.
+    """
+    return [run_rate(rate, duration, confirm_delay) for rate in rates]
@@ -0,0 +1,352 @@
+"""Gateway mode: forward the traffic of peer devices upstream over one connection.
+
+Peers send UDP heartbeats (see heartbeat.py) and update datagrams to the
+gateway. The gateway answers the heartbeats itself, and publishes what it
+receives upstream in batches over its own RabbitMQ connection.
+"""
+import datetime as dt
+import json
+import logging
+import select
+import struct
+import threading
+
+from pika.adapters.select_connection import IOLoop
+
+from fd_device.database.base import get_session
+from fd_device.database.database import SINGLETON_CACHE
+from fd_device.database.device import Device
+from fd_device.device.health import HealthMonitor
+from fd_device.device.heartbeat import (
+    HEADER,
+    KIND_ACK,
+    KIND_BEAT,
+    MAGIC,
+    VERSION,
+    UdpHeartbeat,
+    decode_heartbeat,
+    encode_heartbeat,
+)
+from fd_device.device.schedule import Schedule
+from fd_device.grainbin.sweep import GrainbinSweep
+from fd_device.settings import get_config
+from fd_device.startup import create_udp_socket
+
+LOGGER = logging.getLogger("fd.device.gateway")
+
+KIND_UPDATE = 3
+# the length of the device_id, which is followed by the device_id and the json message
+UPDATE_HEADER = struct.Struct("!B")
+MAX_UPDATE = 65507
+
+
+def encode_update(sequence: int, device_id: str, message: dict) -> bytes:
+    """Pack an update datagram.
+
+    Args:
+        sequence (int): The update sequence number.
+        device_id (str): The id of the device sending the update.
+        message (dict): The update, as it would be published to RabbitMQ.
+
+    Returns:
+        bytes: The datagram.
+    """
+    device = device_id.encode("utf-8")[:255]
+    body = json.dumps(message, ensure_ascii=False, default=str).encode("utf-8")
+    header = HEADER.pack(MAGIC, VERSION, KIND_UPDATE, sequence & 0xFFFFFFFF)
+    return b"".join((header, UPDATE_HEADER.pack(len(device)), device, body))
+
+
+def decode_update(data: bytes):
+    """Unpack an update datagram.
+
+    Args:
+        data (bytes): The datagram.
+
+    Returns:
+        tuple: (sequence, device_id, message), or None if it is not an update datagram.
+    """
+    if len(data) < HEADER.size + UPDATE_HEADER.size:
+        return None
+    magic, version, kind, sequence = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or kind != KIND_UPDATE:
+        return None
+
+    offset = HEADER.size + UPDATE_HEADER.size
+    (length,) = UPDATE_HEADER.unpack_from(data, HEADER.size)
+    try:
+        device_id = data[offset : offset + length].decode("utf-8")
+        message = json.loads(data[offset + length :].decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return sequence, device_id, message
+
+
+class Gateway:  # pylint: disable=too-many-instance-attributes
+    """Accept heartbeats and updates from peer devices, and forward them upstream in batches.
+
+    Datagrams are received on a background thread. Heartbeats are acked
+    right away; only the latest heartbeat of each peer is kept for the next
+    batch. Batches are published from the IOLoop every flush_interval
+    seconds, or as soon as batch_size updates are waiting.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        connection,
+        publisher,
+        device_id,
+        host="0.0.0.0",
+        port=5556,
+        batch_size=100,
+        flush_interval=1.0,
+    ):
+        """Create the Gateway object and bind its socket.
+
+        :param connection: The pika connection whose IOLoop publishes the batches.
+        :param Publisher publisher: Where the batches are published.
+        :param str device_id: The id of the gateway device.
+        :param str host: The address to listen on for peers.
+        :param int port: The UDP port to listen on. 0 picks a free port.
+        :param int batch_size: Publish as soon as this many updates are waiting.
+        :param float flush_interval: The most seconds a heartbeat or update waits.
+        """
+        self.LOGGER = logging.getLogger("fd.device.gateway")
+        self.device_id = device_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.received = 0
+        self.forwarded = 0
+        self.batches = 0
+        # the last heartbeat time of each peer
+        self.peers = {}
+
+        self._connection = connection
+        self._publisher = publisher
+        self._lock = threading.Lock()
+        self._heartbeats = {}
+        self._updates = []
+        self._flush_requested = False
+
+        self._socket = create_udp_socket()
+        self._socket.bind((host, int(port)))
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def address(self):
+        """Return the (host, port) the gateway is listening on."""
+        return self._socket.getsockname()
+
+    def start(self):
+        """Receive from the peers on a background thread, and schedule the first flush."""
+        self.LOGGER.info(f"Gateway listening for peers on {self.address}")
+        self._thread = threading.Thread(target=self.run, name="fd-gateway", daemon=True)
+        self._thread.start()
+        self._connection.ioloop.call_later(self.flush_interval, self._flush_later)
+
+    def stop(self):
+        """Stop receiving from the peers and close the socket."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._socket.close()
+
+    def run(self):
+        """Receive datagrams from the peers until stopped."""
+        while not self._stopping.is_set():
+            ready, _, _ = select.select([self._socket], [], [], 0.1)
+            if ready:
+                data, address = self._socket.recvfrom(MAX_UPDATE)
+                self.receive(data, address)
+
+    def receive(self, data, address):
+        """Handle a datagram from a peer."""
+        if len(data) < HEADER.size:
+            return
+        kind = HEADER.unpack_from(data)[2]
+
+        if kind == KIND_BEAT:
+            decoded = decode_heartbeat(data)
+            if decoded is None:
+                return
+            _, sequence, device_id, health = decoded
+            self._socket.sendto(
+                encode_heartbeat(KIND_ACK, sequence, device_id), address
+            )
+            with self._lock:
+                self.received += 1
+                self.peers[device_id] = dt.datetime.now()
+                self._heartbeats[device_id] = {"heartbeat": sequence, "health": health}
+
+        elif kind == KIND_UPDATE:
+            decoded = decode_update(data)
+            if decoded is None:
+                return
+            _, device_id, message = decoded
+            with self._lock:
+                self.received += 1
+                self._updates.append({"device_id": device_id, "message": message})
+                full = len(self._updates) >= self.batch_size
+                request = full and not self._flush_requested
+                if request:
+                    self._flush_requested = True
+            if request:
+                self._connection.ioloop.add_callback_threadsafe(self.flush)
+
+    def _flush_later(self):
+        """Flush, and schedule the next flush."""
+        if self._stopping.is_set():
+            return
+        self.flush()
+        self._connection.ioloop.call_later(self.flush_interval, self._flush_later)
+
+    def flush(self):
+        """Publish the waiting heartbeats and updates as one batch. This runs on the IOLoop."""
+        with self._lock:
+            heartbeats, self._heartbeats = self._heartbeats, {}
+            updates, self._updates = self._updates, []
+            self._flush_requested = False
+
+        if not heartbeats and not updates:
+            return
+
+        self._publisher.send(
+            {
+                "gateway": self.device_id,
+                "created_at": dt.datetime.now(),
+                "heartbeats": heartbeats,
+                "updates": updates,
+            }
+        )
+        self.batches += 1
+        self.forwarded += len(heartbeats) + len(updates)
+
+
+class GatewayPeerPublisher:
+    """Send updates to a gateway, in place of a Publisher to RabbitMQ."""
+
+    def __init__(self, host, port, device_id):
+        """Create the GatewayPeerPublisher object.
+
+        :param str host: The address of the gateway.
+        :param int port: The UDP port of the gateway.
+        :param str device_id: The id of this device.
+        """
+        self.LOGGER = logging.getLogger("fd.device.gateway.peer")
+        self.address = (host, int(port))
+        self.device_id = device_id
+        self.sent = 0
+        self.dropped = 0
+
+        self._socket = create_udp_socket()
+
+    @property
+    def outbox_depth(self) -> int:
+        """Updates are sent right away, so nothing ever waits."""
+        return 0
+
+    def send(self, message, routing_key=None, priority=None) -> bool:
+        """Send an update to the gateway.
+
+        :return: True if the update was sent, False if it was too large or could not be sent.
+        """
+        # pylint: disable=unused-argument
+        datagram = encode_update(self.sent + 1, self.device_id, message)
+        if len(datagram) > MAX_UPDATE:
+            self.LOGGER.warning(f"Update of {len(datagram)} bytes is too large to send")
+            self.dropped += 1
+            return False
+        try:
+            self._socket.sendto(datagram, self.address)
+        except OSError as error:
+            self.LOGGER.debug(f"Could not send update to the gateway: {error}")
+            self.dropped += 1
+            return False
+        self.sent += 1
+        return True
+
+    def close(self):
+        """Close the socket."""
+        self._socket.close()
+
+
+class PeerDevice:
+    """Run this device as a peer of a gateway, with no RabbitMQ connection of its own.
+
+    Heartbeats are UdpHeartbeats to the gateway, and grainbin sweeps are sent
+    to the gateway by a GatewayPeerPublisher.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, device_id, host, port, sweep_interval, ioloop=None):
+        """Create the PeerDevice object.
+
+        :param str device_id: The id of this device.
+        :param str host: The address of the gateway.
+        :param int port: The UDP port of the gateway.
+        :param sweep_interval: The number of seconds between grainbin sweeps.
+        :param ioloop: The IOLoop to run on. Defaults to a new pika IOLoop.
+        """
+        self.ioloop = ioloop or IOLoop()
+        self.schedule = Schedule(device_id)
+        self.health = HealthMonitor(get_config().HEALTH_REFRESH_INTERVAL)
+        self.publisher = GatewayPeerPublisher(host, port, device_id)
+        self.heartbeat = UdpHeartbeat(
+            self.ioloop, host, device_id, port, self.schedule, self.health
+        )
+        # a peer has no pika connection, the sweep only needs the ioloop of this object
+        self.sweep = GrainbinSweep(
+            self,
+            self.publisher,
+            logging.getLogger("fd.device.gateway.sweep"),
+            sweep_interval,
+            self.schedule,
+        )
+        self.health.publishers = [self.publisher]
+        self.health.sweep = self.sweep
+
+    def start(self):
+        """Start the heartbeats, sweeps and health refreshes."""
+        self.heartbeat.start()
+        self.sweep.start()
+        self.health.start(self.ioloop)
+
+    def stop(self):
+        """Stop the heartbeats, sweeps and health refreshes."""
+        self.heartbeat.set_stopping(True)
+        self.sweep.stop()
+        self.health.stop()
+        self.publisher.close()
+
+    def run(self):
+        """Start, and run the IOLoop until interrupted."""
+        self.start()
+        try:
+            self.ioloop.start()
+        except KeyboardInterrupt:
+            LOGGER.info("Stopping peer device")
+            self.stop()
+
+
+def run_peer():
+    """Run this device as a peer of the gateway at GATEWAY_ADDRESS."""
+
+    config = get_config()
+    session = get_session()
+    device = SINGLETON_CACHE.get(session, Device)
+    session.close()
+    if device is None:
+        LOGGER.error("No device is configured, run 'fd_device first-setup' first")
+        return
+
+    LOGGER.info(f"Running as a peer of the gateway at {config.GATEWAY_ADDRESS}")
+    peer = PeerDevice(
+        device.device_id,
+        config.GATEWAY_ADDRESS,
+        config.GATEWAY_PORT,
+        config.SWEEP_INTERVAL,
+    )
+    peer.run()
@@ -0,0 +1,181 @@
+"""A compact summary of the device health, sent with every heartbeat."""
+import logging
+import shutil
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from fd_device.grainbin.cache import READING_CACHE
+from fd_device.system.info import UNKNOWN_CPU_TEMPERATURE, get_cpu_temperature
+
+# reading age (s), outbox depth, sweep duration (ms), free disk (MB), cpu temperature (0.1 C)
+HEALTH = struct.Struct("!IIIIh")
+HEALTH_KEYS = (
+    "reading_age",
+    "outbox_depth",
+    "sweep_duration",
+    "cpu_temperature",
+    "disk_free_mb",
+)
+UNKNOWN = 0xFFFFFFFF
+UNKNOWN_TEMPERATURE = -32768
+
+
+def pack_health(summary: dict) -> bytes:
+    """Pack a health summary into HEALTH.size bytes.
+
+    Args:
+        summary (dict): A summary from HealthMonitor.summary().
+
+    Returns:
+        bytes: The packed summary. Missing values are packed as UNKNOWN.
+    """
+
+    def unsigned(value, scale=1):
+        if value is None:
+            return UNKNOWN
+        return min(max(int(round(value * scale)), 0), UNKNOWN - 1)
+
+    temperature = summary["cpu_temperature"]
+    return HEALTH.pack(
+        unsigned(summary["reading_age"]),
+        unsigned(summary["outbox_depth"]),
+        unsigned(summary["sweep_duration"], 1000),
+        unsigned(summary["disk_free_mb"]),
+        (
+            UNKNOWN_TEMPERATURE
+            if temperature is None
+            else min(max(int(round(temperature * 10)), -32767), 32767)
+        ),
+    )
+
+
+def unpack_health(data: bytes) -> dict:
+    """Unpack a health summary packed with pack_health.
+
+    Args:
+        data (bytes): At least HEALTH.size bytes.
+
+    Returns:
+        dict: The health summary.
+    """
+    age, outbox, sweep_ms, disk, temperature = HEALTH.unpack_from(data)
+    return {
+        "reading_age": None if age == UNKNOWN else age,
+        "outbox_depth": None if outbox == UNKNOWN else outbox,
+        "sweep_duration": None if sweep_ms == UNKNOWN else sweep_ms / 1000,
+        "cpu_temperature": (
+            None if temperature == UNKNOWN_TEMPERATURE else temperature / 10
+        ),
+        "disk_free_mb": None if disk == UNKNOWN else disk,
+    }
+
+
+class HealthMonitor:
+    """Build the health summary from in-memory counters.
+
+    The heartbeat calls summary(), which only reads counters: the newest
+    reading age from the READING_CACHE, the outbox depth of the publishers
+    and the duration of the last grainbin sweep. The CPU temperature and free
+    disk space need system calls, so they are refreshed every refresh_interval
+    seconds on a worker thread and cached. Each refresh also logs the queue
+    depth and latency of the server commands.
+    """
+
+    def __init__(self, refresh_interval=60, disk_path="/"):
+        """Create the HealthMonitor object.
+
+        :param refresh_interval: Seconds between refreshes of the CPU temperature and free disk.
+        :param disk_path: The path whose filesystem free space is reported.
+        """
+        self.LOGGER = logging.getLogger("fd.device.health")
+        self.refresh_interval = refresh_interval
+        self.disk_path = disk_path
+
+        # set by the DeviceConnection once they exist
+        self.publishers = []
+        self.sweep = None
+        self.commands = None
+
+        self.cpu_temperature = None
+        self.disk_free_mb = None
+
+        self._ioloop = None
+        self._timer = None
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="fd-health"
+        )
+
+    def start(self, ioloop):
+        """Refresh the cached values now, then every refresh_interval on the ioloop."""
+        if self._timer is not None:
+            self._ioloop.remove_timeout(self._timer)
+        self._ioloop = ioloop
+        self._stopping = False
+        self._refresh_later()
+
+    def stop(self):
+        """Stop refreshing the cached values."""
+        self._stopping = True
+        self._executor.shutdown(wait=False)
+
+    def _refresh_later(self):
+        """Submit a refresh to the worker thread and schedule the next one."""
+        self._timer = None
+        if self._stopping:
+            return
+        self._executor.submit(self.refresh)
+        self._timer = self._ioloop.call_later(
+            self.refresh_interval, self._refresh_later
+        )
+
+    def refresh(self):
+        """Read the CPU temperature and free disk space. This runs on the worker thread."""
+        try:
+            temperature = get_cpu_temperature()
+            self.cpu_temperature = (
+                None if temperature == UNKNOWN_CPU_TEMPERATURE else temperature
+            )
+        except Exception:  # noqa: B902  pylint: disable=broad-except
+            self.LOGGER.exception("Error reading the CPU temperature")
+            self.cpu_temperature = None
+
+        try:
+            self.disk_free_mb = shutil.disk_usage(self.disk_path).free // (1 << 20)
+        except OSError:
+            self.LOGGER.warning(
+                f"Unable to read the free disk space of {self.disk_path}"
+            )
+            self.disk_free_mb = None
+
+        self.log_commands()
+
+    def log_commands(self):
+        """Log the queue depth and latency of every command handled so far."""
+        if self.commands is None:
+            return
+        for command, stats in sorted(self.commands.snapshot().items()):
+            self.LOGGER.info(
+                f"Command {command}: {stats['handled']} handled, "
+                f"{stats['errors']} errors, {stats['queued']} queued, "
+                f"{stats['running']} running, wait {stats['wait_avg']:.3f}s avg, "
+                f"latency {stats['latency_avg']:.3f}s avg "
+                f"{stats['latency_max']:.3f}s max"
+            )
+
+    def summary(self) -> dict:
+        """Return the health summary. Only in-memory values are read."""
+        reading_age = READING_CACHE.newest_age()
+        return {
+            "reading_age": None if reading_age is None else int(reading_age),
+            "outbox_depth": sum(
+                publisher.outbox_depth for publisher in self.publishers
+            ),
+            "sweep_duration": (
+                None
+                if self.sweep is None or self.sweep.last_duration is None
+                else round(self.sweep.last_duration, 3)
+            ),
+            "cpu_temperature": self.cpu_temperature,
+            "disk_free_mb": self.disk_free_mb,
+        }
@@ -0,0 +1,309 @@
+"""Heartbeat state tracking, and a lightweight UDP heartbeat transport."""
+import logging
+import select
+import socket
+import struct
+import threading
+
+from fd_device.device.health import HEALTH, HEALTH_KEYS, pack_health, unpack_health
+from fd_device.startup import create_udp_socket
+from fd_device.system.startup_profile import STARTUP_PROFILE
+
+LOGGER = logging.getLogger("fd.device.heartbeat")
+
+# magic, version, kind, sequence, then for beats the HEALTH summary,
+# followed by the utf-8 device_id
+HEADER = struct.Struct("!2sBBI")
+MAGIC = b"FD"
+VERSION = 2
+KIND_BEAT = 1
+KIND_ACK = 2
+MAX_DEVICE_ID = 64
+MAX_DATAGRAM = HEADER.size + HEALTH.size + MAX_DEVICE_ID
+
+
+def encode_heartbeat(
+    kind: int, sequence: int, device_id: str, health: dict = None
+) -> bytes:
+    """Pack a heartbeat or ack datagram.
+
+    Args:
+        kind (int): KIND_BEAT or KIND_ACK.
+        sequence (int): The heartbeat sequence number.
+        device_id (str): The id of the device sending the heartbeat.
+        health (dict, optional): The health summary of a beat. Defaults to all unknown.
+
+    Returns:
+        bytes: The datagram.
+
+    Raises:
+        ValueError: The device_id is longer than MAX_DEVICE_ID bytes.
+    """
+    datagram = HEADER.pack(MAGIC, VERSION, kind, sequence & 0xFFFFFFFF)
+    if kind == KIND_BEAT:
+        datagram += pack_health(health or dict.fromkeys(HEALTH_KEYS))
+    return datagram + encode_device_id(device_id)
+
+
+def encode_device_id(device_id: str) -> bytes:
+    """Encode the device_id of a heartbeat datagram.
+
+    It is never truncated, as the acks of a truncated device_id would not match.
+
+    Raises:
+        ValueError: There is no device_id, or it is longer than MAX_DEVICE_ID bytes.
+    """
+    if not device_id:
+        raise ValueError("The device has no device_id")
+    encoded = device_id.encode("utf-8")
+    if len(encoded) > MAX_DEVICE_ID:
+        raise ValueError(
+            f"The device_id {device_id} is longer than {MAX_DEVICE_ID} bytes"
+        )
+    return encoded
+
+
+def decode_heartbeat(data: bytes):
+    """Unpack a heartbeat or ack datagram.
+
+    Args:
+        data (bytes): The datagram.
+
+    Returns:
+        tuple: (kind, sequence, device_id, health), or None if it is not a heartbeat
+        datagram. health is None for acks.
+    """
+    if len(data) < HEADER.size:
+        return None
+    magic, version, kind, sequence = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or kind not in (KIND_BEAT, KIND_ACK):
+        return None
+
+    health = None
+    offset = HEADER.size
+    if kind == KIND_BEAT:
+        if len(data) < offset + HEALTH.size:
+            return None
+        health = unpack_health(data[offset:])
+        offset += HEALTH.size
+    try:
+        device_id = data[offset:].decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return kind, sequence, device_id, health
+
+
+class HeartbeatState:
+    """The connected/disconnected state machine shared by the heartbeat transports.
+
+    Each heartbeat clears _response, and on_heartbeat_reply sets it. If no
+    reply has arrived after TIMEOUT seconds, check_timeout counts a missed
+    timeout, and after MAX_MISSED_TIMEOUTS the STATE becomes disconnected.
+    """
+
+    HEARTBEAT_INTERVAL = 5
+    TIMEOUT = 3
+    MAX_MISSED_TIMEOUTS = 3
+    # state can be 'disconnected', 'connected', 'new'
+    STATE = "disconnected"
+
+    LOGGER = LOGGER
+    _response = False
+    _timeouts_missed = 0
+    _message_number = 0
+
+    @property
+    def sent(self) -> int:
+        """Return the number of heartbeats sent."""
+        return self._message_number
+
+    def on_heartbeat_reply(self):
+        """Record a reply to the current heartbeat."""
+        STARTUP_PROFILE.finish("first_heartbeat_ack")
+        self._response = True
+        self._timeouts_missed = 0
+        if not self.STATE == "connected":
+            self.STATE = "connected"
+            self.LOGGER.info("STATE connected")
+
+    def check_timeout(self):
+        """Check timeout status and update the state of the device."""
+        if not self._response:
+            self._timeouts_missed += 1
+            self.LOGGER.debug("Heartbeat timeout")
+
+        if self._timeouts_missed == self.MAX_MISSED_TIMEOUTS + 1:
+            self.LOGGER.warning(
+                f"More than {self.MAX_MISSED_TIMEOUTS} timeouts missed. STATE disconnected"
+            )
+            self.STATE = "disconnected"
+
+
+class UdpHeartbeat(HeartbeatState):
+    """Send heartbeats to the server as single UDP datagrams.
+
+    This is an alternative to the AMQP HeartbeatMessage that needs no reply
+    queue on the broker. Acks are read from the non-blocking socket when the
+    TIMEOUT of each heartbeat expires, so only the IOLoop timers are used.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, ioloop, host, device_id, port, schedule=None, health=None):
+        """Create the UdpHeartbeat object.
+
+        :param ioloop: The IOLoop used to schedule the heartbeats.
+        :param str host: The address of the server.
+        :param str device_id: The id of this device.
+        :param int port: The UDP port of the server.
+        :param Schedule schedule: If given, heartbeats are sent at this device's phase.
+        :param HealthMonitor health: If given, its summary is sent with every heartbeat.
+        :raises ValueError: The device_id is longer than MAX_DEVICE_ID bytes.
+        """
+        self.LOGGER = logging.getLogger("fd.device.heartbeat.udp")
+
+        encode_device_id(device_id)
+        self.device_id = device_id
+        self.address = (host, int(port))
+
+        self._ioloop = ioloop
+        self._schedule = schedule
+        self._health = health
+        self._stopping = False
+        self._message_number = 0
+        self._response = False
+        self._timeouts_missed = 0
+
+        self._socket = create_udp_socket()
+        self._socket.setblocking(False)
+
+    def start(self):
+        """Schedule the first heartbeat."""
+        self.LOGGER.info(
+            f"Sending UDP heartbeats to {self.address[0]}:{self.address[1]}"
+        )
+        self.schedule_next_message()
+
+    def set_stopping(self, stopping):
+        """Stop sending heartbeats, and close the socket."""
+        self._stopping = stopping
+        if stopping:
+            self._socket.close()
+
+    def schedule_next_message(self):
+        """If not stopping, schedule another heartbeat at the next heartbeat tick."""
+        if self._stopping:
+            return
+        delay = self.HEARTBEAT_INTERVAL
+        if self._schedule is not None:
+            delay = self._schedule.next_delay(self.HEARTBEAT_INTERVAL)
+        self._ioloop.call_later(delay, self.publish_message)
+
+    def publish_message(self):
+        """Send a heartbeat datagram and schedule the timeout check."""
+        if self._stopping:
+            return
+
+        # discard acks that arrived too late for the previous heartbeat
+        self.receive_acks()
+        self._response = False
+        self._message_number += 1
+
+        health = self._health.summary() if self._health else None
+        datagram = encode_heartbeat(
+            KIND_BEAT, self._message_number, self.device_id, health
+        )
+        try:
+            self._socket.sendto(datagram, self.address)
+        except OSError as error:
+            self.LOGGER.debug(f"Could not send UDP heartbeat: {error}")
+
+        self.schedule_next_message()
+        self._ioloop.call_later(self.TIMEOUT, self.check_timeout)
+
+    def receive_acks(self):
+        """Read every waiting datagram, and record an ack of the current heartbeat."""
+        while True:
+            try:
+                data = self._socket.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as error:
+                self.LOGGER.debug(f"Could not receive UDP heartbeat ack: {error}")
+                return
+
+            decoded = decode_heartbeat(data)
+            if decoded is None:
+                continue
+            if decoded[:3] == (KIND_ACK, self._message_number, self.device_id):
+                self.on_heartbeat_reply()
+
+    def check_timeout(self):
+        """Read the acks that have arrived, then check the timeout status."""
+        if self._stopping:
+            return
+        self.receive_acks()
+        super().check_timeout()
+
+
+class UdpHeartbeatResponder:
+    """Answer UDP heartbeats the way the server does, for local testing."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        """Create the UdpHeartbeatResponder object and bind its socket.
+
+        :param str host: The address to listen on.
+        :param int port: The port to listen on. 0 picks a free port.
+        """
+        self.received = 0
+        self.devices = set()
+        # the latest health summary of each device
+        self.health = {}
+
+        self._socket = create_udp_socket()
+        self._socket.bind((host, int(port)))
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def address(self):
+        """Return the (host, port) the responder is listening on."""
+        return self._socket.getsockname()
+
+    def start(self):
+        """Answer heartbeats on a background thread."""
+        self._thread = threading.Thread(
+            target=self.run, name="fd-udp-responder", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop answering heartbeats and close the socket."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._socket.close()
+
+    def run(self):
+        """Answer every heartbeat with an ack until stopped."""
+        while not self._stopping.is_set():
+            ready, _, _ = select.select([self._socket], [], [], 0.1)
+            if not ready:
+                continue
+            data, address = self._socket.recvfrom(MAX_DATAGRAM)
+            self.respond(data, address)
+
+    def respond(self, data, address):
+        """Send an ack for a heartbeat datagram."""
+        decoded = decode_heartbeat(data)
+        if decoded is None or decoded[0] != KIND_BEAT:
+            return
+        _, sequence, device_id, health = decoded
+        self.received += 1
+        self.devices.add(device_id)
+        self.health[device_id] = health
+        try:
+            self._socket.sendto(
+                encode_heartbeat(KIND_ACK, sequence, device_id), address
+            )
+        except socket.error as error:
+            LOGGER.debug(f"Could not answer UDP heartbeat: {error}")
@@ -0,0 +1,158 @@
+"""Settings that the server can change while the device is running."""
+import logging
+import threading
+
+from sqlalchemy.orm.session import Session
+
+from fd_device.database.device import RuntimeConfig
+from fd_device.device.heartbeat import HeartbeatState
+from fd_device.settings import get_config
+
+LOGGER = logging.getLogger("fd.device.runtime")
+
+# the sensor files of the 1wire temperature resolutions, from fastest to most precise
+RESOLUTIONS = ("temperature9", "temperature10", "temperature11", "temperature12")
+
+
+def _positive(value):
+    value = float(value)
+    if value <= 0:
+        raise ValueError("must be greater than 0")
+    return value
+
+
+def _heartbeat_interval(value):
+    # a heartbeat must not clear the reply of the previous one before its timeout
+    value = float(value)
+    if value <= HeartbeatState.TIMEOUT:
+        raise ValueError(
+            f"must be greater than the heartbeat timeout of {HeartbeatState.TIMEOUT}s"
+        )
+    return value
+
+
+def _not_negative(value):
+    value = float(value)
+    if value < 0:
+        raise ValueError("must not be negative")
+    return value
+
+
+def _batch_size(value):
+    if isinstance(value, bool) or int(value) != value or value < 1:
+        raise ValueError("must be a whole number of at least 1")
+    return int(value)
+
+
+def _resolution(value):
+    if value not in RESOLUTIONS:
+        raise ValueError(f"must be one of {', '.join(RESOLUTIONS)}")
+    return value
+
+
+# setting name to the function that validates and converts a new value
+VALIDATORS = {
+    "heartbeat_interval": _heartbeat_interval,
+    "sweep_interval": _positive,
+    "sweep_resolution": _resolution,
+    "sweep_deadband": _not_negative,
+    "sweep_batch_size": _batch_size,
+}
+
+
+class RuntimeSettings:
+    """The heartbeat and sweep settings in effect, with the Config defaults.
+
+    Changes are validated, persisted to the RuntimeConfig table and passed to
+    the listeners, which apply them at their next scheduler tick.
+    """
+
+    def __init__(self):
+        """Create the RuntimeSettings object with the defaults from the Config."""
+        config = get_config()
+        self.defaults = {
+            "heartbeat_interval": config.HEARTBEAT_INTERVAL,
+            "sweep_interval": config.SWEEP_INTERVAL,
+            "sweep_resolution": config.SWEEP_RESOLUTION,
+            "sweep_deadband": config.SWEEP_DEADBAND,
+            "sweep_batch_size": config.SWEEP_BATCH_SIZE,
+        }
+
+        self._lock = threading.Lock()
+        self._values = dict(self.defaults)
+        self._listeners = []
+
+    def snapshot(self) -> dict:
+        """Return the current value of every setting."""
+        with self._lock:
+            return dict(self._values)
+
+    def add_listener(self, callback):
+        """Call callback(settings) with a snapshot whenever the settings change."""
+        self._listeners.append(callback)
+
+    def load(self, session: Session):
+        """Load the settings persisted in the database.
+
+        Unset columns keep their default, and so do values that are no longer
+        valid, eg. a heartbeat_interval saved before it had to exceed the timeout.
+        """
+        row = session.query(RuntimeConfig).first()
+        if row is None:
+            return
+        with self._lock:
+            for name, validator in VALIDATORS.items():
+                value = getattr(row, name)
+                if value is None:
+                    continue
+                try:
+                    self._values[name] = validator(value)
+                except (TypeError, ValueError):
+                    LOGGER.warning(f"Ignoring the saved {name} {value!r}")
+
+    def restore(self, values: dict):
+        """Restore the settings of a snapshot. Unknown or invalid values are ignored."""
+        with self._lock:
+            for name, value in values.items():
+                if name in VALIDATORS and value is not None:
+                    try:
+                        self._values[name] = VALIDATORS[name](value)
+                    except (TypeError, ValueError):
+                        LOGGER.warning(f"Ignoring the {name} {value!r} of the snapshot")
+
+    def update(self, session: Session, changes: dict) -> dict:
+        """Validate, persist and apply changes to the settings.
+
+        Args:
+            session (Session): The database session used to persist the changes.
+            changes (dict): Setting names to new values. None resets a setting to its default.
+
+        Raises:
+            ValueError: If a setting is unknown or a value is not valid. Nothing is changed.
+
+        Returns:
+            dict: The settings in effect after the changes.
+        """
+        validated = {}
+        for name, value in changes.items():
+            if name not in VALIDATORS:
+                raise ValueError(f"unknown setting '{name}'")
+            try:
+                validated[name] = None if value is None else VALIDATORS[name](value)
+            except (TypeError, ValueError) as error:
+                raise ValueError(f"{name} {error}") from error
+
+        row = session.query(RuntimeConfig).first()
+        if row is None:
+            row = RuntimeConfig()
+        row.update(session, **validated)
+
+        with self._lock:
+            for name, value in validated.items():
+                self._values[name] = self.defaults[name] if value is None else value
+            values = dict(self._values)
+
+        LOGGER.info(f"Runtime settings changed to {values}")
+        for callback in self._listeners:
+            callback(values)
+        return values
@@ -0,0 +1,99 @@
+"""Spread periodic publishes of the fleet with stable per-device offsets."""
+import hashlib
+import math
+import time
+
+
+def phase_fraction(device_id: str) -> float:
+    """Return a stable fraction in [0, 1) derived from the device_id.
+
+    A hash of the device_id is used rather than hash(), which changes between
+    processes, so a device always gets the same phase.
+
+    Args:
+        device_id (str): The id of the device.
+
+    Returns:
+        float: The fraction of the interval to offset the device's ticks by.
+    """
+    digest = hashlib.sha256(str(device_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / (1 << 64)
+
+
+class Schedule:
+    """Place the periodic jobs of a device at a fixed phase within their interval.
+
+    Ticks fall on wall clock times of `offset + n * interval`, where the offset
+    is a fraction of the interval. Devices that all start together after a
+    power restore then publish spread across the interval instead of in sync.
+    The fraction comes from the device_id, or from a slot pushed by the server.
+    """
+
+    # a tick closer than this fraction of the interval is moved to the next interval
+    MIN_DELAY_FRACTION = 0.1
+
+    def __init__(self, device_id: str):
+        """Create the Schedule object.
+
+        Args:
+            device_id (str): The id of the device.
+        """
+        self.device_id = device_id
+        self.fraction = phase_fraction(device_id)
+        self.slot = None
+        self.slot_count = None
+
+    def set_slot(self, slot: int, slot_count: int):
+        """Use a slot assigned by the server instead of the device_id hash.
+
+        Args:
+            slot (int): The slot of this device, from 0 to slot_count - 1.
+            slot_count (int): The number of slots the interval is divided into.
+
+        Raises:
+            ValueError: If the slot is not within the slot_count.
+        """
+        slot = int(slot)
+        slot_count = int(slot_count)
+        if slot_count < 1 or not 0 <= slot < slot_count:
+            raise ValueError(f"slot {slot} is not within {slot_count} slots")
+        self.slot = slot
+        self.slot_count = slot_count
+        self.fraction = slot / slot_count
+
+    def clear_slot(self):
+        """Go back to the offset derived from the device_id."""
+        self.slot = None
+        self.slot_count = None
+        self.fraction = phase_fraction(self.device_id)
+
+    def offset(self, interval: float) -> float:
+        """Return the offset in seconds of this device's ticks within the interval."""
+        return self.fraction * interval
+
+    def next_delay(self, interval: float, now: float = None) -> float:
+        """Return the number of seconds until the next tick.
+
+        Args:
+            interval (float): The interval of the job in seconds.
+            now (float, optional): The current time.time(). Defaults to None.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        if now is None:
+            now = time.time()
+        offset = self.offset(interval)
+        next_tick = offset + math.ceil((now - offset) / interval) * interval
+        delay = next_tick - now
+        if delay < interval * self.MIN_DELAY_FRACTION:
+            delay += interval
+        return delay
+
+    def info(self) -> dict:
+        """Return the schedule details to report to the server."""
+        return {
+            "slot": self.slot,
+            "slot_count": self.slot_count,
+            "fraction": self.fraction,
+        }
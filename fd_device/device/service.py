@@ -1,22 +1,50 @@
 """Device service package."""
+import datetime as dt
+import functools
 import json
 import logging
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import pika
+from sqlalchemy.exc import SQLAlchemyError
 
-from fd_device.celery_runner import app
-from fd_device.controller.connection import Connection, Message
+from fd_device.controller.brokers import BrokerList
+from fd_device.controller.channels import ChannelManager
+from fd_device.controller.connection import Connection, Message, Publisher
+from fd_device.controller.dispatch import CommandDispatcher
+from fd_device.controller.rate_limit import RateLimiter
 from fd_device.database.base import get_session
+from fd_device.database.database import SINGLETON_CACHE
 from fd_device.database.device import Connection as db_Connection
-from fd_device.database.device import Device
-from fd_device.device.update import get_device_info
+from fd_device.database.device import Device, Grainbin
+from fd_device.device.gateway import Gateway, run_peer
+from fd_device.device.health import HealthMonitor
+from fd_device.device.heartbeat import HeartbeatState, UdpHeartbeat, encode_device_id
+from fd_device.device.runtime import RuntimeSettings
+from fd_device.device.schedule import Schedule
+from fd_device.device.snapshot import read_snapshot, write_snapshot
+from fd_device.device.update import get_device_changes, get_device_info
+from fd_device.grainbin.sweep import GrainbinSweep
+from fd_device.grainbin.update import read_grainbin, sensor_index
+from fd_device.settings import get_config
+from fd_device.system.sensor_files import configure_sensor_files
+from fd_device.system.startup_profile import STARTUP_PROFILE
 
 LOGGER = logging.getLogger("fd.device.service")
 
 
 class DeviceConnection(Connection):
-    """Communicate with the Server via RabbitMQ."""
+    """Communicate with the Server via RabbitMQ.
+
+    Heartbeats, server commands, alarms and bulk data each get a channel of
+    their own from a ChannelManager, so latency critical traffic never waits
+    behind a large publish.
+    """
+
+    # the channel lanes, and whether publisher confirms are used on each of them
+    CHANNEL_LANES = {"heartbeat": True, "command": False, "alarm": True, "bulk": True}
 
     def __init__(self, logger):
         """Overwrite the Connection __init__."""
@@ -25,56 +53,441 @@ class DeviceConnection(Connection):
         # pylint: disable=invalid-name
         self.HEARTBEAT_MESSGES = None
         self.SERVER_MESSAGES = None
+        self.ALARM_MESSAGES = None
+        self.BULK_MESSAGES = None
+        self.GATEWAY_MESSAGES = None
+        self.SWEEP = None
+        self.GATEWAY = None
+
+        self.channels = None
 
         self._session = get_session()
-        self._host = self._session.query(db_Connection.address).scalar()
 
-    def on_channel_open(self, channel):
-        """Overwrite the on_channel_open method.
+        # the known brokers, best first, to fail over through
+        config = get_config()
+        self.brokers = BrokerList(
+            port=self._port,
+            rerank_interval=config.BROKER_RERANK_INTERVAL,
+            probe_timeout=config.BROKER_PROBE_TIMEOUT,
+        )
+        self.heartbeat_transport = get_config().HEARTBEAT_TRANSPORT
+        # caps how fast each kind of traffic is published
+        self.rate_limiter = RateLimiter(get_config().RATE_LIMITS)
+        # the health summary sent with every heartbeat
+        self.health = HealthMonitor(get_config().HEALTH_REFRESH_INTERVAL)
+        # the heartbeat and sweep settings the server can change
+        self.runtime = RuntimeSettings()
+
+        # start from the snapshot of the last good start if there is one,
+        # and reconcile with the database once the channels are open
+        self.warm_start = read_snapshot(config.WARM_START_FILE)
+        if self.warm_start:
+            self.restore_snapshot(self.warm_start)
+        else:
+            self.load_state(self._session)
+        for address in [self._host] + config.RABBITMQ_ADDRESSES:
+            self.brokers.add(address)
+        self._host = self.brokers.best() or self._host
+        self.runtime.add_listener(self.on_runtime_settings)
+
+        self._snapshot_stop = threading.Event()
+        self._snapshot_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="fd-snapshot"
+        )
+
+    def load_state(self, session):
+        """Load the device_id, brokers and runtime settings from the database."""
+        connection = SINGLETON_CACHE.get(session, db_Connection)
+        self._host = connection.address if connection else None
+        device = SINGLETON_CACHE.get(session, Device)
+        self.device_id = device.device_id if device else None
+        self.brokers.load(session)
+        # places the heartbeats and sweeps at this device's phase in their interval
+        self.schedule = Schedule(self.device_id)
+        self.runtime.load(session)
+
+    def restore_snapshot(self, snapshot):
+        """Load the device_id, brokers, schedule and runtime settings from a snapshot."""
+        self.LOGGER.info("Warm starting from the snapshot of the last start")
+        self._host = snapshot.get("address")
+        self.device_id = snapshot["device_id"]
+        for address in snapshot.get("brokers", []):
+            self.brokers.add(address)
+        self.schedule = Schedule(self.device_id)
+        schedule = snapshot.get("schedule") or {}
+        if schedule.get("slot") is not None:
+            self.schedule.set_slot(schedule["slot"], schedule["slot_count"])
+        self.runtime.restore(snapshot.get("runtime") or {})
+
+    def take_snapshot(self) -> dict:
+        """Return what the next start needs. This lists the sensors, so use a worker thread."""
+        return {
+            "device_id": self.device_id,
+            "address": self._host,
+            "brokers": self.brokers.ranked(),
+            "sensors": sensor_index(),
+            "schedule": self.schedule.info(),
+            "runtime": self.runtime.snapshot(),
+            "written_at": dt.datetime.now(),
+        }
+
+    def save_snapshot(self):
+        """Reconcile a warm start with the database, then write the snapshot.
+
+        This runs on the snapshot worker thread. A warm start retries the
+        database every WARM_START_RETRY seconds until it is up.
+        """
+        config = get_config()
+        while self.warm_start and not self._snapshot_stop.is_set():
+            try:
+                self.reconcile()
+            except SQLAlchemyError as error:
+                self.LOGGER.info(
+                    f"Database not ready to reconcile the warm start: {error}"
+                )
+                self._snapshot_stop.wait(config.WARM_START_RETRY)
+        if self._snapshot_stop.is_set():
+            return
+        try:
+            write_snapshot(config.WARM_START_FILE, self.take_snapshot())
+        except Exception:  # noqa: B902  pylint: disable=broad-except
+            self.LOGGER.exception("Error writing the snapshot")
+
+    def reconcile(self):
+        """Load the brokers and runtime settings of the database over the warm start."""
+        session = get_session()
+        try:
+            device = SINGLETON_CACHE.get(session, Device)
+            self.brokers.load(session)
+            self.runtime.load(session)
+        finally:
+            session.close()
+        device_id = device.device_id if device else None
+        if device_id != self.device_id:
+            self.LOGGER.warning(
+                f"The device_id changed from {self.device_id} to {device_id}, "
+                "it is used from the next start"
+            )
+            self.device_id = device_id
+        self.warm_start = None
+        self.LOGGER.info("Reconciled the warm start with the database")
+        self.on_runtime_settings(self.runtime.snapshot())
+
+    def on_connection_open(self, _unused_connection):
+        """Overwrite the on_connection_open method to record the broker as connected.
 
-        Run normal commands, then create the HEARTBEAT_MESSAGES
-        and SERVER_MESSAGES objects.
+        The next startup then only needs a TCP probe to trust this address.
         """
-        super().on_channel_open(channel)
+        STARTUP_PROFILE.mark("connection_open")
+        self.submit_remember_connected(True)
+        super().on_connection_open(_unused_connection)
+
+    def on_connection_open_error(self, _unused_connection, err):
+        """Overwrite the on_connection_open_error method to clear the connected state."""
+        self.submit_remember_connected(False)
+        super().on_connection_open_error(_unused_connection, err)
+
+    def submit_remember_connected(self, connected):
+        """Save the connected state on the snapshot worker, never on the IOLoop."""
+        if not self._snapshot_stop.is_set():
+            self._snapshot_executor.submit(
+                self.remember_connected, connected, self._host
+            )
+
+    def remember_connected(self, connected, host):
+        """Save whether the connection to a broker succeeded.
+
+        This runs on the snapshot worker thread, as the database may not be up
+        yet after a warm start; the snapshot then records the broker instead.
+        """
+        session = get_session()
+        try:
+            row = session.query(db_Connection).first()
+            if row is None:
+                return
+            if connected:
+                row.update(session, address=host, is_connected=True)
+            else:
+                row.update(session, is_connected=False)
+        except SQLAlchemyError as error:
+            session.rollback()
+            self.LOGGER.debug(f"Could not save the connected state: {error}")
+        finally:
+            session.close()
+
+    def open_channel(self):
+        """Overwrite the open_channel method.
+
+        Open a channel for every lane in CHANNEL_LANES. UDP heartbeats
+        do not need the heartbeat lane, and a gateway adds a gateway lane.
+        A device_id too long for a UDP heartbeat datagram falls back to
+        AMQP heartbeats.
+        """
+        if self.heartbeat_transport == "udp":
+            try:
+                encode_device_id(self.device_id)
+            except ValueError as error:
+                self.LOGGER.error(f"{error}, using AMQP heartbeats instead of UDP")
+                self.heartbeat_transport = "amqp"
+        lanes = dict(self.CHANNEL_LANES)
+        if self.heartbeat_transport == "udp":
+            del lanes["heartbeat"]
+        if get_config().GATEWAY_MODE == "gateway":
+            # publisher confirms are tracked per channel, so the gateway
+            # publisher cannot share the bulk channel
+            lanes["gateway"] = True
+        self.channels = ChannelManager(
+            self._connection, self.LOGGER, lanes, self.on_channels_open
+        )
+        self.channels.open(on_channel_closed=self.on_channel_closed)
 
-        self.HEARTBEAT_MESSGES = HeartbeatMessage(
-            self._connection, self._channel, self._session
+    def on_channels_open(self):
+        """Invoked once the channel of every lane is open.
+
+        Create the HEARTBEAT_MESSAGES, SERVER_MESSAGES, ALARM_MESSAGES
+        and BULK_MESSAGES objects, each on its own channel, and start
+        the grainbin SWEEP. With the 'udp' HEARTBEAT_TRANSPORT, heartbeats
+        are sent as UDP datagrams to the server instead.
+        """
+        STARTUP_PROFILE.mark("channels_open")
+        config = get_config()
+        self._channel = self.channels.get("command")
+
+        # the objects from a previous connection have threads to stop
+        if self.SERVER_MESSAGES:
+            self.SERVER_MESSAGES.dispatcher.shutdown(wait=False)
+        if self.SWEEP:
+            self.SWEEP.stop()
+        if self.GATEWAY:
+            self.GATEWAY.stop()
+        for publisher in (
+            self.HEARTBEAT_MESSGES,
+            self.ALARM_MESSAGES,
+            self.BULK_MESSAGES,
+            self.GATEWAY_MESSAGES,
+        ):
+            if publisher:
+                publisher.set_stopping(True)
+
+        if self.heartbeat_transport == "udp":
+            self.HEARTBEAT_MESSGES = UdpHeartbeat(
+                self._connection.ioloop,
+                self._host,
+                self.device_id,
+                config.UDP_HEARTBEAT_PORT,
+                self.schedule,
+                self.health,
+            )
+            self.HEARTBEAT_MESSGES.start()
+        else:
+            self.HEARTBEAT_MESSGES = HeartbeatMessage(
+                self._connection,
+                self.channels.get("heartbeat"),
+                self.device_id,
+                self.flow_control,
+                self.schedule,
+                self.rate_limiter,
+                self.health,
+            )
+        self.SERVER_MESSAGES = ServerMessage(
+            self._connection,
+            self._channel,
+            self.device_id,
+            self.flow_control,
+            self.schedule,
+            self.runtime,
+        )
+        self.ALARM_MESSAGES = Publisher(
+            self._connection,
+            self.channels.get("alarm"),
+            logging.getLogger("fd.device.service.alarm"),
+            exchange_name="alarm_messages",
+            routing_key=f"{self.device_id}.alarm",
+            app_id=self.device_id,
+            confirm=self.channels.confirm("alarm"),
+            queue_name="alarm_events",
+            queue_binding="*.alarm",
+            max_priority=config.ALARM_MAX_PRIORITY,
+            flow_control=self.flow_control,
+            rate_limiter=self.rate_limiter,
+            traffic_class="alarm",
+        )
+        self.BULK_MESSAGES = Publisher(
+            self._connection,
+            self.channels.get("bulk"),
+            logging.getLogger("fd.device.service.bulk"),
+            exchange_name="bulk_messages",
+            routing_key=f"{self.device_id}.bulk",
+            app_id=self.device_id,
+            confirm=self.channels.confirm("bulk"),
+            flow_control=self.flow_control,
+            rate_limiter=self.rate_limiter,
+            traffic_class="bulk",
+        )
+        self.SWEEP = GrainbinSweep(
+            self._connection,
+            self.BULK_MESSAGES,
+            logging.getLogger("fd.device.service.sweep"),
+            config.SWEEP_INTERVAL,
+            self.schedule,
+            self.flow_control,
+        )
+        self.apply_runtime_settings(self.runtime.snapshot())
+        if self.warm_start:
+            self.SWEEP.sensor_index = self.warm_start.get("sensors")
+        self.SWEEP.start()
+
+        self.health.publishers = [self.ALARM_MESSAGES, self.BULK_MESSAGES]
+        if config.GATEWAY_MODE == "gateway":
+            self.start_gateway()
+        self.health.sweep = self.SWEEP
+        self.health.commands = self.SERVER_MESSAGES.dispatcher.metrics
+        self.health.start(self._connection.ioloop)
+        self.brokers.start(self._connection.ioloop, get_session)
+        self._snapshot_executor.submit(self.save_snapshot)
+
+    def start_gateway(self):
+        """Forward the heartbeats and updates of peer devices, in batches on the gateway channel."""
+        config = get_config()
+        self.GATEWAY_MESSAGES = Publisher(
+            self._connection,
+            self.channels.get("gateway"),
+            logging.getLogger("fd.device.service.gateway"),
+            exchange_name="gateway_messages",
+            routing_key=f"{self.device_id}.gateway",
+            app_id=self.device_id,
+            confirm=self.channels.confirm("gateway"),
+            flow_control=self.flow_control,
         )
-        self.SERVER_MESSAGES = ServerMessage(self._channel)
+        self.GATEWAY = Gateway(
+            self._connection,
+            self.GATEWAY_MESSAGES,
+            self.device_id,
+            port=config.GATEWAY_PORT,
+            batch_size=config.GATEWAY_BATCH_SIZE,
+            flush_interval=config.GATEWAY_FLUSH_INTERVAL,
+        )
+        self.GATEWAY.start()
+        self.health.publishers.append(self.GATEWAY_MESSAGES)
+
+    def on_runtime_settings(self, settings):
+        """Invoked from a command worker thread when the server changes the runtime settings."""
+        if self._connection:
+            self._connection.ioloop.add_callback_threadsafe(
+                functools.partial(self.apply_runtime_settings, settings)
+            )
+
+    def apply_runtime_settings(self, settings):
+        """Apply the runtime settings. They take effect at the next heartbeat and sweep."""
+        if self.HEARTBEAT_MESSGES:
+            self.HEARTBEAT_MESSGES.HEARTBEAT_INTERVAL = settings["heartbeat_interval"]
+        if self.SWEEP:
+            self.SWEEP.configure(settings)
+
+    def close_channel(self):
+        """Overwrite the close_channel method to close the channel of every lane."""
+        self.LOGGER.debug("Closing the channels")
+        if self.channels:
+            self.channels.close()
 
     def stop(self):
         """Overwrite the stop method.
 
-        Stop the HEARTBEAT_MESSAGES and SERVER_MESSAGES objects, then
+        Stop the SWEEP, the health refreshes, the broker reranks, the snapshot and the HEARTBEAT_MESSAGES,
+        SERVER_MESSAGES, ALARM_MESSAGES and BULK_MESSAGES objects, then
         stop the rest of the items.
         """
+        self.SWEEP.stop()
+        self.health.stop()
+        self.brokers.stop()
+        self._snapshot_stop.set()
+        self._snapshot_executor.shutdown(wait=False)
+        if self.GATEWAY:
+            self.GATEWAY.stop()
+            self.GATEWAY_MESSAGES.set_stopping(True)
         self.HEARTBEAT_MESSGES.set_stopping(True)
+        self.ALARM_MESSAGES.set_stopping(True)
+        self.BULK_MESSAGES.set_stopping(True)
         self.SERVER_MESSAGES.set_stopping(True)
         self.SERVER_MESSAGES.stop_consuming()
+        self.SERVER_MESSAGES.dispatcher.shutdown(wait=False)
 
         self._session.close()
         super().stop()
 
 
 class ServerMessage(Message):
-    """Receive and respond to messages."""
-
-    def __init__(self, channel):
+    """Receive and respond to messages.
+
+    Commands are handled by a CommandDispatcher so that slow handlers do not
+    block the IOLoop. Messages are acknowledged once their handler has finished,
+    and basic_qos limits how many unacknowledged commands the broker sends.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        connection,
+        channel,
+        device_id,
+        flow_control=None,
+        schedule=None,
+        runtime=None,
+    ):
         """Override the __init__ method from Message class.
 
         Create the logger instance, and se the required config info.
+        Commands for every device use the 'all.' routing key prefix, and
+        commands for this device use the device_id as the prefix.
+        The set_schedule and configure commands are handled if a schedule
+        and RuntimeSettings are given.
         Call the setup_exchange function to start the communication.
         """
-        super().__init__(channel)
+        super().__init__(channel, flow_control)
 
         self.LOGGER = logging.getLogger("fd.device.service.messages")
 
+        config = get_config()
+        self.prefetch_count = config.COMMAND_PREFETCH
+
         self.exchange_name = "device_messages"
         self.exchange_type = "topic"
         self.routing_key = "all.create"
+        self.routing_keys = ["all.create", f"{device_id}.*"]
+
+        self.dispatcher = CommandDispatcher(
+            connection, self.LOGGER, max_workers=config.COMMAND_WORKERS
+        )
+        self.dispatcher.register("create", handle_create)
+        self.dispatcher.register("read_now", handle_read_now)
+        self.dispatcher.register("sync", handle_sync)
+        if schedule is not None:
+            self.dispatcher.register(
+                "set_schedule", functools.partial(handle_set_schedule, schedule)
+            )
+        if runtime is not None:
+            self.dispatcher.register(
+                "configure", functools.partial(handle_configure, runtime)
+            )
 
         self.setup_exchange(self.exchange_name)
 
+    def on_bindok(self, unused_frame):
+        """Overwrite from the Message class.
+
+        Limit the number of unacknowledged commands with basic_qos
+        before starting to consume.
+        """
+        self.LOGGER.debug("Queue bound")
+        self._channel.basic_qos(
+            prefetch_count=self.prefetch_count, callback=self.on_basic_qos_ok
+        )
+
+    def on_basic_qos_ok(self, unused_frame):
+        """Invoked by pika when the Basic.QoS method has completed."""
+        self.LOGGER.debug(f"QOS set to: {self.prefetch_count}")
+        self.start_consuming()
+
     def on_message(self, unused_channel, basic_deliver, properties, body):
         """Invoked by pika when a message is delivered from RabbitMQ.
 
@@ -84,45 +497,197 @@ class ServerMessage(Message):
         instance of BasicProperties with the message properties and the body
         is the message that was sent.
 
+        The command is handed to the dispatcher and the message is acknowledged
+        in on_command_complete once the handler is done.
+
         :param pika.channel.Channel unused_channel: The channel object
         :param pika.Spec.Basic.Deliver: basic_deliver method
         :param pika.Spec.BasicProperties: properties
         :param str|unicode body: The message body
 
         """
-        payload = json.loads(body)
-        command = payload["command"]
+        try:
+            payload = json.loads(body)
+            command = payload["command"]
+        except (ValueError, KeyError, TypeError):
+            LOGGER.warning(f"Invalid message with key {basic_deliver.routing_key}")
+            self.acknowledge_message(basic_deliver.delivery_tag)
+            return
 
         LOGGER.debug(f"Received {command} command with key {basic_deliver.routing_key}")
-        if command == "create":
-            info = get_device_info()
-            LOGGER.info("sending create task")
-            value = app.send_task(name="device.create", args=(info,))
-            print(value)
-            LOGGER.info("create task sent")
-            # LOGGER.info(f'return value {value.get()}')
+        self.dispatcher.dispatch(
+            command,
+            payload,
+            properties,
+            functools.partial(
+                self.on_command_complete, basic_deliver.delivery_tag, properties
+            ),
+        )
 
-        self._channel.basic_ack(basic_deliver.delivery_tag)
+    def on_command_complete(self, delivery_tag, properties, reply):
+        """Send the reply (if any) and acknowledge the message.
 
+        This is always called on the IOLoop thread.
+        """
+        if self._channel is None or self._channel.is_closed:
+            LOGGER.warning(f"Channel closed before message {delivery_tag} was acked")
+            return
 
-class HeartbeatMessage(Message):
-    """Send heartbeat messages to the server."""
+        if reply is not None and properties.reply_to:
+            self._channel.basic_publish(
+                exchange="",
+                routing_key=properties.reply_to,
+                body=json.dumps(reply, ensure_ascii=False, default=str),
+                properties=pika.BasicProperties(
+                    content_type="application/json",
+                    correlation_id=properties.correlation_id,
+                ),
+            )
 
-    # pylint: disable=too-many-instance-attributes
+        self.acknowledge_message(delivery_tag)
+
+
+def handle_create(unused_payload, unused_properties):
+    """Send the device information to the server in a create task."""
+
+    # celery is only needed for the rare create command, so it is imported here
+    from fd_device.celery_runner import app  # pylint: disable=import-outside-toplevel
+
+    info = get_device_info()
+    LOGGER.info("sending create task")
+    app.send_task(name="device.create", args=(info,))
+    LOGGER.info("create task sent")
+
+
+def handle_sync(payload, unused_properties):
+    """Reply with the sections of the device state that changed since a version.
+
+    The payload has the 'since' version the server last synced, from a
+    create task or an earlier sync reply. Without it every section is sent.
+    """
+
+    reply = {"command": "sync"}
+    since = payload.get("since")
+    if since is not None and (isinstance(since, bool) or not isinstance(since, int)):
+        LOGGER.warning(f"Invalid sync command: {payload}")
+        reply["error"] = "since must be a version number"
+        return reply
+
+    reply.update(get_device_changes(since))
+    return reply
+
+
+def handle_read_now(payload, unused_properties):
+    """Read a grainbin (or a single sensor of a grainbin) and reply with the readings.
+
+    The payload must have either a 'grainbin' name or a 'bus_number'. It can
+    also have a 'sensor' to only read one sensor, and a 'max_age' in seconds
+    for how old a cached reading can be (defaults to READ_NOW_MAX_AGE).
+    """
+
+    bus_number = payload.get("bus_number")
+    if bus_number is None and "grainbin" in payload:
+        session = get_session()
+        bus_number = (
+            session.query(Grainbin.bus_number)
+            .filter_by(name=payload["grainbin"])
+            .scalar()
+        )
+        session.close()
+
+    reply = {"command": "read_now"}
+    if bus_number is None:
+        LOGGER.warning(f"read_now command for unknown grainbin: {payload}")
+        reply["error"] = "unknown grainbin"
+        return reply
 
-    HEARTBEAT_INTERVAL = 5
-    TIMEOUT = 3
-    MAX_MISSED_TIMEOUTS = 3
-    # state can be 'disconnected', 'connected', 'new'
-    STATE = "disconnected"
+    sensor = payload.get("sensor")
+    max_age = payload.get("max_age", get_config().READ_NOW_MAX_AGE)
+    try:
+        bus_number = int(bus_number)
+        if sensor is not None and (not isinstance(sensor, str) or "/" in sensor):
+            raise ValueError("sensor must be a sensor id")
+        if isinstance(max_age, bool) or not isinstance(max_age, (int, float)):
+            raise ValueError("max_age must be a number of seconds")
+    except (TypeError, ValueError) as error:
+        LOGGER.warning(f"Invalid read_now command: {payload}")
+        reply["error"] = str(error)
+        return reply
+
+    reply.update(read_grainbin(bus_number, sensor, max_age))
+    return reply
+
+
+def handle_set_schedule(schedule, payload, unused_properties):
+    """Set the schedule slot pushed by the server.
+
+    The payload has a 'slot' and a 'slot_count', or 'slot' set to None to go
+    back to the offset derived from the device_id. The new slot is used from
+    the next scheduled heartbeat and sweep.
+    """
+
+    reply = {"command": "set_schedule"}
+    try:
+        if payload.get("slot") is None:
+            schedule.clear_slot()
+        else:
+            schedule.set_slot(payload["slot"], payload["slot_count"])
+    except (KeyError, TypeError, ValueError) as error:
+        LOGGER.warning(f"Invalid set_schedule command: {error}")
+        reply["error"] = str(error)
+
+    reply.update(schedule.info())
+    return reply
+
+
+def handle_configure(runtime, payload, unused_properties):
+    """Change the runtime settings pushed by the server.
+
+    The payload can have any of 'heartbeat_interval', 'sweep_interval',
+    'sweep_resolution', 'sweep_deadband' and 'sweep_batch_size'. A value of
+    None goes back to the default. The settings are saved to the database and
+    used from the next scheduled heartbeat and sweep.
+    """
+
+    reply = {"command": "configure"}
+    changes = {name: value for name, value in payload.items() if name != "command"}
+    session = get_session()
+    try:
+        reply.update(runtime.update(session, changes))
+    except ValueError as error:
+        LOGGER.warning(f"Invalid configure command: {error}")
+        reply["error"] = str(error)
+        reply.update(runtime.snapshot())
+    finally:
+        session.close()
+    return reply
+
+
+class HeartbeatMessage(HeartbeatState, Message):
+    """Send heartbeat messages to the server over AMQP."""
+
+    # pylint: disable=too-many-instance-attributes
 
-    def __init__(self, connection, channel, session):
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        connection,
+        channel,
+        device_id,
+        flow_control=None,
+        schedule=None,
+        rate_limiter=None,
+        health=None,
+    ):
         """Overwrite the __init__ method from Message class.
 
         Creat the logger instance, and set the required config info.
+        If a schedule is given, heartbeats are sent at this device's
+        phase within the HEARTBEAT_INTERVAL. If a HealthMonitor is given,
+        its summary is sent with every heartbeat.
         Call the setup_exchange function to start the communication.
         """
-        super().__init__(channel)
+        super().__init__(channel, flow_control, rate_limiter, "heartbeat")
 
         self.LOGGER = logging.getLogger("fd.device.service.heartbeat")
 
@@ -134,8 +699,9 @@ class HeartbeatMessage(Message):
         self._response = False
         self._corr_id = None
         self._timeouts_missed = 0
-        self._session = session
-        self.device_id = self._session.query(Device.device_id).scalar()
+        self._schedule = schedule
+        self._health = health
+        self.device_id = device_id
 
         # communication parameters
         self.exchange_name = "heartbeat_messages"
@@ -162,6 +728,7 @@ class HeartbeatMessage(Message):
 
     def start_publishing(self):
         """This method will enable delivery confirmations and schedule the first message to be sent to RabbitMQ."""
+        STARTUP_PROFILE.mark("declare")
         self.LOGGER.info("Issuing consumer related RPC commands")
         self.enable_delivery_confirmations()
         self.schedule_next_message()
@@ -209,13 +776,14 @@ class HeartbeatMessage(Message):
         # )
 
     def schedule_next_message(self):
-        """If not closing connection to RabbitMQ, schedule another message in PUBLISH_INTERVAL seconds."""
+        """If not closing connection to RabbitMQ, schedule another message at the next heartbeat tick."""
         if self._stopping:
             return
-        # LOGGER.debug(f'Scheduling next message for {self.HEARTBEAT_INTERVAL} seconds')
-        self._connection.ioloop.call_later(
-            self.HEARTBEAT_INTERVAL, self.publish_message
-        )
+        delay = self.HEARTBEAT_INTERVAL
+        if self._schedule is not None:
+            delay = self._schedule.next_delay(self.HEARTBEAT_INTERVAL)
+        # LOGGER.debug(f'Scheduling next message for {delay} seconds')
+        self._connection.ioloop.call_later(delay, self.publish_message)
 
     def publish_message(self):
         """If the class is not stopping, publish a message to RabbitMQ.
@@ -230,6 +798,9 @@ class HeartbeatMessage(Message):
         delivery intervals by changing the PUBLISH_INTERVAL constant in the
         class.
 
+        While RabbitMQ has blocked the connection, or the heartbeat rate
+        limit is used up, heartbeats are skipped (and not counted as timeouts).
+
         """
         if self._stopping:
             return
@@ -237,6 +808,8 @@ class HeartbeatMessage(Message):
         self._response = False
 
         message = {"heartbeat": self._message_number}
+        if self._health is not None:
+            message["health"] = self._health.summary()
 
         self._corr_id = str(uuid.uuid4())
 
@@ -247,12 +820,11 @@ class HeartbeatMessage(Message):
             correlation_id=self._corr_id,
         )
 
-        self._channel.basic_publish(
-            exchange=self.exchange_name,
-            routing_key=self.routing_key,
-            body=json.dumps(message, ensure_ascii=False),
-            properties=properties,
-        )
+        if not self.publish(json.dumps(message, ensure_ascii=False), properties):
+            self.LOGGER.debug("Heartbeat held back, skipping heartbeat")
+            self.schedule_next_message()
+            return
+
         self._message_number += 1
         self._deliveries.append(self._message_number)
         # self.LOGGER.debug(f'Published heartbeat message # {self._message_number}')
@@ -263,32 +835,29 @@ class HeartbeatMessage(Message):
     def on_reply_received(self, _channel, _method, header, _body):
         """Method is triggered when a reply is received."""
         if self._corr_id == header.correlation_id:
-            self._response = True
-            self._timeouts_missed = 0
-            if not self.STATE == "connected":
-                self.STATE = "connected"
-                self.LOGGER.info("STATE connected")
-
-    def check_timeout(self):
-        """Check timeout status and update the state of the device."""
-        if not self._response:
-            self._timeouts_missed += 1
-            self.LOGGER.debug("Heartbeat timeout")
-
-        if self._timeouts_missed == self.MAX_MISSED_TIMEOUTS + 1:
-            self.LOGGER.warning(
-                f"More than {self.MAX_MISSED_TIMEOUTS} timeouts missed. STATE disconnected"
-            )
-            self.STATE = "disconnected"
+            self.on_heartbeat_reply()
 
 
 def run_connection():
-    """Run the device connection."""
+    """Run the device connection, or run as a peer of a gateway in the 'peer' GATEWAY_MODE.
 
-    device_connection = DeviceConnection(logger=LOGGER)
+    The sensor reads are recorded or replayed if the config asks for it.
+    """
 
+    STARTUP_PROFILE.mark("process_spawn")
+    sensor_files = configure_sensor_files(get_config())
     try:
-        device_connection.run()
-    except KeyboardInterrupt:
-        LOGGER.info("Stopping device connection")
-        device_connection.stop()
+        if get_config().GATEWAY_MODE == "peer":
+            run_peer()
+            return
+
+        device_connection = DeviceConnection(logger=LOGGER)
+        STARTUP_PROFILE.mark("device_connection")
+
+        try:
+            device_connection.run()
+        except KeyboardInterrupt:
+            LOGGER.info("Stopping device connection")
+            device_connection.stop()
+    finally:
+        sensor_files.close()
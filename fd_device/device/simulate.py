@@ -0,0 +1,367 @@
+"""Simulate a fleet of devices in one asyncio process.
+
+Every virtual device has its own connection, channels, HeartbeatMessage,
+bulk Publisher and GrainbinSweep, so the real heartbeat and update protocol
+is exercised. Only the grainbin readings are synthetic. The devices connect
+to a LocalBroker by default, or to a RabbitMQ server.
+"""
+import asyncio
+import datetime as dt
+import logging
+import random
+import time
+from typing import List
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+from fd_device.controller.channels import ChannelManager
+from fd_device.controller.connection import Publisher
+from fd_device.controller.flow import FlowControl
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+from fd_device.controller.rate_limit import RateLimiter
+from fd_device.device.schedule import Schedule
+from fd_device.device.service import HeartbeatMessage
+from fd_device.grainbin.sweep import GrainbinSweep
+from fd_device.settings import get_config
+
+LOGGER = logging.getLogger("fd.device.simulate")
+
+
+class AsyncioIOLoop:
+    """Give an asyncio event loop the IOLoop methods used by the messaging classes."""
+
+    def __init__(self, loop):
+        """Create the AsyncioIOLoop object.
+
+        :param loop: The asyncio event loop to run the callbacks on.
+        """
+        self._loop = loop
+
+    def call_later(self, delay, callback):
+        """Call the callback after delay seconds. Returns a handle for remove_timeout."""
+        return self._loop.call_later(delay, callback)
+
+    def remove_timeout(self, handle):  # pylint: disable=no-self-use
+        """Cancel a callback scheduled with call_later."""
+        handle.cancel()
+
+    def add_callback(self, callback):
+        """Call the callback on the next iteration of the loop."""
+        self._loop.call_soon(callback)
+
+    def add_callback_threadsafe(self, callback):
+        """Call the callback on the next iteration of the loop. Safe from any thread."""
+        self._loop.call_soon_threadsafe(callback)
+
+
+class SyntheticGrainbins:  # pylint: disable=too-few-public-methods
+    """Grainbin readings that wander like real sensors, in the read_grainbin format."""
+
+    def __init__(self, seed, grainbins=4, sensors=8):
+        """Create the SyntheticGrainbins object.
+
+        :param seed: Seeds the random walk, so a device always reads the same values.
+        :param int grainbins: The number of grainbins (busses).
+        :param int sensors: The number of sensors in each grainbin.
+        """
+        self._random = random.Random(seed)
+        self._sensors = {
+            bus_number: {
+                f"28.{self._random.getrandbits(48):012X}": self._random.uniform(5, 25)
+                for _ in range(sensors)
+            }
+            for bus_number in range(grainbins)
+        }
+
+    def read(self) -> List[dict]:
+        """Move every sensor a little and return the readings of each grainbin."""
+        now = dt.datetime.now()
+        readings = []
+        for bus_number, sensors in self._sensors.items():
+            for sensor_id in sensors:
+                sensors[sensor_id] += self._random.gauss(0, 0.2)
+            readings.append(
+                {
+                    "bus_number": bus_number,
+                    "sensors": [
+                        {
+                            "id": sensor_id,
+                            "temphigh": "30",
+                            "templow": "0",
+                            "temperature": f"{temperature:.2f}",
+                        }
+                        for sensor_id, temperature in sensors.items()
+                    ],
+                    "read_at": now,
+                    "cached": False,
+                    "age": 0.0,
+                }
+            )
+        return readings
+
+
+class SimulatedSweep(GrainbinSweep):
+    """A GrainbinSweep that reads SyntheticGrainbins on the IOLoop instead of the 1wire busses."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, connection, publisher, interval, schedule, grainbins):
+        """Create the SimulatedSweep object.
+
+        :param SyntheticGrainbins grainbins: Where the readings come from.
+        """
+        super().__init__(
+            connection,
+            publisher,
+            logging.getLogger("fd.device.simulate.sweep"),
+            interval,
+            schedule,
+            connection.flow_control,
+        )
+        self.grainbins = grainbins
+
+    def run_sweep(self):
+        """Read the synthetic grainbins and publish them, unless publishing is blocked."""
+        if self._stopping:
+            return
+        if self._flow_control.blocked:
+            self.skipped += 1
+            self.schedule_next_sweep()
+            return
+
+        start = time.monotonic()
+        readings = self.grainbins.read()
+        self.on_sweep_done(readings, time.monotonic() - start)
+
+
+class SimulatedHeartbeat(HeartbeatMessage):
+    """A HeartbeatMessage that counts the replies from the server."""
+
+    def __init__(self, *args, **kwargs):
+        """Create the SimulatedHeartbeat object."""
+        self.replies = 0
+        super().__init__(*args, **kwargs)
+
+    def on_heartbeat_reply(self):
+        """Count the reply, then handle it."""
+        self.replies += 1
+        super().on_heartbeat_reply()
+
+
+class VirtualDevice:  # pylint: disable=too-many-instance-attributes
+    """One simulated device: a connection with a heartbeat and a grainbin sweep.
+
+    The VirtualDevice stands in for the pika connection of the messaging
+    classes, so they schedule on the shared asyncio loop.
+    """
+
+    LANES = {"heartbeat": True, "bulk": True}
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self, device_id, ioloop, heartbeat_interval, sweep_interval, grainbins
+    ):
+        """Create the VirtualDevice object.
+
+        :param str device_id: The id of the virtual device.
+        :param AsyncioIOLoop ioloop: The loop every virtual device runs on.
+        :param float heartbeat_interval: Seconds between heartbeats.
+        :param float sweep_interval: Seconds between grainbin sweeps.
+        :param SyntheticGrainbins grainbins: The grainbins of the device.
+        """
+        self.LOGGER = logging.getLogger("fd.device.simulate.device")
+        self.device_id = device_id
+        self.ioloop = ioloop
+        self.heartbeat_interval = heartbeat_interval
+        self.sweep_interval = sweep_interval
+        self.grainbins = grainbins
+
+        self.schedule = Schedule(device_id)
+        self.flow_control = FlowControl()
+        self.rate_limiter = RateLimiter(get_config().RATE_LIMITS)
+        self.connection = None
+        self.channels = None
+        self.heartbeat = None
+        self.publisher = None
+        self.sweep = None
+        self.error = None
+
+    def open(self, connection):
+        """Open a channel for every lane on a connection that has just opened."""
+        self.connection = connection
+        connection.add_on_connection_blocked_callback(
+            lambda _connection, method_frame: self.flow_control.block(
+                method_frame.method.reason
+            )
+        )
+        connection.add_on_connection_unblocked_callback(
+            lambda _connection, _method_frame: self.flow_control.unblock()
+        )
+        self.channels = ChannelManager(
+            connection, self.LOGGER, self.LANES, self.on_channels_open
+        )
+        self.channels.open()
+
+    def on_open_error(self, _connection, error):
+        """Record why the connection could not be opened."""
+        self.error = error
+        self.LOGGER.warning(f"{self.device_id} could not connect: {error}")
+
+    def on_channels_open(self):
+        """Start the heartbeats and sweeps."""
+        self.heartbeat = SimulatedHeartbeat(
+            self,
+            self.channels.get("heartbeat"),
+            self.device_id,
+            self.flow_control,
+            self.schedule,
+            self.rate_limiter,
+        )
+        self.heartbeat.HEARTBEAT_INTERVAL = self.heartbeat_interval
+        self.publisher = Publisher(
+            self,
+            self.channels.get("bulk"),
+            logging.getLogger("fd.device.simulate.bulk"),
+            exchange_name="bulk_messages",
+            routing_key=f"{self.device_id}.bulk",
+            app_id=self.device_id,
+            confirm=self.channels.confirm("bulk"),
+            flow_control=self.flow_control,
+            rate_limiter=self.rate_limiter,
+            traffic_class="bulk",
+        )
+        self.sweep = SimulatedSweep(
+            self, self.publisher, self.sweep_interval, self.schedule, self.grainbins
+        )
+        self.sweep.start()
+
+    def stop(self):
+        """Stop the heartbeats and sweeps and close the connection."""
+        if self.sweep:
+            self.sweep.stop()
+            self.heartbeat.set_stopping(True)
+            self.publisher.set_stopping(True)
+        if self.connection is not None and self.connection.is_open:
+            self.connection.close()
+
+    def results(self, elapsed) -> dict:
+        """Return what the device published in elapsed seconds."""
+        heartbeats = replies = updates = outbox = 0
+        if self.heartbeat:
+            heartbeats = self.heartbeat.sent
+            replies = self.heartbeat.replies
+            updates = self.publisher.acked
+            outbox = self.publisher.outbox_depth
+        return {
+            "device_id": self.device_id,
+            "state": self.heartbeat.STATE if self.heartbeat else "not connected",
+            "heartbeats": heartbeats,
+            "replies": replies,
+            "updates": updates,
+            "outbox": outbox,
+            "sweeps": self.sweep.sweep_count if self.sweep else 0,
+            "messages_per_second": (heartbeats + updates) / elapsed,
+        }
+
+
+def connect_local(broker, device, ioloop):
+    """Connect a virtual device to a LocalBroker."""
+    LocalConnection(
+        broker,
+        on_open_callback=device.open,
+        on_open_error_callback=device.on_open_error,
+        ioloop=ioloop,
+    )
+
+
+def connect_rabbitmq(host, device, loop):
+    """Connect a virtual device to a RabbitMQ server on the asyncio loop."""
+    config = get_config()
+    params = pika.ConnectionParameters(
+        host=host,
+        virtual_host=config.RABBITMQ_VHOST,
+        credentials=pika.PlainCredentials(
+            config.RABBITMQ_USER, config.RABBITMQ_PASSWORD
+        ),
+        blocked_connection_timeout=config.RABBITMQ_BLOCKED_TIMEOUT,
+    )
+    AsyncioConnection(
+        parameters=params,
+        on_open_callback=device.open,
+        on_open_error_callback=device.on_open_error,
+        custom_ioloop=loop,
+    )
+
+
+async def simulate(  # pylint: disable=too-many-arguments
+    devices: int,
+    duration: float,
+    heartbeat_interval: float = 5,
+    sweep_interval: float = 30,
+    grainbins: int = 4,
+    sensors: int = 8,
+    host: str = None,
+) -> dict:
+    """Run virtual devices on the running asyncio loop for a duration.
+
+    Args:
+        devices (int): The number of virtual devices.
+        duration (float): How long to run for in seconds.
+        heartbeat_interval (float, optional): Seconds between heartbeats. Defaults to 5.
+        sweep_interval (float, optional): Seconds between grainbin sweeps. Defaults to 30.
+        grainbins (int, optional): The number of grainbins of each device. Defaults to 4.
+        sensors (int, optional): The number of sensors in each grainbin. Defaults to 8.
+        host (str, optional): The RabbitMQ server to connect to. Defaults to a LocalBroker.
+
+    Returns:
+        dict: The results of each device under 'devices', and the fleet totals under 'total'.
+    """
+    loop = asyncio.get_running_loop()
+    ioloop = AsyncioIOLoop(loop)
+
+    broker = None
+    if host is None:
+        broker = LocalBroker()
+        # answer heartbeats like the server does
+        broker.add_responder("heartbeat_messages", "heartbeat", lambda _, body: body)
+
+    fleet = []
+    for number in range(devices):
+        device_id = f"sim-{number:05d}"
+        device = VirtualDevice(
+            device_id,
+            ioloop,
+            heartbeat_interval,
+            sweep_interval,
+            SyntheticGrainbins(device_id, grainbins, sensors),
+        )
+        if broker is not None:
+            connect_local(broker, device, ioloop)
+        else:
+            connect_rabbitmq(host, device, loop)
+        fleet.append(device)
+
+    LOGGER.info(f"Simulating {devices} devices for {duration} seconds")
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    elapsed = time.perf_counter() - start
+
+    results = [device.results(elapsed) for device in fleet]
+    for device in fleet:
+        device.stop()
+    # let the connections close
+    await asyncio.sleep(0)
+
+    total = {
+        key: sum(result[key] for result in results)
+        for key in ("heartbeats", "replies", "updates", "outbox", "sweeps")
+    }
+    total["connected"] = sum(result["state"] == "connected" for result in results)
+    total["messages_per_second"] = (total["heartbeats"] + total["updates"]) / elapsed
+    total["elapsed"] = elapsed
+    return {"devices": results, "total": total}
+
+
+def run_simulation(devices: int, duration: float, **kwargs) -> dict:
+    """Run the simulation on a new asyncio loop. See simulate for the arguments."""
+    return asyncio.run(simulate(devices, duration, **kwargs))
@@ -0,0 +1,67 @@
+"""A local snapshot of what the device needs to start, so it can start before the database.
+
+The snapshot holds the device_id, the last broker connected to and the
+ranked brokers, the sensor index (the sensors on each bus), the schedule
+slot and the runtime settings. It is written after every successful start,
+and read at the next start so the heartbeats and sweeps can begin while
+the database comes up. The database is reconciled with afterwards.
+"""
+import json
+import logging
+import os
+from typing import Optional
+
+LOGGER = logging.getLogger("fd.device.snapshot")
+
+SNAPSHOT_VERSION = 1
+
+
+def read_snapshot(path: str) -> Optional[dict]:
+    """Read the snapshot file.
+
+    Args:
+        path (str): The snapshot file. None disables the snapshot.
+
+    Returns:
+        Optional[dict]: The snapshot, or None if there is no usable snapshot.
+    """
+    if not path:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        LOGGER.warning(f"Ignoring the snapshot {path}: {error}")
+        return None
+
+    if not isinstance(snapshot, dict):
+        snapshot = {}
+    if snapshot.get("version") != SNAPSHOT_VERSION or not snapshot.get("device_id"):
+        LOGGER.warning(
+            f"Ignoring the snapshot {path}: not a version {SNAPSHOT_VERSION} snapshot"
+        )
+        return None
+    return snapshot
+
+
+def write_snapshot(path: str, snapshot: dict):
+    """Write the snapshot file.
+
+    The snapshot is written to a temporary file that then replaces the old
+    one, so a power loss never leaves a partly written snapshot.
+
+    Args:
+        path (str): The snapshot file. None disables the snapshot.
+        snapshot (dict): The snapshot, without the version.
+    """
+    if not path:
+        return
+    snapshot = dict(snapshot, version=SNAPSHOT_VERSION)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, separators=(",", ":"), default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
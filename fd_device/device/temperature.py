@@ -1,4 +1,5 @@
 """Module to interface with the temperature sensors connected to the device."""
+from fd_device.system.sensor_files import get_backend
 
 
 def temperature(sensor_name, sample_number=3, percision=2):
@@ -18,18 +19,17 @@ def temperature(sensor_name, sample_number=3, percision=2):
 
 def _read_temperature(name):
     """Low level read the temperatures of a sensor."""
+    files = get_backend()
     w1_master_devices = "/sys/bus/w1/devices/w1_bus_master1/w1_master_slaves"
 
     # get connected sensors
-    with open(w1_master_devices) as f:
-        content = [line.rstrip("\n") for line in f]
+    content = [line.rstrip("\n") for line in files.read_lines(w1_master_devices)]
 
     if name in content:
         # sensor is connected
         sensor_file = "/sys/bus/w1/devices/" + name + "/w1_slave"
         try:
-            with open(sensor_file) as f:
-                lines = f.readlines()
+            lines = files.read_lines(sensor_file)
 
             temp_output = lines[1].find("t=")
             if temp_output != -1:
@@ -46,10 +46,10 @@ def _read_temperature(name):
 
 def get_connected_sensors(values=False):
     """Return all of the sensores connected to the device."""
+    files = get_backend()
     w1_master_devices = "/sys/bus/w1/devices/w1_bus_master1/w1_master_slaves"
     # get connected sensors
-    with open(w1_master_devices) as f:
-        content = [line.rstrip("\n") for line in f]
+    content = [line.rstrip("\n") for line in files.read_lines(w1_master_devices)]
 
     if values:
         values = {}
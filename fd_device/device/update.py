@@ -2,7 +2,13 @@
 import datetime
 
 from fd_device.database.base import get_session
-from fd_device.database.device import Device
+from fd_device.database.database import (
+    SINGLETON_CACHE,
+    SyncVersion,
+    current_sync_version,
+)
+from fd_device.database.device import Device, Grainbin
+from fd_device.database.system import Hardware, Interface, Software
 from fd_device.grainbin.update import get_grainbin_info
 
 
@@ -14,7 +20,7 @@ def get_device_info(session=None):
         close_session = True
         session = get_session()
 
-    device = session.query(Device).first()
+    device = SINGLETON_CACHE.get(session, Device)
     info = {}
 
     info["created_at"] = datetime.datetime.now()
@@ -24,6 +30,127 @@ def get_device_info(session=None):
 
     info["grainbin_count"] = device.grainbin_count
     info["grainbin_data"] = get_grainbin_info(session)
+    # the server asks for the changes since this version with a sync command
+    info["version"] = current_sync_version(session)
+
+    if close_session:
+        session.close()
+
+    return info
+
+
+def _columns(row, names):
+    return {name: getattr(row, name) for name in names} if row else None
+
+
+def get_device_section(session):
+    """Return the device section of the device state."""
+    device = SINGLETON_CACHE.get(session, Device)
+    info = _columns(
+        device,
+        (
+            "hardware_version",
+            "software_version",
+            "grainbin_count",
+            "interior_sensor",
+            "exterior_sensor",
+        ),
+    )
+    if info is not None:
+        info["id"] = device.device_id
+    return info
+
+
+def get_grainbins_section(session):
+    """Return the grainbins section of the device state."""
+    return [
+        _columns(grainbin, ("name", "bus_number", "average_temp", "last_updated"))
+        for grainbin in session.query(Grainbin).order_by(Grainbin.bus_number)
+    ]
+
+
+def get_hardware_section(session):
+    """Return the hardware section of the device state."""
+    return _columns(
+        SINGLETON_CACHE.get(session, Hardware),
+        (
+            "device_name",
+            "hardware_version",
+            "interior_sensor",
+            "exterior_sensor",
+            "serial_number",
+            "grainbin_reader_count",
+        ),
+    )
+
+
+def get_software_section(session):
+    """Return the software section of the device state."""
+    return _columns(
+        SINGLETON_CACHE.get(session, Software),
+        ("software_version", "software_version_last"),
+    )
+
+
+def get_interfaces_section(session):
+    """Return the interfaces section of the device state."""
+    return [
+        _columns(
+            interface,
+            ("interface", "is_active", "is_for_fm", "is_external", "state"),
+        )
+        for interface in session.query(Interface).order_by(Interface.interface)
+    ]
+
+
+# the sections of the device state, by the sync_section of their models
+SECTIONS = {
+    "device": get_device_section,
+    "grainbins": get_grainbins_section,
+    "hardware": get_hardware_section,
+    "software": get_software_section,
+    "interfaces": get_interfaces_section,
+}
+
+
+def get_device_changes(since=None, session=None):
+    """Return the sections of the device state that changed since a version.
+
+    Every section is returned (a full sync) if since is None, or if it is
+    newer than the current version, eg. after the device database was reset.
+
+    Args:
+        since (int, optional): The version the server last synced. Defaults to None.
+        session (Session, optional): The database session. Defaults to None.
+
+    Returns:
+        dict: The current 'version', whether it is a 'full' sync, and the changed 'sections'.
+    """
+
+    close_session = False
+    if not session:
+        close_session = True
+        session = get_session()
+
+    version = current_sync_version(session)
+    full = since is None or since > version
+    if full:
+        changed = list(SECTIONS)
+    else:
+        changed = [
+            section
+            for (section,) in session.query(SyncVersion.section).filter(
+                SyncVersion.version > since
+            )
+            if section in SECTIONS
+        ]
+
+    info = {
+        "created_at": datetime.datetime.now(),
+        "version": version,
+        "full": full,
+        "sections": {section: SECTIONS[section](session) for section in changed},
+    }
 
     if close_session:
         session.close()
@@ -0,0 +1,74 @@
+"""Cache of the most recent grainbin sensor readings."""
+import datetime as dt
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+
+class ReadingCache:
+    """A thread safe cache of sensor readings with a freshness bound.
+
+    Readings are stored by key (a bus or sensor path) with the monotonic time
+    they were read. Callers ask for a reading no older than `max_age` seconds,
+    so a sweep that has just finished can answer on-demand reads.
+    """
+
+    def __init__(self):
+        """Create the ReadingCache object."""
+        self._lock = threading.Lock()
+        self._readings = {}
+        self._newest = None
+
+    def store(self, key: str, data: Any):
+        """Store a reading.
+
+        Args:
+            key (str): The key of the reading, eg. the sensor path.
+            data (Any): The reading.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._readings[key] = (now, dt.datetime.now(), data)
+            self._newest = now
+
+    def get(self, key: str, max_age: float) -> Optional[Tuple[Any, float]]:
+        """Get a reading if it is no older than max_age.
+
+        Args:
+            key (str): The key of the reading.
+            max_age (float): The maximum age of the reading in seconds.
+
+        Returns:
+            Optional[Tuple[Any, float]]: The reading and its age in seconds,
+            or None if there is no fresh enough reading.
+        """
+        with self._lock:
+            entry = self._readings.get(key)
+        if entry is None:
+            return None
+
+        age = time.monotonic() - entry[0]
+        if age > max_age:
+            return None
+        return entry[2], age
+
+    def read_at(self, key: str) -> Optional[dt.datetime]:
+        """Return the time a reading was stored, or None if there is no reading."""
+        with self._lock:
+            entry = self._readings.get(key)
+        return entry[1] if entry else None
+
+    def newest_age(self) -> Optional[float]:
+        """Return the age in seconds of the newest reading, or None if there are none."""
+        with self._lock:
+            newest = self._newest
+        return None if newest is None else time.monotonic() - newest
+
+    def clear(self):
+        """Remove all readings."""
+        with self._lock:
+            self._readings.clear()
+            self._newest = None
+
+
+READING_CACHE = ReadingCache()
@@ -0,0 +1,172 @@
+"""Periodically read every grainbin and publish the readings."""
+import datetime as dt
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from fd_device.grainbin.update import sweep_grainbins
+
+
+def _sensor_moved(last: dict, temperatures: dict, deadband: float) -> bool:
+    if last.keys() != temperatures.keys():
+        return True
+    for sensor_id, temperature in temperatures.items():
+        try:
+            if abs(float(temperature) - float(last[sensor_id])) >= deadband:
+                return True
+        except (TypeError, ValueError):
+            if temperature != last[sensor_id]:
+                return True
+    return False
+
+
+def changed_readings(
+    readings: List[dict], published: dict, deadband: float
+) -> List[dict]:
+    """Return the grainbin readings with a sensor that moved by at least deadband.
+
+    Args:
+        readings (List[dict]): The readings of each bus, as returned by read_grainbin.
+        published (dict): The last published temperatures of each bus. Updated in place.
+        deadband (float): The smallest change in degrees to publish. 0 publishes every reading.
+
+    Returns:
+        List[dict]: The readings to publish.
+    """
+    changed = []
+    for reading in readings:
+        temperatures = {
+            sensor.get("id"): sensor.get("temperature")
+            for sensor in reading.get("sensors", [])
+        }
+        last = published.get(reading["bus_number"])
+        if deadband <= 0 or last is None or _sensor_moved(last, temperatures, deadband):
+            published[reading["bus_number"]] = temperatures
+            changed.append(reading)
+    return changed
+
+
+class GrainbinSweep:  # pylint: disable=too-many-instance-attributes
+    """Read all the grainbins on a schedule and publish the readings.
+
+    The IOLoop only schedules the sweep. Reading the 1wire busses is done on a
+    worker thread, and the readings are published from the IOLoop once done.
+    Sweeps are skipped while the broker has blocked the connection.
+
+    Only grainbins that changed by at least the deadband are published, in
+    messages of at most batch_size grainbins. The interval, resolution,
+    deadband and batch_size can be changed with configure, and take effect
+    from the next sweep.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self, connection, publisher, logger, interval, schedule=None, flow_control=None
+    ):
+        """Create the GrainbinSweep object.
+
+        :param connection: The pika connection whose IOLoop runs the schedule. Only its
+            ioloop attribute is used, so any object with an ioloop will do.
+        :param Publisher publisher: Where the readings are published.
+        :param logger: The logger to use.
+        :param interval: The number of seconds between sweeps.
+        :param Schedule schedule: Places the sweeps at the device's phase in the interval.
+        :param FlowControl flow_control: Sweeps are skipped while it is blocked.
+        """
+        self.LOGGER = logger
+        self.interval = interval
+        self.resolution = "temperature10"
+        self.deadband = 0.0
+        self.batch_size = None
+        self.last_duration = None
+        self.last_sweep_at = None
+        self.sweep_count = 0
+        self.skipped = 0
+        # the sensors to read on each bus at the next sweep, instead of listing the busses
+        self.sensor_index = None
+
+        self._connection = connection
+        self._publisher = publisher
+        self._schedule = schedule
+        self._flow_control = flow_control
+        self._published = {}
+        self._running = False
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="fd-sweep"
+        )
+
+    def start(self):
+        """Schedule the first sweep."""
+        self.schedule_next_sweep()
+
+    def stop(self):
+        """Stop sweeping."""
+        self._stopping = True
+        self._executor.shutdown(wait=False)
+
+    def configure(self, settings):
+        """Apply the sweep settings of a RuntimeSettings snapshot. This runs on the IOLoop."""
+        self.interval = settings["sweep_interval"]
+        self.resolution = settings["sweep_resolution"]
+        self.deadband = settings["sweep_deadband"]
+        self.batch_size = settings["sweep_batch_size"]
+
+    def schedule_next_sweep(self):
+        """Schedule the next sweep at this device's next tick."""
+        if self._stopping:
+            return
+        delay = self.interval
+        if self._schedule is not None:
+            delay = self._schedule.next_delay(self.interval)
+        self._connection.ioloop.call_later(delay, self.run_sweep)
+
+    def run_sweep(self):
+        """Start a sweep on the worker thread, unless one is running or publishing is blocked."""
+        if self._stopping:
+            return
+
+        if self._running or (self._flow_control and self._flow_control.blocked):
+            self.skipped += 1
+            self.LOGGER.debug("Skipping grainbin sweep")
+            self.schedule_next_sweep()
+            return
+
+        self._running = True
+        index, self.sensor_index = self.sensor_index, None
+        self._executor.submit(self._sweep, self.resolution, index)
+
+    def _sweep(self, resolution, index=None):
+        """Read all the grainbins. This runs on the worker thread."""
+        start = time.monotonic()
+        readings = []
+        try:
+            readings = sweep_grainbins(resolution, index)
+        except Exception:  # noqa: B902  pylint: disable=broad-except
+            self.LOGGER.exception("Error reading the grainbins")
+        duration = time.monotonic() - start
+        self._connection.ioloop.add_callback_threadsafe(
+            functools.partial(self.on_sweep_done, readings, duration)
+        )
+
+    def on_sweep_done(self, readings, duration):
+        """Publish the readings and schedule the next sweep. This runs on the IOLoop."""
+        self._running = False
+        self.sweep_count += 1
+        self.last_duration = duration
+        self.last_sweep_at = dt.datetime.now()
+        self.LOGGER.debug(f"Grainbin sweep took {duration:.3f} seconds")
+
+        if not self._stopping:
+            readings = changed_readings(readings, self._published, self.deadband)
+            batch_size = self.batch_size or len(readings) or 1
+            for start in range(0, len(readings), batch_size):
+                self._publisher.send(
+                    {
+                        "created_at": self.last_sweep_at,
+                        "sweep_duration": duration,
+                        "grainbin_data": readings[start : start + batch_size],
+                    }
+                )
+        self.schedule_next_sweep()
@@ -1,7 +1,8 @@
 """Module to interface with the temperature sensors using the 1wire protocol."""
-from glob import glob
 from typing import List
 
+from fd_device.system.sensor_files import get_backend
+
 
 def all_busses() -> List:
     """Get all busses connected to the device.
@@ -9,7 +10,7 @@ def all_busses() -> List:
     Returns:
         List: A list of paths for all bussess connected.
     """
-    return glob("/mnt/1wire/bus.*")
+    return get_backend().glob("/mnt/1wire/bus.*")
 
 
 def get_bus_path(bus_number: str) -> str:
@@ -38,7 +39,7 @@ def all_sensors(bus_path: str = None, family: str = "28") -> List:
     if not bus_path:
         return []
     path = bus_path + "/" + family + ".*"
-    return glob(path)
+    return get_backend().glob(path)
 
 
 def read_sensor(  # noqa: C901  pylint: disable=too-many-arguments
@@ -65,13 +66,13 @@ def read_sensor(  # noqa: C901  pylint: disable=too-many-arguments
               The value is 'None' if there is an error reading the sensor.
     """
     data = {}
+    files = get_backend()
 
     # id
     if read_id:
         try:
             id_file = sensor_path + "/id"
-            with open(id_file) as f:
-                data["id"] = f.readline()
+            data["id"] = files.read_line(id_file)
         except IOError:
             data["id"] = "None"
 
@@ -79,8 +80,7 @@ def read_sensor(  # noqa: C901  pylint: disable=too-many-arguments
     if read_temphigh:
         try:
             temph_file = sensor_path + "/temphigh"
-            with open(temph_file) as f:
-                data["temphigh"] = f.readline()
+            data["temphigh"] = files.read_line(temph_file)
         except IOError:
             data["temphigh"] = "None"
 
@@ -88,8 +88,7 @@ def read_sensor(  # noqa: C901  pylint: disable=too-many-arguments
     if read_templow:
         try:
             templ_file = sensor_path + "/templow"
-            with open(templ_file) as f:
-                data["templow"] = f.readline()
+            data["templow"] = files.read_line(templ_file)
         except IOError:
             data["templow"] = "None"
 
@@ -97,8 +96,7 @@ def read_sensor(  # noqa: C901  pylint: disable=too-many-arguments
     if read_temperature:
         try:
             temperature_file = sensor_path + "/" + file
-            with open(temperature_file) as f:
-                data["temperature"] = f.readline()
+            data["temperature"] = files.read_line(temperature_file)
         except IOError:
             data["temperature"] = "None"
 
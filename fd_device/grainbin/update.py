@@ -1,10 +1,18 @@
 """Get update objects for the grainbins."""
 import datetime as dt
+from typing import Dict, List
 
 from sqlalchemy.orm.session import Session
 
 from fd_device.database.base import get_session
 from fd_device.database.device import Grainbin
+from fd_device.grainbin.cache import READING_CACHE
+from fd_device.grainbin.temperature import (
+    all_busses,
+    all_sensors,
+    get_bus_path,
+    read_sensor,
+)
 
 
 def get_grainbin_info(session: Session = None) -> dict:
@@ -33,3 +41,109 @@ def get_grainbin_info(session: Session = None) -> dict:
         session.close()
 
     return info
+
+
+def read_grainbin(
+    bus_number: int,
+    sensor: str = None,
+    max_age: float = 0,
+    resolution: str = "temperature10",
+    sensor_ids: List[str] = None,
+) -> dict:
+    """Read the sensors of a grainbin now.
+
+    If a reading that is no older than max_age is in the cache (eg. from a
+    sweep that just finished) it is used instead of reading the bus.
+
+    Args:
+        bus_number (int): The bus number of the grainbin.
+        sensor (str, optional): Only read this sensor, eg. '28.0A1B2C3D4E5F'. Defaults to None.
+        max_age (float, optional): The maximum age in seconds of a cached reading. Defaults to 0.
+        resolution (str, optional): The temperature file to read. Defaults to 'temperature10'.
+        sensor_ids (List[str], optional): The sensors on the bus, instead of listing the bus. Defaults to None.
+
+    Returns:
+        dict: The readings with keys 'bus_number', 'sensors', 'read_at', 'cached' and 'age'.
+    """
+
+    bus_path = get_bus_path(str(bus_number))
+    key = bus_path + "/" + sensor if sensor else bus_path
+
+    info = {"bus_number": bus_number, "cached": False, "age": 0.0}
+
+    cached = READING_CACHE.get(key, max_age) if max_age > 0 else None
+    if cached is not None:
+        info["sensors"], info["age"] = cached
+        info["cached"] = True
+        info["read_at"] = READING_CACHE.read_at(key)
+        return info
+
+    if sensor:
+        sensors = [read_sensor(key, file=resolution)]
+    else:
+        if sensor_ids is None:
+            paths = all_sensors(bus_path)
+        else:
+            paths = [bus_path + "/" + sensor_id for sensor_id in sensor_ids]
+        sensors = [read_sensor(path, file=resolution) for path in paths]
+        for path, data in zip(paths, sensors):
+            READING_CACHE.store(path, [data])
+
+    READING_CACHE.store(key, sensors)
+    info["sensors"] = sensors
+    info["read_at"] = READING_CACHE.read_at(key)
+    return info
+
+
+def _bus_numbers() -> List[int]:
+    """Return the numbers of the busses connected to the device."""
+    bus_numbers = []
+    for bus_path in all_busses():
+        bus_number = bus_path.rsplit(".", 1)[-1]
+        if bus_number.isdigit():
+            bus_numbers.append(int(bus_number))
+    return sorted(bus_numbers)
+
+
+def sensor_index() -> Dict[str, List[str]]:
+    """List the sensors on every bus connected to the device.
+
+    Returns:
+        Dict[str, List[str]]: The sensor ids of each bus, by bus number.
+    """
+    return {
+        str(bus_number): sorted(
+            path.rsplit("/", 1)[-1]
+            for path in all_sensors(get_bus_path(str(bus_number)))
+        )
+        for bus_number in _bus_numbers()
+    }
+
+
+def sweep_grainbins(
+    resolution: str = "temperature10", index: Dict[str, List[str]] = None
+) -> List[dict]:
+    """Read the sensors of every grainbin bus connected to the device.
+
+    Listing the busses and sensors is slow on a cold 1wire filesystem, so a
+    sensor index from sensor_index() can be passed to read just those sensors.
+
+    Args:
+        resolution (str, optional): The temperature file to read. Defaults to 'temperature10'.
+        index (Dict[str, List[str]], optional): The sensors to read on each bus. Defaults to None.
+
+    Returns:
+        List[dict]: The readings of each bus, as returned by read_grainbin.
+    """
+
+    if index is None:
+        return [
+            read_grainbin(bus_number, resolution=resolution)
+            for bus_number in _bus_numbers()
+        ]
+    return [
+        read_grainbin(int(bus_number), resolution=resolution, sensor_ids=sensor_ids)
+        for bus_number, sensor_ids in sorted(
+            index.items(), key=lambda item: int(item[0])
+        )
+    ]
@@ -8,6 +8,8 @@ from multiprocessing_logging import install_mp_handler
 
 from fd_device.database.base import get_session
 from fd_device.device.service import run_connection
+from fd_device.device.snapshot import read_snapshot
+from fd_device.system.startup_profile import STARTUP_PROFILE
 
 from .settings import get_config
 from .startup import get_rabbitmq_address
@@ -48,12 +50,26 @@ def main():
 
     config = get_config()
     logger = configure_logging(config)
+    STARTUP_PROFILE.mark("configure_logging")
     session = get_session()
-
-    if not get_rabbitmq_address(logger, session):
+    STARTUP_PROFILE.mark("db_session")
+
+    # a warm start connects to the broker of the snapshot, and fails over from there
+    snapshot = read_snapshot(config.WARM_START_FILE)
+    if config.GATEWAY_MODE == "peer":
+        # a peer only reaches the broker through its gateway
+        if not config.GATEWAY_ADDRESS:
+            logger.error("No GATEWAY_ADDRESS set for the 'peer' GATEWAY_MODE")
+            time.sleep(1)
+            return
+        logger.info(f"Running as a peer of the gateway at {config.GATEWAY_ADDRESS}")
+    elif snapshot and snapshot.get("address"):
+        logger.info(f"Warm start with the rabbitmq server at {snapshot['address']}")
+    elif not get_rabbitmq_address(logger, session):
         logger.error("No address for rabbitmq server found")
         time.sleep(1)
         return
+    STARTUP_PROFILE.mark("rabbitmq_address")
 
     device_connection = Process(target=run_connection)
     device_connection.start()
@@ -8,6 +8,7 @@ from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import object_session
 
 from fd_device.database.base import get_session
+from fd_device.database.database import bump_sync_version
 from fd_device.database.system import Interface, Wifi
 from fd_device.network.ethernet import get_external_interface, get_interfaces
 from fd_device.network.network_files import (
@@ -27,29 +28,42 @@ def refresh_interfaces():
     """Refresh all interfaces. Update with current information."""
 
     session = get_session()
-    ap_present = False
 
     interfaces = get_interfaces()
 
-    # update all interfaces.active to be False by default
-    session.query(Interface).update({Interface.is_active: False})
-
-    for my_interface in interfaces:
-        try:
-            interface = session.query(Interface).filter_by(interface=my_interface).one()
-
-            interface.is_active = True
-            # see if there is an interface that is configured for an ap
-            if interface.state == "ap":
-                ap_present = True
-
-        # must be a new interface so lets add it
-        except NoResultFound:
-            new_interface = Interface(my_interface)
-            new_interface.is_active = True
-            new_interface.is_for_fm = False
-            new_interface.state = "dhcp"
-            session.add(new_interface)
+    # deactivate the interfaces that are gone. A bulk update is not flushed,
+    # so the interfaces section is versioned here when a row changed
+    deactivated = (
+        session.query(Interface)
+        .filter(Interface.interface.notin_(interfaces), Interface.is_active.is_(True))
+        .update({Interface.is_active: False}, synchronize_session=False)
+    )
+    if deactivated:
+        bump_sync_version(session, Interface.sync_section)
+
+    # activate the known interfaces, and add the new ones as dhcp. Rows that
+    # are already active are left alone, and do not bump the version
+    Interface.bulk_upsert(
+        session,
+        [
+            {
+                "interface": my_interface,
+                "is_active": True,
+                "is_for_fm": False,
+                "state": "dhcp",
+            }
+            for my_interface in interfaces
+        ],
+        index_elements=["interface"],
+        update_columns=["is_active"],
+        commit=False,
+    )
+
+    # see if there is an interface that is configured for an ap
+    ap_present = (
+        session.query(Interface).filter_by(is_active=True, state="ap").first()
+        is not None
+    )
 
     session.commit()
     session.close()
@@ -278,26 +292,30 @@ def set_interfaces(interfaces: List):
     """
 
     session = get_session()
-    wifi_ap_present = False
-
+    wifi_ap_present = any(interface["state"] == "ap" for interface in interfaces)
+
+    Interface.bulk_upsert(
+        session,
+        [
+            {
+                "interface": interface["name"],
+                "is_active": True,
+                "is_for_fm": interface["is_for_fm"],
+                "state": interface["state"],
+            }
+            for interface in interfaces
+        ],
+        index_elements=["interface"],
+        commit=False,
+    )
     for interface in interfaces:
-        try:
-            db_result = (
-                session.query(Interface).filter_by(interface=interface["name"]).one()
-            )
-        except NoResultFound:
-            db_result = Interface(interface["name"])
-            session.add(db_result)
-        db_result.is_active = True
-        db_result.is_for_fm = interface["is_for_fm"]
-        db_result.state = interface["state"]
-        if interface["state"] == "ap":
-            wifi_ap_present = True
         if "creds" in interface:
             add_wifi_network(
                 wifi_name=interface["creds"]["ssid"],
                 wifi_password=interface["creds"]["password"],
-                interface=db_result,
+                interface=session.query(Interface)
+                .filter_by(interface=interface["name"])
+                .one(),
             )
     session.commit()
 
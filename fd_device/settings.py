@@ -29,17 +29,86 @@ class Config:
     PROJECT_ROOT = os.path.abspath(os.path.join(APP_DIR, os.pardir))
 
     PRESENCE_PORT = 5554
+    # the most seconds to look for the RabbitMQ server at startup
+    DISCOVERY_DEADLINE = 30
+    # the most seconds to wait for the discovery threads to stop once a broker is found
+    DISCOVERY_JOIN_TIMEOUT = 2.0
+    # the most seconds a TCP probe of a broker waits, before any AMQP handshake is tried
+    BROKER_PROBE_TIMEOUT = 1.0
 
     LOG_LEVEL = logging.INFO
     LOG_FILE = "/logs/farm_device.log"
+    # what the device needs to start before the database is up (see fd_device.device.snapshot)
+    WARM_START_FILE = "/logs/fd_device_warm_start.json"
+    # seconds between attempts to reconcile a warm start with the database
+    WARM_START_RETRY = 5
 
     UPDATER_PATH = "/home/pi/farm_monitor/farm_update/update.sh"
 
     SQLALCHEMY_DATABASE_URI = "postgresql://fd:farm_device@fd_db/farm_device.db"
+    # the connection pool of the engine shared by each process (not used by sqlite)
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 5
+    # seconds before a pooled connection is replaced
+    DB_POOL_RECYCLE = 3600
+    # test pooled connections before use, so a restarted database is reconnected to
+    DB_POOL_PRE_PING = True
+    # the most seconds a cached singleton row (eg. the Device) is used without re-reading it
+    SINGLETON_CACHE_MAX_AGE = 60
 
     RABBITMQ_USER = "fd"
     RABBITMQ_PASSWORD = "farm_monitor"
     RABBITMQ_VHOST = "farm_monitor"
+    # other RabbitMQ brokers to fail over to, in addition to the discovered ones
+    RABBITMQ_ADDRESSES = []
+    # seconds between measuring the latency of the known brokers
+    BROKER_RERANK_INTERVAL = 300
+    # close the connection if RabbitMQ blocks it for longer than this many seconds
+    RABBITMQ_BLOCKED_TIMEOUT = 300
+    # seconds to ramp back up to full throughput after RabbitMQ unblocks the connection
+    FLOW_RESUME_SECONDS = 10
+
+    # send heartbeats over 'amqp', or as compact 'udp' datagrams to the server
+    HEARTBEAT_TRANSPORT = "amqp"
+    UDP_HEARTBEAT_PORT = PRESENCE_PORT
+
+    # None, or 'gateway' to forward the traffic of peer devices upstream,
+    # or 'peer' to send this device's traffic through the gateway at GATEWAY_ADDRESS
+    GATEWAY_MODE = None
+    GATEWAY_ADDRESS = None
+    GATEWAY_PORT = 5556
+    # the gateway publishes a batch this often, or as soon as this many updates are waiting
+    GATEWAY_FLUSH_INTERVAL = 1.0
+    GATEWAY_BATCH_SIZE = 100
+
+    # seconds between refreshes of the CPU temperature and free disk in the heartbeat health summary
+    HEALTH_REFRESH_INTERVAL = 60
+
+    # server command handling
+    COMMAND_WORKERS = 2
+    COMMAND_PREFETCH = 10
+    # defaults of the settings the server can change at runtime (see RuntimeSettings)
+    HEARTBEAT_INTERVAL = 5
+    # the number of seconds between grainbin sweeps
+    SWEEP_INTERVAL = 300
+    # the 1wire temperature file read by sweeps, which sets the sensor resolution
+    SWEEP_RESOLUTION = "temperature10"
+    # only publish a grainbin when a sensor changed by at least this many degrees
+    SWEEP_DEADBAND = 0.0
+    # the most grainbins published in one bulk message
+    SWEEP_BATCH_SIZE = 20
+    # outbound rate limits for each traffic class: (messages per second, burst)
+    RATE_LIMITS = {"heartbeat": (1, 5), "alarm": (5, 20), "bulk": (2, 10)}
+    # the highest priority of the alarm priority queue
+    ALARM_MAX_PRIORITY = 10
+    # the maximum age in seconds of a cached reading used to answer a read_now command
+    READ_NOW_MAX_AGE = 30
+    # record every sensor read to this file (see fd_device.system.sensor_files)
+    SENSOR_RECORDING = None
+    # answer the sensor reads from this recording instead of the sensors
+    SENSOR_REPLAY = None
+    # how much faster than recorded to replay the sensor reads. 0 replays without delay
+    SENSOR_REPLAY_SPEED = 1.0
 
 
 class DevConfig(Config):
@@ -63,6 +132,7 @@ class TestConfig(Config):
     TESTING = True
 
     SQLALCHEMY_DATABASE_URI = "sqlite:////tmp/fd_device_test_db.sqlite"
+    WARM_START_FILE = None
 
 
 def get_config(override_default=None):
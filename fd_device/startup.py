@@ -1,19 +1,34 @@
 """fd_device tools for starting up."""
-import select
+import asyncio
 import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import pika
 from pika.exceptions import AMQPConnectionError
 from sqlalchemy.orm.exc import NoResultFound
 
+from fd_device.controller.brokers import BrokerList, probe_latency
+from fd_device.controller.presence import PRESENCE_CACHE, listen_for_beacons
 from fd_device.database.device import Connection
 from fd_device.database.system import Interface
 from fd_device.settings import get_config
 from fd_device.system.info import get_ip_of_interface
 
+# the addresses a broker is usually found at, tried after the known brokers
+DEFAULT_ADDRESSES = ["fm_rabbitmq", "host.docker.internal", "localhost"]
+
 
 def get_rabbitmq_address(logger, session):
-    """Find and return the address of the RabbitMQ server to connect to."""
+    """Find and return the address of the RabbitMQ server to connect to.
+
+    The previously used address, the other known brokers, the brokers of
+    recently heard presence beacons, the DEFAULT_ADDRESSES and the presence
+    beacon listener are all tried at once, and the
+    first address that passes the AMQP check is used. Returns False if none
+    is found within the DISCOVERY_DEADLINE.
+    """
 
     try:
         connection = session.query(Connection).one()
@@ -21,37 +36,125 @@ def get_rabbitmq_address(logger, session):
         connection = Connection()
         session.add(connection)
 
-    # try previously found address (if available) to see if it is still working
-    if connection.address:
-        logger.debug(f"trying previous rabbitmq address of {connection.address}")
-        if check_rabbitmq_address(logger, connection.address):
-            logger.info("previously used rabbitmq address is still valid")
-            return True
+    brokers = BrokerList()
+    brokers.load(session)
+    deadline = get_config().DISCOVERY_DEADLINE
+    heard = [beacon.host for beacon in PRESENCE_CACHE.beacons(deadline)]
+    candidates = []
+    for address in [connection.address] + brokers.ranked() + heard + DEFAULT_ADDRESSES:
+        if address and address not in candidates:
+            candidates.append(address)
 
-    possible_addresses = ["fm_rabbitmq", "host.docker.internal", "localhost"]
+    # the device connection has connected to the previous address, so its own
+    # handshake is check enough, and a TCP probe shows it is still reachable
+    trusted = connection.address if connection.is_connected else None
 
-    for address in possible_addresses:
-        logger.debug(f"testing address: {address}")
-        try:
-            address = socket.gethostbyname(address)
-            if check_rabbitmq_address(logger, address):
-                logger.info(f"'{address}' host was found and the url was valid")
-                connection.address = address
-                session.commit()
-                return True
+    address = discover_rabbitmq_address(
+        logger,
+        candidates,
+        get_presence_interface(logger, session),
+        deadline,
+        trusted,
+    )
+    if address is None:
+        logger.warning(f"no rabbitmq server found within {deadline} seconds")
+        session.commit()
+        return False
 
-        except socket.gaierror:
-            logger.debug(f"'{address}' host was not found")
+    remember_address(session, connection, address)
+    return True
 
-    # if all else fails, look for farm monitor presence notifier
-    return search_on_socket(logger, session, connection)
 
+def discover_rabbitmq_address(  # pylint: disable=too-many-arguments
+    logger, candidates, presence_interface=None, deadline=30.0, trusted=None
+):
+    """Check every candidate address, and listen for the presence beacon, at the same time.
 
-def search_on_socket(logger, session, connection):
-    """Look for farm monitor presence notifier on the network."""
+    Args:
+        logger: The logger to use.
+        candidates (list): The host names or addresses to check, best first.
+        presence_interface (str, optional): Listen for the presence beacon on this interface. Defaults to None.
+        deadline (float, optional): Give up after this many seconds. Defaults to 30.0.
+        trusted (str, optional): A candidate that only needs to pass the TCP probe. Defaults to None.
 
-    config = get_config()
-    presence_port = config.PRESENCE_PORT
+    Returns:
+        str: The first address that passed the AMQP check, or None.
+    """
+
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(
+        max_workers=len(candidates) + 1, thread_name_prefix="fd-discovery"
+    )
+    futures = {
+        executor.submit(
+            check_candidate, logger, candidate, stop, candidate == trusted
+        ): candidate
+        for candidate in candidates
+    }
+    if presence_interface is not None:
+        search = executor.submit(
+            search_on_socket, logger, presence_interface, stop, deadline
+        )
+        futures[search] = "presence beacon"
+
+    found = None
+    end = time.monotonic() + deadline
+    pending = set(futures)
+    try:
+        while pending and found is None:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    logger.debug(
+                        f"error checking {futures[future]}: {future.exception()}"
+                    )
+                elif future.result() and found is None:
+                    found = future.result()
+                    logger.info(f"rabbitmq found at '{found}' from {futures[future]}")
+    finally:
+        # the checks still running give up at their next step. They are waited
+        # for, as the device process is forked next and a thread that is still
+        # running could hold a logging lock the child then never gets back
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        _, running = wait(futures, get_config().DISCOVERY_JOIN_TIMEOUT)
+        if running:
+            names = ", ".join(futures[future] for future in running)
+            logger.warning(f"discovery checks still running: {names}")
+    return found
+
+
+def check_candidate(logger, candidate, stop, trusted=False):
+    """Resolve a candidate host name and check for rabbitmq at its address.
+
+    A trusted candidate only has to accept a TCP connection.
+
+    Returns:
+        str: The address, or None if it is not a rabbitmq server or discovery has stopped.
+    """
+
+    try:
+        address = socket.gethostbyname(candidate)
+    except socket.gaierror:
+        logger.debug(f"'{candidate}' host was not found")
+        return None
+    if stop.is_set():
+        return None
+    if trusted:
+        if probe_latency(address, timeout=get_config().BROKER_PROBE_TIMEOUT) is None:
+            return None
+        logger.debug(f"previously connected address {address} is reachable")
+        return address
+    if check_rabbitmq_address(logger, address):
+        return address
+    return None
+
+
+def get_presence_interface(logger, session):
+    """Return the interface the presence beacon is listened for on."""
 
     # get the first interface that is for farm monitor
     interface = session.query(Interface.interface).filter_by(is_for_fm=True).scalar()
@@ -62,51 +165,88 @@ def search_on_socket(logger, session, connection):
         )
         interface = "eth0"
 
-    interface_address = get_ip_of_interface(interface, broadcast=True)
+    return interface
 
-    logger.info("looking for FarmMonitor address on interface {}".format(interface))
-    logger.debug("address is {}:{}".format(interface_address, presence_port))
 
-    # Create UDP socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+def search_on_socket(logger, interface, stop, deadline):
+    """Look for farm monitor presence notifier on the network.
 
-    # Ask operating system to let us do broadcasts from socket
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    The broadcast address of the interface is looked up here, on the
+    discovery thread, so an interface that is missing, down or without an
+    IPv4 address only fails the presence search and not the other candidates.
 
-    # Bind UDP socket to local port so we can receive pings
-    sock.bind((interface_address, int(presence_port)))
+    A beacon that announces a broker on the port and virtual host the
+    device connects to is used without a probe. Legacy beacons, and beacons
+    for other brokers, are checked with check_rabbitmq_address. Every beacon
+    heard is kept in the PRESENCE_CACHE.
 
-    try:
-        while True:
-            timeout = 5
-            ready = select.select([sock], [], [], timeout)
-            # Someone answered our ping
-            if ready[0]:
-                _, addrinfo = sock.recvfrom(2)
-                if check_rabbitmq_address(logger, addrinfo[0]):
-                    sock.close()
-                    logger.debug(
-                        "Found FarmMonitor at {}:{}".format(addrinfo[0], addrinfo[1])
-                    )
-                    connection.address = addrinfo[0]
-                    session.commit()
-                    return True
-                logger.debug(
-                    "Reply from {}:{}, but no rabbitmq server present".format(
-                        addrinfo[0], addrinfo[1]
-                    )
-                )
-            else:
-                logger.debug("No broadcast from FarmMonitor yet")
+    Returns:
+        str: The address of the first usable broker, or None once stop is set
+        or the deadline passes.
+    """
 
-    except KeyboardInterrupt:
-        sock.close()
-        session.commit()
+    config = get_config()
+    logger.info("looking for FarmMonitor address on interface {}".format(interface))
+    interface_address = get_ip_of_interface(interface, broadcast=True)
+    logger.debug("address is {}:{}".format(interface_address, config.PRESENCE_PORT))
+
+    def accept(beacon):
+        if (beacon.port, beacon.vhost) == (5672, config.RABBITMQ_VHOST):
+            logger.debug(
+                f"Found FarmMonitor broker at {beacon.host}, load {beacon.load}"
+            )
+            return True
+        if check_rabbitmq_address(logger, beacon.host):
+            logger.debug(f"Found FarmMonitor at {beacon.host}")
+            return True
+        logger.debug(f"Beacon from {beacon.host}, but no rabbitmq server present")
         return False
 
+    beacon = asyncio.run(
+        listen_for_beacons(
+            interface_address, config.PRESENCE_PORT, deadline, accept, stop=stop
+        )
+    )
+    if beacon is None:
+        logger.debug("No broadcast from FarmMonitor")
+        return None
+    return beacon.host
+
+
+def remember_address(session, connection, address):
+    """Use the address for the connection, and add it to the known brokers with its latency.
+
+    The brokers heard from by presence beacons are added to the known brokers too.
+    """
+
+    connection.address = address
+    brokers = BrokerList()
+    brokers.load(session)
+    # the other brokers that announced themselves are kept to fail over to
+    for beacon in PRESENCE_CACHE.beacons(get_config().DISCOVERY_DEADLINE):
+        brokers.add(beacon.host)
+    latency = probe_latency(address, timeout=get_config().BROKER_PROBE_TIMEOUT)
+    brokers.record_success(address, latency)
+    brokers.save(session)
+
+
+def create_udp_socket(broadcast=False):
+    """Create the UDP socket used for the presence search and UDP heartbeats.
+
+    If broadcast is true, ask the operating system to let us do broadcasts from the socket.
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    if broadcast:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    return sock
+
 
 def check_rabbitmq_address(logger, address):
-    """Check if the address is good, by trying to connect."""
+    """Check if the address is good, by trying to connect.
+
+    The AMQP handshake is only tried once a TCP connect probe succeeds.
+    """
 
     config = get_config()
     user = config.RABBITMQ_USER
@@ -119,6 +259,11 @@ def check_rabbitmq_address(logger, address):
         host=address, port=port, virtual_host=virtual_host, credentials=credentials
     )
 
+    # a TCP probe fails fast for hosts that are down, before any AMQP handshake
+    if probe_latency(address, port, config.BROKER_PROBE_TIMEOUT) is None:
+        logger.debug(f"{address}:{port} is not reachable")
+        return False
+
     try:
         logger.debug(f"testing connection to: {address}")
         connection = pika.BlockingConnection(parameters=parameters)
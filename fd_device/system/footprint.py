@@ -0,0 +1,72 @@
+"""Measure the import time and resident memory of the device modules.
+
+Each module is imported in a fresh interpreter, so the measurement is not
+skewed by what the current process has already imported.
+"""
+import json
+import subprocess
+import sys
+from typing import List
+
+# the entry points of the long running daemon
+DAEMON_MODULES = ("fd_device.main", "fd_device.device.service")
+# dependencies that should only be imported when they are used
+HEAVY_PACKAGES = (
+    "alembic",
+    "billiard",
+    "celery",
+    "kombu",
+    "netifaces",
+    "psutil",
+    "pyment",
+    "pytest",
+)
+
+MEASURE = """
+import importlib, json, sys, time
+def rss_kb():
+    # the current resident memory; ru_maxrss is kept across exec from the parent
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+baseline = rss_kb()
+before = set(sys.modules)
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - start
+json.dump({
+    "seconds": seconds,
+    "baseline_rss_kb": baseline,
+    "rss_kb": rss_kb(),
+    "modules": len(set(sys.modules) - before),
+    "packages": sorted({name.split(".")[0] for name in sys.modules}),
+}, sys.stdout)
+"""
+
+
+def measure_import(module: str) -> dict:
+    """Import a module in a fresh interpreter and measure the cost.
+
+    Args:
+        module (str): The module to import, eg. 'fd_device.main'.
+
+    Returns:
+        dict: The 'module', the import 'seconds', the resident 'rss_kb' and the
+              'baseline_rss_kb' of the bare interpreter, the number of 'modules'
+              imported, and the 'heavy' packages that were imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE, module],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    measured = json.loads(result.stdout)
+    packages = measured.pop("packages")
+    measured["module"] = module
+    measured["heavy"] = [package for package in HEAVY_PACKAGES if package in packages]
+    return measured
+
+
+def footprint_report(modules=DAEMON_MODULES) -> List[dict]:
+    """Measure the import of each module. See measure_import."""
+    return [measure_import(module) for module in modules]
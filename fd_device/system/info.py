@@ -2,20 +2,23 @@
 import datetime
 import logging
 import os
+import shutil
 import socket
 import subprocess
 
-import netifaces
-import psutil
-
 logger = logging.getLogger("fd.system.info")
 
+# returned by get_cpu_temperature when the temperature cannot be read
+UNKNOWN_CPU_TEMPERATURE = -99.9
+
 
 def get_ip_of_interface(interface, broadcast=False):
     """Get the ip address of a given interface.
 
     If broadcast is true, get the broadcast address.
     """
+    # imported on first use, to keep it out of the daemon until it is needed
+    import netifaces  # pylint: disable=import-outside-toplevel
 
     if not broadcast:
         ip = netifaces.ifaddresses(interface)[2][0]["addr"]
@@ -66,8 +69,10 @@ def get_cpu_temperature() -> float:
         return float(int(res) / 1000)
 
     except subprocess.CalledProcessError:
-        logger.warning("Unable to retrieve CPU temperature. Returning -99.9")
-        return -99.9
+        logger.warning(
+            f"Unable to retrieve CPU temperature. Returning {UNKNOWN_CPU_TEMPERATURE}"
+        )
+        return UNKNOWN_CPU_TEMPERATURE
 
 
 def get_service_status() -> bool:
@@ -160,11 +165,14 @@ def get_system_memory() -> dict:
     :rtype: dict
     """
 
+    # imported on first use, to keep it out of the daemon until it is needed
+    import psutil  # pylint: disable=import-outside-toplevel
+
     logger.debug("getting system memory")
     system_mem = {}
 
     virtual_mem = psutil.virtual_memory()
-    disk = psutil.disk_usage("/")
+    disk = shutil.disk_usage("/")
 
     system_mem["ram_used"] = virtual_mem.used // 2 ** 20  # MB
     system_mem["ram_total"] = virtual_mem.total // 2 ** 20  # MB
@@ -184,7 +192,7 @@ def get_storage() -> dict:
     """
 
     logger.debug("getting device storage")
-    disk = psutil.disk_usage("/")
+    disk = shutil.disk_usage("/")
     system_mem = {}
     system_mem["disk_used"] = round(float(disk.used) / 2 ** 30, 3)  # GB
     system_mem["disk_total"] = round(float(disk.total) / 2 ** 30, 3)  # GB
@@ -0,0 +1,227 @@
+"""The files the 1wire sensors are read through, with recording and replay.
+
+The temperature modules read the OWFS and w1 sensor files through the
+backend returned by get_backend(). The default backend reads the files. A
+Recorder wraps a backend and saves every read (path, value, latency and
+error) to a gzipped JSON lines file, and a Replayer answers the reads from
+such a file, at the recorded latency or faster.
+"""
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from glob import glob
+from typing import List
+
+LOGGER = logging.getLogger("fd.system.sensor_files")
+
+RECORDING_VERSION = 1
+
+
+class SensorFiles:
+    """Read the sensor files from the filesystem."""
+
+    def read_line(self, path: str) -> str:  # pylint: disable=no-self-use
+        """Return the first line of a file. Raises OSError if it can not be read."""
+        with open(path) as f:
+            return f.readline()
+
+    def read_lines(self, path: str) -> List[str]:  # pylint: disable=no-self-use
+        """Return every line of a file. Raises OSError if it can not be read."""
+        with open(path) as f:
+            return f.readlines()
+
+    def glob(self, pattern: str) -> List[str]:  # pylint: disable=no-self-use
+        """Return the paths matching a glob pattern."""
+        return glob(pattern)
+
+    def close(self):
+        """Nothing to close; here so every backend can be closed."""
+
+
+class Recorder:
+    """Pass the reads through to a backend and record them.
+
+    Records are buffered and appended to the file as a gzip member every
+    flush_every records and on close, so a recording cut short by a crash or
+    power loss keeps everything up to the last flush.
+    """
+
+    def __init__(self, path, backend=None, flush_every=100):
+        """Create the Recorder object and start a new recording file.
+
+        :param str path: The file to record to. It is overwritten.
+        :param backend: The backend the reads are passed to. Defaults to SensorFiles.
+        :param int flush_every: Append the buffered records to the file this often.
+        """
+        self.path = path
+        self.backend = backend or SensorFiles()
+        self.flush_every = flush_every
+        self.count = 0
+
+        self._lock = threading.Lock()
+        self._records = []
+        self._start = time.monotonic()
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"version": RECORDING_VERSION}) + "\n")
+
+    def _call(self, operation, path):
+        start = time.monotonic()
+        value = error = None
+        try:
+            value = getattr(self.backend, operation)(path)
+            return value
+        except OSError as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            latency = time.monotonic() - start
+            self._record(
+                [round(start - self._start, 6), operation, path, value, latency, error]
+            )
+
+    def _record(self, record):
+        with self._lock:
+            self._records.append(record)
+            self.count += 1
+            full = len(self._records) >= self.flush_every
+        if full:
+            self.flush()
+
+    def read_line(self, path: str) -> str:
+        """Read and record the first line of a file."""
+        return self._call("read_line", path)
+
+    def read_lines(self, path: str) -> List[str]:
+        """Read and record every line of a file."""
+        return self._call("read_lines", path)
+
+    def glob(self, pattern: str) -> List[str]:
+        """Record the paths matching a glob pattern."""
+        return self._call("glob", pattern)
+
+    def flush(self):
+        """Append the buffered records to the recording file."""
+        with self._lock:
+            records, self._records = self._records, []
+            if not records:
+                return
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self):
+        """Write the remaining records."""
+        self.flush()
+        LOGGER.info(f"Recorded {self.count} sensor reads to {self.path}")
+
+
+class Replayer:
+    """Answer the reads from a recording.
+
+    The reads of each path are replayed in the order they were recorded,
+    starting over once they run out. Each read takes its recorded latency
+    divided by speed, so 1 replays the timing of the real busses and a
+    speed of 0 replays with no delay. Recorded errors are raised again.
+    """
+
+    def __init__(self, path, speed=1.0):
+        """Load a recording.
+
+        :param str path: The recording file.
+        :param float speed: How much faster than recorded to replay. 0 replays without delay.
+
+        :raises ValueError: If the file is not a recording this version can replay.
+        """
+        self.path = path
+        self.speed = speed
+        self.count = 0
+
+        self._lock = threading.Lock()
+        self._reads = defaultdict(list)
+        self._positions = defaultdict(int)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("version") != RECORDING_VERSION:
+                raise ValueError(
+                    f"{path} is not a version {RECORDING_VERSION} recording"
+                )
+            for line in f:
+                _, operation, read_path, value, latency, error = json.loads(line)
+                self._reads[(operation, read_path)].append((value, latency, error))
+
+    def _call(self, operation, path):
+        reads = self._reads.get((operation, path))
+        if not reads:
+            if operation == "glob":
+                return []
+            raise FileNotFoundError(path)
+
+        with self._lock:
+            position = self._positions[(operation, path)]
+            self._positions[(operation, path)] = (position + 1) % len(reads)
+            self.count += 1
+        value, latency, error = reads[position]
+
+        if self.speed > 0:
+            time.sleep(latency / self.speed)
+        if error is not None:
+            raise OSError(f"Replayed {error} reading {path}")
+        return value
+
+    def read_line(self, path: str) -> str:
+        """Replay the first line of a file."""
+        return self._call("read_line", path)
+
+    def read_lines(self, path: str) -> List[str]:
+        """Replay every line of a file."""
+        return self._call("read_lines", path)
+
+    def glob(self, pattern: str) -> List[str]:
+        """Replay the paths matching a glob pattern."""
+        return self._call("glob", pattern)
+
+    def close(self):
+        """Nothing to close; here so every backend can be closed."""
+
+
+_BACKEND = SensorFiles()
+
+
+def get_backend():
+    """Return the backend the sensor files are read through."""
+    return _BACKEND
+
+
+def set_backend(backend):
+    """Read the sensor files through backend from now on.
+
+    Returns:
+        The backend that was replaced.
+    """
+    global _BACKEND  # pylint: disable=global-statement
+    previous, _BACKEND = _BACKEND, backend
+    return previous
+
+
+def configure_sensor_files(config):
+    """Record or replay the sensor reads if the config asks for it.
+
+    Args:
+        config: The Config, with SENSOR_RECORDING, SENSOR_REPLAY and SENSOR_REPLAY_SPEED.
+
+    Returns:
+        The backend in use.
+    """
+    if config.SENSOR_REPLAY:
+        LOGGER.info(
+            f"Replaying sensor reads from {config.SENSOR_REPLAY} "
+            f"at {config.SENSOR_REPLAY_SPEED}x"
+        )
+        set_backend(Replayer(config.SENSOR_REPLAY, config.SENSOR_REPLAY_SPEED))
+    elif config.SENSOR_RECORDING:
+        LOGGER.info(f"Recording sensor reads to {config.SENSOR_RECORDING}")
+        set_backend(Recorder(config.SENSOR_RECORDING))
+    return get_backend()
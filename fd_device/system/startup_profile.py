@@ -0,0 +1,84 @@
+"""Time the phases of a device start, from the CLI import to the first heartbeat ack.
+
+Each phase is marked when it ends, with the monotonic clock. That clock is
+shared by every process on the system, so the device connection process
+carries on the profile it inherits when it is forked. The breakdown is
+logged as one line once the first heartbeat is acked.
+"""
+import logging
+import threading
+import time
+from typing import List, Tuple
+
+LOGGER = logging.getLogger("fd.system.startup_profile")
+
+
+class StartupProfile:
+    """Record when each phase of the start ends.
+
+    Marks are ignored until the profile is started, and after it is
+    finished, so reconnects and tests that never start it record nothing.
+    Only the first mark of each phase counts.
+    """
+
+    def __init__(self):
+        """Create the StartupProfile object."""
+        # print the breakdown as well as logging it
+        self.echo = False
+
+        self._lock = threading.Lock()
+        self._start = None
+        self._marks = []
+        self._finished = False
+
+    @property
+    def running(self) -> bool:
+        """Return True if the profile is started and not finished."""
+        return self._start is not None and not self._finished
+
+    def start(self):
+        """Start the profile now."""
+        with self._lock:
+            self._start = time.monotonic()
+            self._marks = []
+            self._finished = False
+
+    def mark(self, phase: str):
+        """Record that a phase ended now."""
+        now = time.monotonic()
+        with self._lock:
+            if not self.running or phase in (name for name, _ in self._marks):
+                return
+            self._marks.append((phase, now))
+
+    def phases(self) -> List[Tuple[str, float]]:
+        """Return each phase and the seconds it took, in order."""
+        with self._lock:
+            last = self._start
+            phases = []
+            for phase, at in self._marks:
+                phases.append((phase, at - last))
+                last = at
+        return phases
+
+    def summary(self) -> str:
+        """Return the breakdown as one line."""
+        phases = self.phases()
+        total = sum(seconds for _, seconds in phases)
+        breakdown = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in phases)
+        return f"Startup took {total:.3f}s: {breakdown}"
+
+    def finish(self, phase: str):
+        """Mark the last phase and log the breakdown."""
+        self.mark(phase)
+        with self._lock:
+            if not self.running:
+                return
+            self._finished = True
+        summary = self.summary()
+        LOGGER.info(summary)
+        if self.echo:
+            print(summary, flush=True)
+
+
+STARTUP_PROFILE = StartupProfile()
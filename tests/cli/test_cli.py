@@ -0,0 +1,55 @@
+"""Test the CLI entry point."""
+import json
+import subprocess
+import sys
+
+from click.testing import CliRunner
+
+from fd_device.cli.cli import entry_point
+
+# the most modules `fd_device run --help` may import, from a bare interpreter
+RUN_HELP_MODULE_BUDGET = 150
+HEAVY_MODULES = ("alembic", "celery", "pika", "pyment", "pytest", "sqlalchemy")
+
+RUN_HELP = """
+import json, sys
+from fd_device.cli.cli import entry_point
+try:
+    entry_point(["run", "--help"])
+except SystemExit:
+    pass
+json.dump(sorted(sys.modules), sys.stderr)
+"""
+
+
+def test_run_help_import_budget():
+    """Test that the help of the run command imports no heavy dependencies."""
+
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_HELP],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = json.loads(result.stderr)
+
+    assert "--profile-startup" in result.stdout
+    assert [module for module in modules if module.split(".")[0] in HEAVY_MODULES] == []
+    assert "fd_device.cli.testing.commands" not in modules
+    assert "fd_device.cli.db.commands" not in modules
+    assert len(modules) <= RUN_HELP_MODULE_BUDGET
+
+
+def test_lazy_commands_listed():
+    """Test that every command is listed, and loaded when it is used."""
+
+    runner = CliRunner()
+    result = runner.invoke(entry_point, ["--help"])
+
+    assert result.exit_code == 0
+    for name in ("run", "first-setup", "database", "heartbeat-responder"):
+        assert name in result.output
+
+    result = runner.invoke(entry_point, ["database", "--help"])
+    assert result.exit_code == 0
+    assert "create_tables" in result.output
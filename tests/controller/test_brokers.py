@@ -0,0 +1,151 @@
+"""Test the brokers module."""
+# pylint: disable=protected-access
+import logging
+import socket
+import time
+
+import pytest
+
+from fd_device.controller import connection as connection_module
+from fd_device.controller.brokers import BrokerList, probe_latency
+from fd_device.controller.connection import Connection
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+from fd_device.database.device import BrokerAddress
+
+
+@pytest.fixture()
+def listener():
+    """Listen on a free local TCP port, and yield the port."""
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+def test_probe_latency(listener):
+    """Test measuring the connect latency of a broker."""
+
+    latency = probe_latency("127.0.0.1", listener)
+    assert latency is not None and latency >= 0
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    closed_port = sock.getsockname()[1]
+    sock.close()
+    assert probe_latency("127.0.0.1", closed_port, timeout=0.5) is None
+
+
+def test_broker_list_ranks_and_fails_over():
+    """Test that failed brokers drop behind the others."""
+
+    brokers = BrokerList()
+    brokers.add("10.0.0.3")
+    brokers.record_success("10.0.0.2", 0.02)
+    brokers.record_success("10.0.0.1", 0.01)
+
+    assert len(brokers) == 3
+    assert brokers.ranked() == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+    assert brokers.record_failure("10.0.0.1") == "10.0.0.2"
+    assert brokers.record_failure("10.0.0.2") == "10.0.0.3"
+    assert brokers.ranked() == ["10.0.0.3", "10.0.0.1", "10.0.0.2"]
+
+    brokers.record_success("10.0.0.1")
+    assert brokers.best() == "10.0.0.1"
+    assert brokers.stats("10.0.0.1").latency == 0.01
+
+
+def test_broker_list_rerank(listener):
+    """Test that rerank measures the latency of each broker."""
+
+    brokers = BrokerList(port=listener)
+    brokers.add("127.0.0.1")
+    brokers.record_failure("127.0.0.1")
+
+    brokers.rerank()
+
+    stats = brokers.stats("127.0.0.1")
+    assert stats.failures == 0
+    assert stats.latency is not None
+
+
+@pytest.mark.usefixtures("tables")
+def test_broker_list_load_and_save(dbsession):
+    """Test saving the brokers to the database and loading them again."""
+
+    brokers = BrokerList()
+    brokers.record_success("10.0.0.1", 0.01)
+    brokers.record_failure("10.0.0.2")
+    brokers.save(dbsession)
+    brokers.save(dbsession)
+
+    assert dbsession.query(BrokerAddress).count() == 2
+
+    loaded = BrokerList()
+    loaded.load(dbsession)
+    assert loaded.ranked() == ["10.0.0.1", "10.0.0.2"]
+    assert loaded.stats("10.0.0.2").failures == 1
+
+
+def test_connection_failover(monkeypatch):
+    """Test that a failed connection moves to the next broker."""
+
+    # every broker accepts TCP connections
+    monkeypatch.setattr(connection_module, "probe_latency", lambda *args: 0.01)
+    connection = Connection(logging.getLogger("fd.test"))
+    connection.brokers = BrokerList()
+    connection.brokers.record_success("10.0.0.1", 0.01)
+    connection.brokers.record_success("10.0.0.2", 0.02)
+
+    assert connection.next_broker("10.0.0.1") == "10.0.0.2"
+    assert connection.next_broker("10.0.0.2") == "10.0.0.1"
+
+
+def test_failover_skips_unreachable_brokers(listener):
+    """Test that failover skips brokers that do not accept a TCP connection."""
+
+    connection = Connection(logging.getLogger("fd.test.brokers"))
+    connection._port = listener
+    connection._probe_timeout = 0.5
+    connection.brokers = BrokerList(port=listener)
+    for address in ("127.0.0.2", "127.0.0.3", "127.0.0.1"):
+        connection.brokers.add(address)
+
+    assert connection.next_broker("127.0.0.2") == "127.0.0.1"
+    assert connection.brokers.stats("127.0.0.3").failures == 1
+
+
+def test_failover_probes_on_the_worker(monkeypatch):
+    """Test that failover probes the brokers off the IOLoop, then reconnects to the chosen one."""
+
+    def slow_probe(*args):
+        time.sleep(0.2)
+        return 0.01
+
+    monkeypatch.setattr(connection_module, "probe_latency", slow_probe)
+    connection = Connection(logging.getLogger("fd.test.brokers"))
+    connection._connection = LocalConnection(LocalBroker())
+    connection.brokers = BrokerList()
+    connection.brokers.record_success("10.0.0.1", 0.01)
+    connection.brokers.record_success("10.0.0.2", 0.02)
+    connection._host = "10.0.0.1"
+    reconnects = []
+
+    def reconnect():
+        reconnects.append(connection._host)
+        connection._connection.ioloop.stop()
+
+    connection.reconnect = reconnect
+
+    start = time.monotonic()
+    connection.failover()
+    assert time.monotonic() - start < 0.1
+    assert connection._host == "10.0.0.1"
+
+    connection._connection.ioloop.call_later(2, connection._connection.ioloop.stop)
+    connection._connection.ioloop.start()
+    connection.brokers.stop()
+
+    assert reconnects == ["10.0.0.2"]
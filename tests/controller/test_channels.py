@@ -0,0 +1,154 @@
+"""Test the channels module and the Publisher class."""
+import json
+import logging
+
+from pika import frame, spec
+
+from fd_device.controller.channels import ChannelManager
+from fd_device.controller.connection import Publisher
+from fd_device.controller.flow import FlowControl
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+
+LOGGER = logging.getLogger("fd.test")
+
+
+def test_channel_manager_opens_lanes():
+    """Test that every lane gets its own channel."""
+
+    broker = LocalBroker()
+    opened = []
+
+    def on_connection_open(connection):
+        manager = ChannelManager(
+            connection, LOGGER, {"heartbeat": True, "bulk": False}, lambda: None
+        )
+        manager.open()
+        connection.ioloop.call_later(0.01, lambda: opened.append(manager))
+
+    connection = LocalConnection(broker, on_open_callback=on_connection_open)
+    connection.ioloop.run_for(0.02)
+
+    manager = opened[0]
+    heartbeat = manager.get("heartbeat")
+    bulk = manager.get("bulk")
+    assert heartbeat.channel_number != bulk.channel_number
+    assert manager.confirm("heartbeat")
+    assert not manager.confirm("bulk")
+
+    manager.close()
+    assert heartbeat.is_closed
+    assert bulk.is_closed
+
+
+def run_publisher(broker, flow_control=None, **kwargs):
+    """Create a Publisher on a LocalConnection and return the connection and publisher."""
+
+    state = {}
+
+    def on_channel_open(channel):
+        state["publisher"] = Publisher(
+            state["connection"],
+            channel,
+            LOGGER,
+            flow_control=flow_control,
+            **kwargs,
+        )
+
+    state["connection"] = LocalConnection(
+        broker, on_open_callback=lambda conn: conn.channel(on_channel_open)
+    )
+    state["connection"].ioloop.run_for(0.01)
+    return state["connection"], state["publisher"]
+
+
+def test_publisher_priority_queue():
+    """Test that a Publisher declares a priority queue and urgent messages go first."""
+
+    broker = LocalBroker()
+    connection, publisher = run_publisher(
+        broker,
+        exchange_name="alarm_messages",
+        routing_key="TEST01.alarm",
+        queue_name="alarm_events",
+        queue_binding="*.alarm",
+        max_priority=10,
+    )
+
+    assert publisher.send({"alarm": "low"}, priority=1)
+    assert publisher.send({"alarm": "high"}, priority=9)
+    connection.ioloop.run_for(0.01)
+
+    queue = broker.queues["alarm_events"]
+    assert queue.arguments == {"x-max-priority": 10}
+    assert json.loads(queue.pop()["body"]) == {"alarm": "high"}
+    assert publisher.acked == 2
+    assert publisher.pending_confirms == 0
+
+
+def test_publisher_outbox_while_blocked():
+    """Test that messages are kept in the outbox while blocked and sent after."""
+
+    broker = LocalBroker()
+    flow_control = FlowControl(resume_seconds=0)
+    connection, publisher = run_publisher(
+        broker,
+        flow_control=flow_control,
+        exchange_name="bulk_messages",
+        routing_key="TEST01.bulk",
+        max_outbox=2,
+    )
+
+    flow_control.block()
+    for number in range(3):
+        assert not publisher.send({"number": number})
+
+    assert publisher.outbox_depth == 2
+    assert publisher.dropped == 1
+    assert broker.published == 0
+
+    flow_control.unblock()
+    connection.ioloop.run_for(0.01)
+
+    assert publisher.outbox_depth == 0
+    assert broker.published == 2
+    assert publisher.acked == 2
+
+
+def test_publisher_stops_listening_for_flow_control():
+    """Test that a stopped Publisher no longer listens for flow control."""
+
+    flow_control = FlowControl(resume_seconds=0)
+    _connection, publisher = run_publisher(
+        LocalBroker(),
+        flow_control=flow_control,
+        exchange_name="bulk_messages",
+        routing_key="TEST01.bulk",
+    )
+    assert flow_control._listeners == [  # pylint: disable=protected-access
+        publisher.on_flow_control
+    ]
+
+    publisher.set_stopping(True)
+
+    assert flow_control._listeners == []  # pylint: disable=protected-access
+
+
+def test_publisher_multiple_confirms():
+    """Test that an ack with multiple set confirms every publish up to its tag."""
+
+    _connection, publisher = run_publisher(
+        LocalBroker(), exchange_name="bulk_messages", routing_key="TEST01.bulk"
+    )
+    publisher._deliveries = {1, 2, 3, 4}  # pylint: disable=protected-access
+
+    publisher.on_delivery_confirmation(
+        frame.Method(1, spec.Basic.Ack(delivery_tag=3, multiple=True))
+    )
+    assert publisher.acked == 3
+    assert publisher.pending_confirms == 1
+
+    publisher.on_delivery_confirmation(
+        frame.Method(1, spec.Basic.Nack(delivery_tag=4, multiple=False))
+    )
+    assert publisher.nacked == 1
+    assert publisher.pending_confirms == 0
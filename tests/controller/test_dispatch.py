@@ -0,0 +1,102 @@
+"""Test the dispatch module."""
+import logging
+import threading
+
+from fd_device.controller.dispatch import CommandDispatcher, CommandMetrics
+
+
+class FakeIOLoop:  # pylint: disable=too-few-public-methods
+    """Run threadsafe callbacks straight away, recording the calling thread."""
+
+    def __init__(self):
+        """Create the FakeIOLoop object."""
+        self.threads = []
+
+    def add_callback_threadsafe(self, callback):
+        """Call the callback."""
+        self.threads.append(threading.current_thread().name)
+        callback()
+
+
+class FakeConnection:  # pylint: disable=too-few-public-methods
+    """A connection with a FakeIOLoop."""
+
+    def __init__(self):
+        """Create the FakeConnection object."""
+        self.ioloop = FakeIOLoop()
+
+
+def test_command_metrics():
+    """Test the CommandMetrics counters."""
+
+    metrics = CommandMetrics()
+    metrics.queued("create")
+    metrics.queued("create")
+
+    assert metrics.queue_depth("create") == 2
+    assert metrics.queue_depth() == 2
+
+    metrics.started("create", 0.5)
+    metrics.finished("create", 1.0)
+    metrics.started("create", 0.5)
+    metrics.finished("create", 3.0, error=True)
+
+    stats = metrics.snapshot()["create"]
+    assert metrics.queue_depth("create") == 0
+    assert stats["handled"] == 2
+    assert stats["errors"] == 1
+    assert stats["running"] == 0
+    assert stats["latency_avg"] == 2.0
+    assert stats["latency_max"] == 3.0
+    assert stats["wait_avg"] == 0.5
+
+
+def test_dispatcher_runs_handler_on_worker():
+    """Test that handlers run on a worker and complete through the IOLoop."""
+
+    connection = FakeConnection()
+    dispatcher = CommandDispatcher(connection, logging.getLogger("fd.test"))
+    replies = []
+    handler_threads = []
+
+    def handler(payload, _properties):
+        handler_threads.append(threading.current_thread().name)
+        return {"echo": payload["value"]}
+
+    dispatcher.register("echo", handler)
+    assert dispatcher.dispatch("echo", {"value": 1}, None, replies.append)
+    dispatcher.shutdown(wait=True)
+
+    assert replies == [{"echo": 1}]
+    assert handler_threads[0].startswith("fd-command")
+    assert connection.ioloop.threads[0].startswith("fd-command")
+    assert dispatcher.metrics.snapshot()["echo"]["handled"] == 1
+
+
+def test_dispatcher_handler_error():
+    """Test that a failing handler still completes, with no reply."""
+
+    dispatcher = CommandDispatcher(FakeConnection(), logging.getLogger("fd.test"))
+    replies = []
+
+    def handler(_payload, _properties):
+        raise RuntimeError("broken")
+
+    dispatcher.register("broken", handler)
+    dispatcher.dispatch("broken", {}, None, replies.append)
+    dispatcher.shutdown(wait=True)
+
+    assert replies == [None]
+    assert dispatcher.metrics.snapshot()["broken"]["errors"] == 1
+
+
+def test_dispatcher_unknown_command():
+    """Test that an unknown command completes straight away."""
+
+    dispatcher = CommandDispatcher(FakeConnection(), logging.getLogger("fd.test"))
+    replies = []
+
+    assert not dispatcher.dispatch("unknown", {}, None, replies.append)
+    dispatcher.shutdown(wait=True)
+
+    assert replies == [None]
@@ -0,0 +1,87 @@
+"""Test the flow module."""
+import logging
+import time
+
+from fd_device.controller.connection import Connection
+from fd_device.controller.flow import FlowControl
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+
+
+class LocalTestConnection(Connection):
+    """A Connection that connects to a LocalBroker."""
+
+    def __init__(self, broker):
+        """Create the LocalTestConnection object."""
+        super().__init__(logging.getLogger("fd.test"))
+        self._broker = broker
+
+    def connect(self):
+        """Connect to the LocalBroker instead of RabbitMQ."""
+        connection = LocalConnection(
+            self._broker,
+            on_open_callback=self.on_connection_open,
+            on_close_callback=self.on_connection_closed,
+        )
+        self.add_on_connection_blocked_callbacks(connection)
+        return connection
+
+
+def test_flow_control_block_and_unblock():
+    """Test the FlowControl blocked state, listeners and counters."""
+
+    flow = FlowControl(resume_seconds=0)
+    changes = []
+    flow.add_listener(changes.append)
+
+    assert not flow.blocked
+    assert flow.throttle() == 1.0
+
+    flow.block("low on memory")
+    flow.block("low on memory")
+
+    assert flow.blocked
+    assert flow.reason == "low on memory"
+    assert flow.throttle() == 0.0
+    assert not flow.wait(timeout=0.01)
+
+    flow.unblock()
+
+    assert not flow.blocked
+    assert flow.wait(timeout=0.01)
+    assert changes == [True, False]
+    assert flow.blocked_count == 1
+    assert flow.blocked_seconds > 0
+
+
+def test_flow_control_resume_ramp():
+    """Test that throughput ramps back up after an unblock."""
+
+    flow = FlowControl(resume_seconds=0.05)
+    flow.block()
+    flow.unblock()
+
+    assert flow.throttle() < 1.0
+    time.sleep(0.06)
+    assert flow.throttle() == 1.0
+
+    flow.block()
+    flow.reset()
+    assert flow.throttle() == 1.0
+
+
+def test_connection_honors_blocked():
+    """Test that Connection updates its flow control from the broker."""
+
+    broker = LocalBroker()
+    connection = LocalTestConnection(broker)
+    connection._connection = connection.connect()  # pylint: disable=protected-access
+    ioloop = connection._connection.ioloop  # pylint: disable=protected-access
+    states = []
+
+    ioloop.call_later(0.01, broker.block)
+    ioloop.call_later(0.02, lambda: states.append(connection.flow_control.blocked))
+    ioloop.call_later(0.03, broker.unblock)
+    ioloop.call_later(0.04, lambda: states.append(connection.flow_control.blocked))
+    ioloop.run_for(0.05)
+
+    assert states == [True, False]
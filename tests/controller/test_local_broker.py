@@ -0,0 +1,135 @@
+"""Test the local_broker module."""
+from pika import BasicProperties
+
+from fd_device.controller.local_broker import (
+    LocalBroker,
+    LocalConnection,
+    LocalIOLoop,
+    topic_matches,
+)
+
+
+def test_topic_matches():
+    """Test matching routing keys against topic patterns."""
+
+    assert topic_matches("all.create", "all.create")
+    assert topic_matches("all.*", "all.create")
+    assert topic_matches("#", "all.create")
+    assert topic_matches("device.#", "device")
+    assert topic_matches("*.read_now", "1234.read_now")
+    assert not topic_matches("all.*", "all.create.now")
+    assert not topic_matches("all.create", "all.delete")
+
+
+def test_ioloop_timers():
+    """Test that timers run in order and can be removed."""
+
+    ioloop = LocalIOLoop()
+    calls = []
+    ioloop.call_later(0.02, lambda: calls.append("second"))
+    ioloop.call_later(0.01, lambda: calls.append("first"))
+    handle = ioloop.call_later(0.01, lambda: calls.append("removed"))
+    ioloop.remove_timeout(handle)
+    ioloop.add_callback_threadsafe(lambda: calls.append("now"))
+
+    ioloop.run_for(0.05)
+
+    assert calls == ["now", "first", "second"]
+
+
+def test_publish_consume_and_confirm():
+    """Test a round trip through an exchange, queue and consumer with confirms."""
+
+    broker = LocalBroker()
+    received = []
+    confirms = []
+
+    def on_message(channel, method, properties, body):
+        received.append((method.routing_key, properties.app_id, body))
+        channel.basic_ack(method.delivery_tag)
+
+    def on_channel_open(channel):
+        channel.exchange_declare(exchange="test", exchange_type="topic")
+        channel.queue_declare(queue="", exclusive=True, callback=on_declareok)
+        state["channel"] = channel
+
+    def on_declareok(method_frame):
+        channel = state["channel"]
+        queue = method_frame.method.queue
+        channel.queue_bind(queue=queue, exchange="test", routing_key="all.*")
+        channel.basic_consume(queue=queue, on_message_callback=on_message)
+        channel.confirm_delivery(lambda frame: confirms.append(frame.method.NAME))
+        channel.basic_publish(
+            "test", "all.create", "body", BasicProperties(app_id="device")
+        )
+        channel.basic_publish("test", "other.create", "ignored")
+
+    state = {}
+    connection = LocalConnection(
+        broker, on_open_callback=lambda conn: conn.channel(on_channel_open)
+    )
+    connection.ioloop.run_for(0.05)
+
+    assert received == [("all.create", "device", "body")]
+    assert confirms == ["Basic.Ack", "Basic.Ack"]
+
+
+def test_prefetch_and_requeue():
+    """Test that basic_qos limits deliveries and unacked messages are requeued."""
+
+    broker = LocalBroker()
+    broker.declare_queue("work")
+    received = []
+
+    def on_channel_open(channel):
+        channel.basic_qos(prefetch_count=1)
+        channel.basic_consume(
+            queue="work",
+            on_message_callback=lambda ch, method, props, body: received.append(body),
+        )
+        for number in range(3):
+            channel.basic_publish("", "work", number)
+        state["channel"] = channel
+
+    state = {}
+    connection = LocalConnection(
+        broker, on_open_callback=lambda conn: conn.channel(on_channel_open)
+    )
+    connection.ioloop.run_for(0.02)
+
+    assert received == [0]
+
+    state["channel"].close()
+    assert len(broker.queues["work"].messages) == 3
+    assert broker.queues["work"].messages[0][2]["redelivered"]
+
+
+def test_priority_queue():
+    """Test that a priority queue delivers higher priority messages first."""
+
+    broker = LocalBroker()
+    broker.declare_queue("alarms", arguments={"x-max-priority": 10})
+    ioloop = LocalIOLoop()
+
+    broker.publish("", "alarms", "low", BasicProperties(priority=1), ioloop)
+    broker.publish("", "alarms", "high", BasicProperties(priority=9), ioloop)
+
+    assert broker.queues["alarms"].pop()["body"] == "high"
+
+
+def test_publish_to_missing_exchange_closes_channel():
+    """Test that the channel is closed when publishing to a missing exchange."""
+
+    broker = LocalBroker()
+    reasons = []
+
+    def on_channel_open(channel):
+        channel.add_on_close_callback(lambda ch, reason: reasons.append(reason))
+        channel.basic_publish("missing", "key", "body")
+
+    connection = LocalConnection(
+        broker, on_open_callback=lambda conn: conn.channel(on_channel_open)
+    )
+    connection.ioloop.run_for(0.02)
+
+    assert reasons[0].reply_code == 404
@@ -0,0 +1,79 @@
+"""Test the presence beacon and listener."""
+import asyncio
+import socket
+import threading
+
+from fd_device.controller.presence import (
+    Beacon,
+    BeaconCache,
+    decode_beacon,
+    encode_beacon,
+    listen_for_beacons,
+)
+
+
+def free_udp_port():
+    """Return a UDP port that is free on 127.0.0.1."""
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_beacon_round_trip():
+    """Test packing and unpacking beacons, and reading legacy beacons."""
+
+    beacon = decode_beacon(encode_beacon("10.0.0.5", 5673, "farm", 42), "10.0.0.9")
+    assert beacon == Beacon("10.0.0.5", 5673, "farm", 42, 1)
+
+    beacon = decode_beacon(encode_beacon(""), "10.0.0.9")
+    assert beacon == Beacon("10.0.0.9", 5672, "/", None, 1)
+
+    assert decode_beacon(b"hi", "10.0.0.9") == Beacon("10.0.0.9", None, None, None, 0)
+    assert decode_beacon(b"FD\x01", "10.0.0.9") is None
+    assert decode_beacon(encode_beacon("10.0.0.5")[:-3], "10.0.0.9") is None
+
+
+def test_beacon_cache_orders_by_load():
+    """Test that the least loaded brokers come first, and old beacons are dropped."""
+
+    cache = BeaconCache()
+    cache.add(Beacon("10.0.0.1", 5672, "/", None, 1))
+    cache.add(Beacon("10.0.0.2", 5672, "/", 80, 1))
+    cache.add(Beacon("10.0.0.3", 5672, "/", 10, 1))
+
+    hosts = [beacon.host for beacon in cache.beacons(60)]
+    assert hosts == ["10.0.0.3", "10.0.0.2", "10.0.0.1"]
+    assert cache.beacons(-1) == []
+
+
+def test_listen_for_beacons():
+    """Test that beacons are cached until one is accepted, and the deadline is kept."""
+
+    port = free_udp_port()
+    cache = BeaconCache()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send():
+        for load in (90, 10):
+            sender.sendto(encode_beacon("", load=load), ("127.0.0.1", port))
+
+    timer = threading.Timer(0.2, send)
+    timer.start()
+    beacon = asyncio.run(
+        listen_for_beacons("127.0.0.1", port, 5, lambda beacon: beacon.load < 50, cache)
+    )
+    timer.join()
+    sender.close()
+
+    assert beacon == Beacon("127.0.0.1", 5672, "/", 10, 1)
+    assert len(cache.beacons(60)) == 1
+
+    stop = threading.Event()
+    stop.set()
+    assert (
+        asyncio.run(listen_for_beacons("127.0.0.1", port, 5, bool, cache, stop)) is None
+    )
+    assert asyncio.run(listen_for_beacons("127.0.0.1", port, 0.2, bool, cache)) is None
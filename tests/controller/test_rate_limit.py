@@ -0,0 +1,79 @@
+"""Test the rate_limit module."""
+import logging
+
+from fd_device.controller.connection import Publisher
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+from fd_device.controller.rate_limit import RateLimiter, TokenBucket
+
+LOGGER = logging.getLogger("fd.test")
+
+
+def test_token_bucket_burst_and_refill():
+    """Test that a bucket allows a burst, then refills at its rate."""
+
+    bucket = TokenBucket(rate=100, burst=3)
+
+    assert all(bucket.try_consume() for _ in range(3))
+    assert not bucket.try_consume()
+    assert 0 < bucket.delay() <= 0.01
+
+    bucket.tokens = 0
+    bucket._last -= 0.02  # pylint: disable=protected-access
+    assert bucket.try_consume()
+    assert bucket.try_consume()
+    assert bucket.tokens < 1
+
+
+def test_rate_limiter_counts_deferred():
+    """Test the per traffic class buckets and counters."""
+
+    limiter = RateLimiter({"bulk": (1, 2)})
+
+    assert limiter.try_acquire("bulk")
+    assert limiter.try_acquire("bulk")
+    assert not limiter.try_acquire("bulk")
+    assert limiter.delay("bulk") > 0
+
+    # traffic classes without a bucket are not limited
+    assert limiter.try_acquire("other")
+    assert limiter.delay("other") == 0.0
+
+    assert limiter.stats() == {"bulk": {"allowed": 2, "deferred": 1}}
+
+
+def test_publisher_defers_over_the_limit():
+    """Test that a Publisher keeps messages over the limit in its outbox."""
+
+    broker = LocalBroker()
+    limiter = RateLimiter({"bulk": (50, 2)})
+    state = {}
+
+    def on_channel_open(channel):
+        state["publisher"] = Publisher(
+            state["connection"],
+            channel,
+            LOGGER,
+            exchange_name="bulk_messages",
+            routing_key="TEST01.bulk",
+            rate_limiter=limiter,
+            traffic_class="bulk",
+        )
+
+    state["connection"] = LocalConnection(
+        broker, on_open_callback=lambda conn: conn.channel(on_channel_open)
+    )
+    connection = state["connection"]
+    connection.ioloop.run_for(0.01)
+    publisher = state["publisher"]
+
+    results = [publisher.send({"number": number}) for number in range(4)]
+
+    assert results == [True, True, False, False]
+    assert publisher.outbox_depth == 2
+    assert broker.published == 2
+
+    connection.ioloop.run_for(0.2)
+
+    assert publisher.outbox_depth == 0
+    assert broker.published == 4
+    assert limiter.deferred["bulk"] >= 1
@@ -0,0 +1,84 @@
+"""Test the engine and sessions of the database base module."""
+import multiprocessing
+
+import pytest
+
+from fd_device.database import base
+from fd_device.database.device import Device
+
+
+def engine_of_child(queue):
+    """Put whether the child process replaced the engine of its parent on the queue."""
+    parent_engine = base._ENGINE  # pylint: disable=protected-access
+    queue.put(base.get_engine() is not parent_engine)
+
+
+def test_engine_shared_by_sessions():
+    """Test that every session of a process uses the same engine."""
+
+    engine = base.get_engine()
+    first = base.get_session()
+    second = base.get_session()
+
+    assert base.get_engine() is engine
+    assert first.get_bind() is engine
+    assert second.get_bind() is engine
+    assert first() is not second()
+
+    first.close()
+    second.close()
+
+
+def test_engine_not_shared_with_child_process():
+    """Test that a forked process creates an engine of its own."""
+
+    engine = base.get_engine()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=engine_of_child, args=(queue,))
+    process.start()
+    replaced = queue.get(timeout=10)
+    process.join()
+
+    assert replaced
+    assert base.get_engine() is engine
+
+
+def test_dispose_engine():
+    """Test that a disposed engine is replaced on next use."""
+
+    engine = base.get_engine()
+    base.dispose_engine()
+
+    assert base.get_engine() is not engine
+
+
+@pytest.mark.usefixtures("tables")
+def test_get_by_id_without_session(dbsession):
+    """Test that get_by_id works without a session, through the lazily bound Model.query."""
+
+    device_id = Device(device_id="TEST01").save(dbsession).id
+    dbsession.close()
+    base.dispose_engine()
+
+    assert Device.get_by_id(device_id).device_id == "TEST01"
+    assert Device.get_by_id("x") is None
+
+
+def test_engine_replaced_after_pid_change(monkeypatch):
+    """Test that a new pid gets a new engine, and the inherited one is not disposed."""
+
+    engine = base.get_engine()
+    monkeypatch.setattr(
+        engine, "dispose", lambda *args, **kwargs: pytest.fail("disposed")
+    )
+    monkeypatch.setattr(base.os, "getpid", lambda: -1)
+
+    child_engine = base.get_engine()
+
+    assert child_engine is not engine
+    assert engine in base._INHERITED_ENGINES  # pylint: disable=protected-access
+    assert base.get_session().get_bind() is child_engine
+
+    monkeypatch.undo()
+    base.dispose_engine()
@@ -0,0 +1,73 @@
+"""Test the bulk_upsert of the CRUDMixin."""
+import pytest
+
+from fd_device.database.database import SyncVersion
+from fd_device.database.device import Grainbin
+from fd_device.database.system import Interface
+
+
+@pytest.mark.usefixtures("tables")
+def test_bulk_upsert_inserts_and_updates(dbsession):
+    """Test that new rows are inserted and existing rows updated in one call."""
+
+    Interface("eth0").save(dbsession)
+
+    count = Interface.bulk_upsert(
+        dbsession,
+        [
+            {"interface": "eth0", "state": "dhcp"},
+            {"interface": "wlan0", "state": "ap"},
+        ],
+        index_elements=["interface"],
+    )
+
+    interfaces = {
+        interface.interface: interface.state
+        for interface in dbsession.query(Interface).all()
+    }
+    assert count == 2
+    assert interfaces == {"eth0": "dhcp", "wlan0": "ap"}
+    assert dbsession.query(SyncVersion).get("interfaces").version > 0
+
+
+@pytest.mark.usefixtures("tables")
+def test_bulk_upsert_update_columns(dbsession):
+    """Test that only the update_columns change on existing rows."""
+
+    grainbin = Grainbin("TEST01.00", 0, 1)
+    grainbin.average_temp = "20.5"
+    grainbin.save(dbsession)
+    last_updated = grainbin.last_updated
+
+    Grainbin.bulk_upsert(
+        dbsession,
+        [
+            {"name": "TEST01.00", "bus_number": 3, "device_id": 1},
+            {"name": "TEST01.01", "bus_number": 1, "device_id": 1},
+        ],
+        index_elements=["name"],
+        update_columns=["bus_number"],
+    )
+    dbsession.expire_all()
+
+    assert grainbin.bus_number == 3
+    assert grainbin.average_temp == "20.5"
+    assert grainbin.last_updated >= last_updated
+    assert dbsession.query(Grainbin).count() == 2
+    assert Grainbin.bulk_upsert(dbsession, [], index_elements=["name"]) == 0
+
+
+@pytest.mark.usefixtures("tables")
+def test_bulk_upsert_unchanged_rows(dbsession):
+    """Test that upserting rows that did not change keeps the sync version."""
+
+    rows = [{"interface": "eth0", "state": "dhcp"}]
+    assert Interface.bulk_upsert(dbsession, rows, index_elements=["interface"]) == 1
+    version = dbsession.query(SyncVersion).get("interfaces").version
+
+    assert Interface.bulk_upsert(dbsession, rows, index_elements=["interface"]) == 0
+    assert dbsession.query(SyncVersion).get("interfaces").version == version
+
+    rows[0]["state"] = "static"
+    assert Interface.bulk_upsert(dbsession, rows, index_elements=["interface"]) == 1
+    assert dbsession.query(SyncVersion).get("interfaces").version > version
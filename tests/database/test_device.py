@@ -3,7 +3,7 @@ import datetime as dt
 
 import pytest
 
-from fd_device.database.device import Connection, Device, Grainbin
+from fd_device.database.device import BrokerAddress, Connection, Device, Grainbin
 
 from .factories import DeviceFactory, GrainbinFactory
 
@@ -37,6 +37,22 @@ class TestConnection:
         assert bool(connection.is_connected)
 
 
+@pytest.mark.usefixtures("tables")
+class TestBrokerAddress:
+    """BrokerAddress model tests."""
+
+    @staticmethod
+    def test_long_broker_address(dbsession):
+        """Hostnames and IPv6 addresses fit in the address column."""
+
+        address = "rabbitmq-primary.grain-site-north.farm-monitor.example.com"
+        broker = BrokerAddress(address)
+        broker.save(dbsession)
+
+        assert BrokerAddress.__table__.c.address.type.length >= 255
+        assert dbsession.query(BrokerAddress).one().address == address
+
+
 @pytest.mark.usefixtures("tables")
 class TestDevice:
     """Device model tests."""
@@ -0,0 +1,68 @@
+"""Test the read-through cache of the singleton rows."""
+import pytest
+
+from fd_device.database.database import SINGLETON_CACHE
+from fd_device.database.device import Connection, Device
+from fd_device.database.system import Hardware
+from fd_device.settings import get_config
+
+
+def count_queries(session, monkeypatch):
+    """Count the queries of a session."""
+    queries = []
+    query = session.query
+
+    def counting_query(*args, **kwargs):
+        queries.append(args)
+        return query(*args, **kwargs)
+
+    monkeypatch.setattr(session, "query", counting_query)
+    return queries
+
+
+@pytest.mark.usefixtures("tables")
+def test_singleton_read_through(dbsession, monkeypatch):
+    """Test that a singleton row is read once, and re-read after it changes."""
+
+    device = Device(device_id="TEST01")
+    device.save(dbsession)
+    queries = count_queries(dbsession, monkeypatch)
+
+    assert SINGLETON_CACHE.get(dbsession, Device).device_id == "TEST01"
+    assert SINGLETON_CACHE.get(dbsession, Device).device_id == "TEST01"
+    assert len(queries) == 1
+
+    device.update(dbsession, hardware_version="2.0")
+    assert SINGLETON_CACHE.get(dbsession, Device).hardware_version == "2.0"
+
+    device.delete(dbsession)
+    assert SINGLETON_CACHE.get(dbsession, Device) is None
+
+
+@pytest.mark.usefixtures("tables")
+def test_singleton_invalidated_by_orm_changes(dbsession):
+    """Test that changes made without the CRUDMixin methods invalidate the cache."""
+
+    dbsession.add(Connection())
+    dbsession.commit()
+    assert SINGLETON_CACHE.get(dbsession, Connection).address is None
+
+    dbsession.query(Connection).first().address = "10.0.0.5"
+    dbsession.commit()
+    assert SINGLETON_CACHE.get(dbsession, Connection).address == "10.0.0.5"
+
+    dbsession.query(Connection).update({"address": "10.0.0.6"})
+    dbsession.commit()
+    assert SINGLETON_CACHE.get(dbsession, Connection).address == "10.0.0.6"
+
+
+@pytest.mark.usefixtures("tables")
+def test_singleton_max_age(dbsession, monkeypatch):
+    """Test that a cached row is re-read once it is too old."""
+
+    assert SINGLETON_CACHE.get(dbsession, Hardware) is None
+    queries = count_queries(dbsession, monkeypatch)
+    monkeypatch.setattr(get_config(), "SINGLETON_CACHE_MAX_AGE", -1)
+
+    assert SINGLETON_CACHE.get(dbsession, Hardware) is None
+    assert len(queries) == 1
@@ -0,0 +1,153 @@
+"""Test the gateway module, with peer devices in separate processes."""
+import json
+import logging
+import multiprocessing
+
+import pytest
+
+from fd_device.controller.connection import Publisher
+from fd_device.controller.local_broker import LocalBroker, LocalConnection, LocalIOLoop
+from fd_device.device import gateway as gateway_module
+from fd_device.device.gateway import (
+    Gateway,
+    GatewayPeerPublisher,
+    PeerDevice,
+    decode_update,
+    encode_update,
+    run_peer,
+)
+
+
+def test_encode_and_decode_update():
+    """Test packing and unpacking update datagrams."""
+
+    datagram = encode_update(3, "TEST01", {"grainbin_data": [{"bus_number": 0}]})
+
+    assert decode_update(datagram) == (
+        3,
+        "TEST01",
+        {"grainbin_data": [{"bus_number": 0}]},
+    )
+    assert decode_update(datagram[:8]) is None
+    assert decode_update(datagram[:-1]) is None
+
+
+def run_peer_process(port, device_id, results):
+    """Run a PeerDevice that sends one update to the gateway, then report its state."""
+
+    peer = PeerDevice(
+        device_id, "127.0.0.1", port, sweep_interval=60, ioloop=LocalIOLoop()
+    )
+    peer.heartbeat.HEARTBEAT_INTERVAL = 0.05
+    peer.heartbeat.TIMEOUT = 0.03
+    peer.start()
+    peer.ioloop.call_later(
+        0.1, lambda: peer.publisher.send({"grainbin_data": [device_id]})
+    )
+    peer.ioloop.run_for(0.5)
+    peer.stop()
+    results.put((device_id, peer.heartbeat.STATE))
+
+
+def start_gateway(broker, **kwargs):
+    """Start a Gateway on a LocalConnection, and return the connection and gateway."""
+
+    state = {}
+
+    def on_channel_open(channel):
+        publisher = Publisher(
+            state["connection"],
+            channel,
+            logging.getLogger("fd.test"),
+            exchange_name="gateway_messages",
+            routing_key="GATEWAY.gateway",
+            queue_name="gateway_events",
+            queue_binding="*.gateway",
+        )
+        state["gateway"] = Gateway(
+            state["connection"],
+            publisher,
+            "GATEWAY",
+            host="127.0.0.1",
+            port=0,
+            **kwargs,
+        )
+        state["gateway"].start()
+
+    state["connection"] = LocalConnection(
+        broker, on_open_callback=lambda conn: conn.channel(on_channel_open)
+    )
+    state["connection"].ioloop.run_for(0.01)
+    return state["connection"], state["gateway"]
+
+
+def test_gateway_forwards_peers_in_batches():
+    """Test that the heartbeats and updates of peer processes are forwarded upstream in batches."""
+
+    broker = LocalBroker()
+    connection, gateway = start_gateway(broker, flush_interval=0.1)
+    port = gateway.address[1]
+
+    results = multiprocessing.Queue()
+    peers = [
+        multiprocessing.Process(
+            target=run_peer_process, args=(port, f"PEER{number}", results)
+        )
+        for number in range(3)
+    ]
+    for peer in peers:
+        peer.start()
+
+    connection.ioloop.run_for(1.0)
+    for peer in peers:
+        peer.join(timeout=5)
+    gateway.stop()
+
+    states = dict(results.get(timeout=1) for _ in peers)
+    assert states == {"PEER0": "connected", "PEER1": "connected", "PEER2": "connected"}
+
+    batches = []
+    queue = broker.queues["gateway_events"]
+    while queue.messages:
+        batches.append(json.loads(queue.pop()["body"]))
+
+    heartbeat_peers = {peer for batch in batches for peer in batch["heartbeats"]}
+    updates = [update for batch in batches for update in batch["updates"]]
+    assert heartbeat_peers == {"PEER0", "PEER1", "PEER2"}
+    assert sorted(update["message"]["grainbin_data"][0] for update in updates) == [
+        "PEER0",
+        "PEER1",
+        "PEER2",
+    ]
+    # one upstream message carries the traffic of several peers
+    assert len(batches) < gateway.received
+    assert gateway.forwarded >= len(updates)
+    assert set(gateway.peers) == {"PEER0", "PEER1", "PEER2"}
+
+
+def test_gateway_flushes_full_batch():
+    """Test that a full batch is published without waiting for the flush interval."""
+
+    broker = LocalBroker()
+    connection, gateway = start_gateway(broker, batch_size=2, flush_interval=60)
+    publisher = GatewayPeerPublisher("127.0.0.1", gateway.address[1], "PEER0")
+
+    assert publisher.send({"number": 1})
+    assert publisher.send({"number": 2})
+    connection.ioloop.run_for(0.2)
+    gateway.stop()
+    publisher.close()
+
+    batch = json.loads(broker.queues["gateway_events"].pop()["body"])
+    assert [update["message"]["number"] for update in batch["updates"]] == [1, 2]
+    assert gateway.batches == 1
+
+
+@pytest.mark.usefixtures("tables")
+def test_run_peer_without_device(monkeypatch):
+    """Test that a peer with no device configured does not start."""
+
+    monkeypatch.setattr(
+        gateway_module, "PeerDevice", lambda *args: pytest.fail("should not start")
+    )
+    run_peer()
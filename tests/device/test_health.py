@@ -0,0 +1,102 @@
+"""Test the health module."""
+import logging
+
+from fd_device.controller.dispatch import CommandMetrics
+from fd_device.controller.local_broker import LocalIOLoop
+from fd_device.device import health as health_module
+from fd_device.device.health import HealthMonitor, pack_health, unpack_health
+from fd_device.grainbin.cache import READING_CACHE
+from fd_device.system.info import UNKNOWN_CPU_TEMPERATURE
+
+
+class FakeSource:  # pylint: disable=too-few-public-methods
+    """Stand in for a Publisher and a GrainbinSweep."""
+
+    outbox_depth = 4
+    last_duration = 2.5
+
+
+def test_pack_and_unpack_health():
+    """Test that a summary keeps its values and unknowns when packed."""
+
+    summary = {
+        "reading_age": None,
+        "outbox_depth": 70000,
+        "sweep_duration": 0.123,
+        "cpu_temperature": -5.5,
+        "disk_free_mb": None,
+    }
+
+    assert len(pack_health(summary)) == 18
+    assert unpack_health(pack_health(summary)) == summary
+
+
+def test_health_summary(monkeypatch):
+    """Test the summary reads the counters and the cached system values."""
+
+    monkeypatch.setattr(health_module, "get_cpu_temperature", lambda: 51.2)
+    READING_CACHE.clear()
+    monitor = HealthMonitor(refresh_interval=60)
+
+    summary = monitor.summary()
+    assert summary == {
+        "reading_age": None,
+        "outbox_depth": 0,
+        "sweep_duration": None,
+        "cpu_temperature": None,
+        "disk_free_mb": None,
+    }
+
+    ioloop = LocalIOLoop()
+    monitor.start(ioloop)
+    monitor.stop()
+    monitor._executor.shutdown(wait=True)  # pylint: disable=protected-access
+
+    source = FakeSource()
+    monitor.publishers = [source, source]
+    monitor.sweep = source
+    READING_CACHE.store("bus", [])
+
+    summary = monitor.summary()
+    READING_CACHE.clear()
+
+    assert summary["reading_age"] == 0
+    assert summary["outbox_depth"] == 8
+    assert summary["sweep_duration"] == 2.5
+    assert summary["cpu_temperature"] == 51.2
+    assert summary["disk_free_mb"] > 0
+
+
+def test_health_unknown_cpu_temperature(monkeypatch):
+    """Test that a CPU temperature that could not be read is sent as unknown."""
+
+    monkeypatch.setattr(
+        health_module, "get_cpu_temperature", lambda: UNKNOWN_CPU_TEMPERATURE
+    )
+    monitor = HealthMonitor(refresh_interval=60)
+    monitor.refresh()
+
+    assert monitor.summary()["cpu_temperature"] is None
+
+
+def test_health_logs_command_metrics(monkeypatch, caplog):
+    """Test that a refresh logs the queue depth and latency of the commands."""
+
+    monkeypatch.setattr(health_module, "get_cpu_temperature", lambda: 51.2)
+    metrics = CommandMetrics()
+    metrics.queued("create")
+    metrics.queued("create")
+    metrics.started("create", 0.5)
+    metrics.finished("create", 1.5, error=True)
+    monitor = HealthMonitor(refresh_interval=60)
+    monitor.refresh()
+    assert not caplog.records
+
+    monitor.commands = metrics
+    with caplog.at_level(logging.INFO, logger="fd.device.health"):
+        monitor.refresh()
+
+    assert caplog.messages == [
+        "Command create: 1 handled, 1 errors, 1 queued, 0 running, "
+        "wait 0.500s avg, latency 1.500s avg 1.500s max"
+    ]
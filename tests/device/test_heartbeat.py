@@ -0,0 +1,116 @@
+"""Test the heartbeat module."""
+# pylint: disable=protected-access
+import pytest
+
+from fd_device.controller.local_broker import LocalIOLoop
+from fd_device.device.heartbeat import (
+    KIND_ACK,
+    KIND_BEAT,
+    MAX_DEVICE_ID,
+    UdpHeartbeat,
+    UdpHeartbeatResponder,
+    decode_heartbeat,
+    encode_device_id,
+    encode_heartbeat,
+)
+
+
+def test_encode_and_decode_heartbeat():
+    """Test packing and unpacking heartbeat datagrams."""
+
+    health = {
+        "reading_age": 12,
+        "outbox_depth": 3,
+        "sweep_duration": 1.25,
+        "cpu_temperature": 48.3,
+        "disk_free_mb": 2048,
+    }
+    datagram = encode_heartbeat(KIND_BEAT, 7, "TEST01", health)
+
+    assert len(datagram) == 8 + 18 + 6
+    assert decode_heartbeat(datagram) == (KIND_BEAT, 7, "TEST01", health)
+    assert decode_heartbeat(encode_heartbeat(KIND_ACK, 7, "TEST01")) == (
+        KIND_ACK,
+        7,
+        "TEST01",
+        None,
+    )
+    assert decode_heartbeat(b"junk") is None
+    assert decode_heartbeat(b"XX" + datagram[2:]) is None
+
+
+def test_encode_heartbeat_long_device_id():
+    """Test that a device_id over MAX_DEVICE_ID bytes is rejected, not truncated."""
+
+    # each character is two bytes, so a truncation would split the last one
+    device_id = "é" * (MAX_DEVICE_ID // 2)
+    datagram = encode_heartbeat(KIND_ACK, 1, device_id)
+    assert decode_heartbeat(datagram)[2] == device_id
+
+    with pytest.raises(ValueError):
+        encode_heartbeat(KIND_ACK, 1, device_id + "é")
+
+
+@pytest.mark.parametrize("device_id", [None, ""])
+def test_encode_missing_device_id(device_id):
+    """Test that a device without a device_id is rejected with a ValueError."""
+
+    with pytest.raises(ValueError):
+        encode_device_id(device_id)
+
+
+def run_udp_heartbeat(address, seconds, state=None):
+    """Run a UdpHeartbeat to address for a number of seconds, and return it."""
+
+    ioloop = LocalIOLoop()
+    heartbeat = UdpHeartbeat(ioloop, address[0], "TEST01", address[1])
+    heartbeat.HEARTBEAT_INTERVAL = 0.02
+    heartbeat.TIMEOUT = 0.01
+    if state:
+        heartbeat.STATE = state
+    heartbeat.start()
+    ioloop.run_for(seconds)
+    heartbeat.set_stopping(True)
+    return heartbeat
+
+
+def test_udp_heartbeat_connects():
+    """Test that a UdpHeartbeat reaches the connected state when acks arrive."""
+
+    responder = UdpHeartbeatResponder()
+    responder.start()
+    try:
+        heartbeat = run_udp_heartbeat(responder.address, 0.2)
+    finally:
+        responder.stop()
+
+    assert heartbeat.STATE == "connected"
+    assert heartbeat._timeouts_missed == 0
+    assert responder.received >= heartbeat._message_number - 1
+    assert responder.devices == {"TEST01"}
+    assert responder.health["TEST01"]["outbox_depth"] is None
+
+
+def test_udp_heartbeat_disconnects_without_acks():
+    """Test that a UdpHeartbeat disconnects when no acks arrive."""
+
+    responder = UdpHeartbeatResponder()
+    address = responder.address
+    # bound but never answering
+    try:
+        heartbeat = run_udp_heartbeat(address, 0.2, state="connected")
+    finally:
+        responder.stop()
+
+    assert heartbeat.STATE == "disconnected"
+    assert heartbeat._timeouts_missed > heartbeat.MAX_MISSED_TIMEOUTS
+
+
+def test_responder_ignores_acks():
+    """Test that the responder only answers heartbeats."""
+
+    responder = UdpHeartbeatResponder()
+    responder.respond(encode_heartbeat(KIND_ACK, 1, "TEST01"), ("127.0.0.1", 9))
+    responder.stop()
+
+    assert responder.received == 0
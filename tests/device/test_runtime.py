@@ -0,0 +1,88 @@
+"""Test the runtime module."""
+import pytest
+
+from fd_device.database.device import RuntimeConfig
+from fd_device.device import service
+from fd_device.device.heartbeat import HeartbeatState
+from fd_device.device.runtime import RuntimeSettings
+from fd_device.settings import get_config
+
+
+@pytest.mark.usefixtures("tables")
+def test_runtime_settings_update_and_load(dbsession):
+    """Test that changes are validated, persisted and passed to the listeners."""
+
+    runtime = RuntimeSettings()
+    changes = []
+    runtime.add_listener(changes.append)
+
+    assert runtime.snapshot()["sweep_interval"] == get_config().SWEEP_INTERVAL
+
+    values = runtime.update(
+        dbsession,
+        {
+            "sweep_interval": 60,
+            "sweep_resolution": "temperature12",
+            "sweep_batch_size": 5,
+        },
+    )
+
+    assert values["sweep_interval"] == 60
+    assert changes == [values]
+    row = dbsession.query(RuntimeConfig).one()
+    assert row.sweep_resolution == "temperature12"
+    assert row.sweep_deadband is None
+
+    loaded = RuntimeSettings()
+    loaded.load(dbsession)
+    assert loaded.snapshot() == values
+
+    values = runtime.update(dbsession, {"sweep_interval": None})
+    assert values["sweep_interval"] == get_config().SWEEP_INTERVAL
+    assert dbsession.query(RuntimeConfig).count() == 1
+
+
+@pytest.mark.usefixtures("tables")
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"sweep_interval": 0},
+        {"heartbeat_interval": 0.5},
+        {"heartbeat_interval": HeartbeatState.TIMEOUT},
+        {"sweep_deadband": -1},
+        {"sweep_batch_size": 2.5},
+        {"sweep_resolution": "temperature8"},
+        {"sweep_speed": 1},
+        {"sweep_interval": 10, "sweep_batch_size": "many"},
+    ],
+)
+def test_runtime_settings_rejects_invalid(dbsession, changes):
+    """Test that an invalid change is rejected and nothing is changed."""
+
+    runtime = RuntimeSettings()
+    before = runtime.snapshot()
+
+    with pytest.raises(ValueError):
+        runtime.update(dbsession, changes)
+
+    assert runtime.snapshot() == before
+    assert dbsession.query(RuntimeConfig).count() == 0
+
+
+@pytest.mark.usefixtures("tables")
+def test_handle_configure(dbsession, monkeypatch):
+    """Test the configure command reply."""
+
+    monkeypatch.setattr(service, "get_session", lambda: dbsession)
+    runtime = RuntimeSettings()
+
+    reply = service.handle_configure(
+        runtime, {"command": "configure", "sweep_deadband": 0.5}, None
+    )
+    assert reply["command"] == "configure"
+    assert reply["sweep_deadband"] == 0.5
+    assert "error" not in reply
+
+    reply = service.handle_configure(runtime, {"sweep_interval": -5}, None)
+    assert "sweep_interval" in reply["error"]
+    assert reply["sweep_deadband"] == 0.5
@@ -0,0 +1,52 @@
+"""Test the schedule module."""
+import pytest
+
+from fd_device.device.schedule import Schedule, phase_fraction
+
+
+def test_phase_fraction_is_stable():
+    """Test that the phase fraction only depends on the device_id."""
+
+    assert phase_fraction("TEST01") == phase_fraction("TEST01")
+    assert phase_fraction("TEST01") != phase_fraction("TEST02")
+    assert 0 <= phase_fraction("TEST01") < 1
+
+
+def test_phase_fractions_spread():
+    """Test that many devices are spread across the interval."""
+
+    fractions = [phase_fraction(f"device{number}") for number in range(1000)]
+    buckets = [0] * 10
+    for fraction in fractions:
+        buckets[int(fraction * 10)] += 1
+
+    assert min(buckets) > 50
+
+
+def test_next_delay_lands_on_offset():
+    """Test that ticks fall at the device's offset within the interval."""
+
+    schedule = Schedule("TEST01")
+    schedule.set_slot(1, 4)
+
+    assert schedule.offset(60) == 15
+    assert schedule.next_delay(60, now=600) == 15
+    assert schedule.next_delay(60, now=614) == 1 + 60
+    assert schedule.next_delay(60, now=616) == 59
+
+
+def test_set_slot():
+    """Test setting and clearing a server assigned slot."""
+
+    schedule = Schedule("TEST01")
+    schedule.set_slot(2, 4)
+
+    assert schedule.fraction == 0.5
+    assert schedule.info() == {"slot": 2, "slot_count": 4, "fraction": 0.5}
+
+    with pytest.raises(ValueError):
+        schedule.set_slot(4, 4)
+
+    schedule.clear_slot()
+    assert schedule.fraction == phase_fraction("TEST01")
+    assert schedule.slot is None
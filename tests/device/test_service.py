@@ -0,0 +1,368 @@
+"""Test the device service module against the LocalBroker."""
+# pylint: disable=protected-access
+import json
+import logging
+import threading
+
+import pytest
+from pika import BasicProperties
+
+from fd_device.controller.flow import FlowControl
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+from fd_device.database.device import Connection as db_Connection
+from fd_device.database.device import Device
+from fd_device.device import service
+from fd_device.device.benchmark import percentile, run_rate
+from fd_device.device.health import HEALTH_KEYS, HealthMonitor
+from fd_device.device.heartbeat import UdpHeartbeat
+from fd_device.device.schedule import Schedule
+from fd_device.device.service import DeviceConnection, HeartbeatMessage, ServerMessage
+from fd_device.settings import get_config
+
+
+def open_connection(broker, on_channel_open):
+    """Open a LocalConnection and call on_channel_open(connection, channel)."""
+
+    def on_connection_open(connection):
+        connection.channel(lambda channel: on_channel_open(connection, channel))
+
+    return LocalConnection(broker, on_open_callback=on_connection_open)
+
+
+def test_heartbeat_connects():
+    """Test that a HeartbeatMessage reaches the connected state when replies arrive."""
+
+    broker = LocalBroker()
+    broker.add_responder("heartbeat_messages", "heartbeat", lambda _, body: body)
+    state = {}
+
+    def on_channel_open(connection, channel):
+        heartbeat = HeartbeatMessage(connection, channel, "TEST01")
+        heartbeat.HEARTBEAT_INTERVAL = 0.01
+        state["heartbeat"] = heartbeat
+
+    connection = open_connection(broker, on_channel_open)
+    connection.ioloop.run_for(0.1)
+
+    heartbeat = state["heartbeat"]
+    assert heartbeat.STATE == "connected"
+    assert heartbeat._acked > 0
+
+
+def test_heartbeat_carries_health():
+    """Test that the health summary is sent with every heartbeat."""
+
+    broker = LocalBroker()
+    bodies = []
+    broker.add_responder(
+        "heartbeat_messages", "heartbeat", lambda _, body: bodies.append(body)
+    )
+    state = {}
+
+    def on_channel_open(connection, channel):
+        heartbeat = HeartbeatMessage(
+            connection, channel, "TEST01", health=HealthMonitor()
+        )
+        heartbeat.HEARTBEAT_INTERVAL = 0.01
+        state["heartbeat"] = heartbeat
+
+    connection = open_connection(broker, on_channel_open)
+    connection.ioloop.run_for(0.05)
+
+    message = json.loads(bodies[0])
+    assert message["heartbeat"] == 0
+    assert set(message["health"]) == set(HEALTH_KEYS)
+
+
+def test_heartbeat_disconnects_without_replies():
+    """Test that a HeartbeatMessage disconnects when no replies arrive."""
+
+    broker = LocalBroker()
+    broker.add_responder("heartbeat_messages", "heartbeat", lambda _, body: None)
+    state = {}
+
+    def on_channel_open(connection, channel):
+        heartbeat = HeartbeatMessage(connection, channel, "TEST01")
+        heartbeat.HEARTBEAT_INTERVAL = 0.01
+        heartbeat.TIMEOUT = 0.005
+        heartbeat.STATE = "connected"
+        state["heartbeat"] = heartbeat
+
+    connection = open_connection(broker, on_channel_open)
+    connection.ioloop.run_for(0.1)
+
+    assert state["heartbeat"].STATE == "disconnected"
+
+
+def test_server_message_read_now(monkeypatch):
+    """Test that a read_now command is answered on the reply queue."""
+
+    monkeypatch.setattr(
+        service,
+        "read_grainbin",
+        lambda bus_number, sensor, max_age: {"bus_number": bus_number},
+    )
+    broker = LocalBroker()
+    broker.declare_exchange("device_messages", "topic")
+    broker.declare_queue("replies")
+    state = {}
+
+    def on_channel_open(connection, channel):
+        state["server"] = ServerMessage(connection, channel, "TEST01")
+        properties = BasicProperties(reply_to="replies", correlation_id="abc")
+        body = json.dumps({"command": "read_now", "bus_number": 2})
+        connection.ioloop.call_later(
+            0.01,
+            lambda: channel.basic_publish(
+                "device_messages", "TEST01.read_now", body, properties
+            ),
+        )
+
+    connection = open_connection(broker, on_channel_open)
+    connection.ioloop.run_for(0.1)
+    state["server"].dispatcher.shutdown()
+
+    reply = broker.queues["replies"].pop()
+    assert reply["properties"].correlation_id == "abc"
+    assert json.loads(reply["body"]) == {"command": "read_now", "bus_number": 2}
+    assert state["server"].dispatcher.metrics.snapshot()["read_now"]["handled"] == 1
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"bus_number": "two"},
+        {"bus_number": 2, "max_age": "soon"},
+        {"bus_number": 2, "sensor": "../../etc"},
+    ],
+)
+def test_handle_read_now_invalid(monkeypatch, payload):
+    """Test that a read_now command with bad arguments gets an error reply."""
+
+    monkeypatch.setattr(
+        service, "read_grainbin", lambda *args: pytest.fail("should not read")
+    )
+    reply = service.handle_read_now(dict(payload, command="read_now"), None)
+
+    assert reply["command"] == "read_now"
+    assert "error" in reply
+
+
+def test_percentile():
+    """Test the nearest rank percentile."""
+
+    assert percentile([], 50) == 0.0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 99) == 99
+
+
+def test_run_rate():
+    """Test a short benchmark run."""
+
+    result = run_rate(rate=100, duration=0.1)
+
+    assert result["sent"] > 0
+    assert result["confirmed"] == result["sent"]
+    assert result["confirm_p99_ms"] >= result["confirm_p50_ms"]
+
+
+def test_heartbeat_paused_while_blocked():
+    """Test that heartbeats are held back while the connection is blocked."""
+
+    broker = LocalBroker()
+    broker.add_responder("heartbeat_messages", "heartbeat", lambda _, body: body)
+    flow_control = FlowControl()
+    flow_control.block("low on memory")
+    state = {}
+
+    def on_channel_open(connection, channel):
+        heartbeat = HeartbeatMessage(connection, channel, "TEST01", flow_control)
+        heartbeat.HEARTBEAT_INTERVAL = 0.01
+        heartbeat.TIMEOUT = 0.005
+        heartbeat.STATE = "connected"
+        state["heartbeat"] = heartbeat
+
+    connection = open_connection(broker, on_channel_open)
+    connection.ioloop.run_for(0.05)
+
+    heartbeat = state["heartbeat"]
+    assert broker.published == 0
+    assert heartbeat.STATE == "connected"
+
+    flow_control.unblock()
+    connection.ioloop.run_for(0.05)
+
+    assert broker.published > 0
+    assert heartbeat.STATE == "connected"
+
+
+class LocalDeviceConnection(DeviceConnection):
+    """A DeviceConnection that connects to a LocalBroker."""
+
+    def __init__(self, broker):
+        """Create the LocalDeviceConnection object."""
+        super().__init__(logging.getLogger("fd.test"))
+        self._broker = broker
+
+    def connect(self):
+        """Connect to the LocalBroker instead of RabbitMQ."""
+        connection = LocalConnection(
+            self._broker,
+            on_open_callback=self.on_connection_open,
+            on_close_callback=self.on_connection_closed,
+        )
+        self.add_on_connection_blocked_callbacks(connection)
+        return connection
+
+
+@pytest.mark.usefixtures("tables")
+def test_udp_heartbeat_without_device_id():
+    """Test that a device without a device_id falls back to AMQP heartbeats."""
+
+    device_connection = LocalDeviceConnection(LocalBroker())
+    device_connection.heartbeat_transport = "udp"
+    device_connection._connection = device_connection.connect()
+    device_connection._connection.ioloop.run_for(0.02)
+
+    assert device_connection.device_id is None
+    assert device_connection.heartbeat_transport == "amqp"
+    assert "heartbeat" in device_connection.channels.lanes
+
+
+@pytest.mark.usefixtures("tables")
+def test_device_connection_lanes(dbsession):
+    """Test that each kind of traffic gets its own channel."""
+
+    Device(device_id="TEST01").save(dbsession)
+    broker = LocalBroker()
+    device_connection = LocalDeviceConnection(broker)
+    device_connection._connection = device_connection.connect()
+    ioloop = device_connection._connection.ioloop
+    ioloop.run_for(0.02)
+
+    channels = device_connection.channels
+    numbers = {channels.get(lane).channel_number for lane in channels.lanes}
+    assert len(numbers) == len(DeviceConnection.CHANNEL_LANES)
+    assert (
+        device_connection.health.commands
+        is device_connection.SERVER_MESSAGES.dispatcher.metrics
+    )
+
+    device_connection.ALARM_MESSAGES.send({"alarm": "high temperature"}, priority=5)
+    ioloop.run_for(0.02)
+
+    alarm = broker.queues["alarm_events"].pop()
+    assert alarm["routing_key"] == "TEST01.alarm"
+    assert alarm["properties"].priority == 5
+
+    # a reconnect replaces the publishers and their flow control listeners
+    listeners = len(device_connection.flow_control._listeners)
+    device_connection.on_channels_open()
+    assert len(device_connection.flow_control._listeners) == listeners
+
+    device_connection.SWEEP.stop()
+    device_connection.health.stop()
+    device_connection.SERVER_MESSAGES.dispatcher.shutdown()
+    device_connection._session.close()
+
+
+@pytest.mark.usefixtures("tables")
+def test_device_connection_remembers_connected(dbsession, monkeypatch):
+    """Test that the connected state is saved on the snapshot worker, not the IOLoop."""
+
+    Device(device_id="TEST01").save(dbsession)
+    db_Connection().save(dbsession)
+    threads = []
+    remember_connected = DeviceConnection.remember_connected
+
+    def record_thread(self, connected, host):
+        threads.append(threading.current_thread().name)
+        remember_connected(self, connected, host)
+
+    monkeypatch.setattr(DeviceConnection, "remember_connected", record_thread)
+    device_connection = LocalDeviceConnection(LocalBroker())
+    device_connection._host = "10.0.0.5"
+    device_connection._connection = device_connection.connect()
+    device_connection._connection.ioloop.run_for(0.02)
+    device_connection._snapshot_executor.shutdown(wait=True)
+
+    assert threads[0].startswith("fd-snapshot")
+    dbsession.expire_all()
+    row = dbsession.query(db_Connection).one()
+    assert row.address == "10.0.0.5"
+    assert row.is_connected
+
+    device_connection.SWEEP.stop()
+    device_connection.health.stop()
+    device_connection.SERVER_MESSAGES.dispatcher.shutdown()
+    device_connection._session.close()
+
+
+@pytest.mark.usefixtures("tables")
+def test_device_connection_gateway_lane(dbsession, monkeypatch):
+    """Test that the gateway publisher confirms on a channel of its own."""
+
+    monkeypatch.setattr(get_config(), "GATEWAY_MODE", "gateway")
+    monkeypatch.setattr(get_config(), "GATEWAY_PORT", 0)
+    Device(device_id="TEST01").save(dbsession)
+    device_connection = LocalDeviceConnection(LocalBroker())
+    device_connection._connection = device_connection.connect()
+    ioloop = device_connection._connection.ioloop
+    ioloop.run_for(0.02)
+
+    channels = device_connection.channels
+    assert channels.confirm("gateway")
+    assert channels.get("gateway") is not channels.get("bulk")
+    assert device_connection.GATEWAY_MESSAGES._channel is channels.get("gateway")
+
+    device_connection.BULK_MESSAGES.send({"grainbin_data": []})
+    device_connection.GATEWAY_MESSAGES.send({"peers": []})
+    ioloop.run_for(0.02)
+    assert device_connection.BULK_MESSAGES.acked == 1
+    assert device_connection.GATEWAY_MESSAGES.acked == 1
+
+    device_connection.GATEWAY.stop()
+    device_connection.SWEEP.stop()
+    device_connection.health.stop()
+    device_connection.SERVER_MESSAGES.dispatcher.shutdown()
+    device_connection._session.close()
+
+
+@pytest.mark.usefixtures("tables")
+def test_device_connection_udp_heartbeats(dbsession):
+    """Test that UDP heartbeats do not use a heartbeat channel."""
+
+    Device(device_id="TEST01").save(dbsession)
+    broker = LocalBroker()
+    device_connection = LocalDeviceConnection(broker)
+    device_connection.heartbeat_transport = "udp"
+    device_connection._host = "127.0.0.1"
+    device_connection._connection = device_connection.connect()
+    device_connection._connection.ioloop.run_for(0.02)
+
+    assert "heartbeat" not in device_connection.channels.lanes
+    assert isinstance(device_connection.HEARTBEAT_MESSGES, UdpHeartbeat)
+
+    device_connection.HEARTBEAT_MESSGES.set_stopping(True)
+    device_connection.SWEEP.stop()
+    device_connection.health.stop()
+    device_connection.SERVER_MESSAGES.dispatcher.shutdown()
+    device_connection._session.close()
+
+
+def test_handle_set_schedule():
+    """Test setting and clearing the schedule slot from the server."""
+
+    schedule = Schedule("TEST01")
+    fraction = schedule.fraction
+
+    reply = service.handle_set_schedule(schedule, {"slot": 3, "slot_count": 4}, None)
+    assert reply["fraction"] == 0.75
+    assert "error" not in reply
+
+    reply = service.handle_set_schedule(schedule, {"slot": 5, "slot_count": 4}, None)
+    assert "error" in reply
+    assert reply["fraction"] == 0.75
+
+    reply = service.handle_set_schedule(schedule, {"slot": None}, None)
+    assert reply["fraction"] == fraction
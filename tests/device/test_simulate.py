@@ -0,0 +1,35 @@
+"""Test the fleet simulator."""
+from fd_device.device.simulate import SyntheticGrainbins, run_simulation
+
+
+def test_synthetic_grainbins_are_repeatable():
+    """Test that a device's synthetic grainbins depend only on its seed."""
+
+    first = SyntheticGrainbins("sim-00001", grainbins=2, sensors=3).read()
+    second = SyntheticGrainbins("sim-00001", grainbins=2, sensors=3).read()
+
+    assert [reading["bus_number"] for reading in first] == [0, 1]
+    assert len(first[0]["sensors"]) == 3
+    assert [reading["sensors"] for reading in first] == [
+        reading["sensors"] for reading in second
+    ]
+
+
+def test_simulate_fleet_publishes():
+    """Test that every virtual device connects, heartbeats and publishes sweeps."""
+
+    results = run_simulation(
+        5, 1.5, heartbeat_interval=0.2, sweep_interval=0.3, grainbins=2, sensors=2
+    )
+
+    assert len(results["devices"]) == 5
+    for result in results["devices"]:
+        assert result["state"] == "connected"
+        assert result["replies"] > 0
+        assert result["updates"] > 0
+        assert result["messages_per_second"] > 0
+
+    total = results["total"]
+    assert total["connected"] == 5
+    assert total["heartbeats"] == sum(r["heartbeats"] for r in results["devices"])
+    assert total["messages_per_second"] > 0
@@ -0,0 +1,103 @@
+"""Test the warm start snapshot."""
+# pylint: disable=protected-access
+import json
+import logging
+
+import pytest
+
+from fd_device.controller.local_broker import LocalBroker
+from fd_device.database.device import Device, RuntimeConfig
+from fd_device.device import service
+from fd_device.device.snapshot import SNAPSHOT_VERSION, read_snapshot, write_snapshot
+from fd_device.settings import get_config
+
+from .test_service import LocalDeviceConnection
+
+
+def test_snapshot_round_trip(tmp_path):
+    """Test that a written snapshot is read back, and a bad one is ignored."""
+
+    path = str(tmp_path / "warm_start.json")
+    assert read_snapshot(path) is None
+    assert read_snapshot(None) is None
+
+    write_snapshot(path, {"device_id": "TEST01", "address": "10.0.0.5"})
+    snapshot = read_snapshot(path)
+    assert snapshot["version"] == SNAPSHOT_VERSION
+    assert snapshot["address"] == "10.0.0.5"
+    assert not (tmp_path / "warm_start.json.tmp").exists()
+
+    (tmp_path / "warm_start.json").write_text("{not json")
+    assert read_snapshot(path) is None
+
+    (tmp_path / "warm_start.json").write_text(json.dumps({"device_id": "TEST01"}))
+    assert read_snapshot(path) is None
+
+
+@pytest.mark.usefixtures("tables")
+def test_device_connection_warm_start(dbsession, tmp_path, monkeypatch):
+    """Test a warm start from the snapshot, reconciled with the database after."""
+
+    path = tmp_path / "warm_start.json"
+    monkeypatch.setattr(get_config(), "WARM_START_FILE", str(path))
+    monkeypatch.setattr(service, "sensor_index", lambda: {"0": ["28.000000000001"]})
+    write_snapshot(
+        str(path),
+        {
+            "device_id": "TEST01",
+            "address": "10.0.0.5",
+            "brokers": ["10.0.0.5", "10.0.0.6"],
+            "sensors": {"0": ["28.000000000001"]},
+            "schedule": {"slot": 1, "slot_count": 4},
+            "runtime": {"heartbeat_interval": 20, "sweep_interval": "bad"},
+        },
+    )
+    Device(device_id="TEST01").save(dbsession)
+    RuntimeConfig(sweep_interval=60).save(dbsession)
+
+    device_connection = LocalDeviceConnection(LocalBroker())
+    assert device_connection.device_id == "TEST01"
+    assert device_connection._host == "10.0.0.5"
+    assert device_connection.schedule.fraction == 0.25
+    runtime = device_connection.runtime.snapshot()
+    assert runtime["heartbeat_interval"] == 20
+    assert runtime["sweep_interval"] == get_config().SWEEP_INTERVAL
+
+    device_connection.save_snapshot()
+
+    assert device_connection.warm_start is None
+    assert device_connection.runtime.snapshot()["sweep_interval"] == 60
+    snapshot = read_snapshot(str(path))
+    assert snapshot["brokers"] == ["10.0.0.5", "10.0.0.6"]
+    assert snapshot["schedule"]["slot"] == 1
+    assert snapshot["runtime"]["sweep_interval"] == 60
+
+    device_connection._session.close()
+    device_connection._snapshot_executor.shutdown()
+
+
+def test_warm_start_waits_for_the_database(tmp_path, monkeypatch):
+    """Test that a warm start retries the database until it is up."""
+
+    path = tmp_path / "warm_start.json"
+    monkeypatch.setattr(get_config(), "WARM_START_FILE", str(path))
+    monkeypatch.setattr(get_config(), "WARM_START_RETRY", 0)
+    monkeypatch.setattr(service, "sensor_index", dict)
+    write_snapshot(str(path), {"device_id": "TEST01", "address": "10.0.0.5"})
+
+    device_connection = service.DeviceConnection(logging.getLogger("fd.test"))
+    attempts = []
+
+    def reconcile():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise service.SQLAlchemyError("database is starting")
+        device_connection.warm_start = None
+
+    monkeypatch.setattr(device_connection, "reconcile", reconcile)
+    device_connection.save_snapshot()
+
+    assert len(attempts) == 3
+    assert read_snapshot(str(path))["device_id"] == "TEST01"
+    device_connection._session.close()
+    device_connection._snapshot_executor.shutdown()
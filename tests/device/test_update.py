@@ -0,0 +1,89 @@
+"""Test the device state sync versions."""
+import pytest
+
+from fd_device.database.database import current_sync_version
+from fd_device.database.device import Device, Grainbin
+from fd_device.database.system import Hardware, Software
+from fd_device.device import service
+from fd_device.device.update import get_device_changes
+
+
+@pytest.mark.usefixtures("tables")
+def test_save_bumps_section_versions(dbsession):
+    """Test that saving a changed row gives its section the next version."""
+
+    assert current_sync_version(dbsession) == 0
+    device = Device(device_id="TEST01").save(dbsession)
+    Hardware().save(dbsession)
+    assert current_sync_version(dbsession) == 2
+
+    # saving a row that did not change keeps the version
+    device.update(dbsession, device_id="TEST01")
+    assert current_sync_version(dbsession) == 2
+
+    Grainbin("bin1", 0, device.id).save(dbsession)
+    changes = get_device_changes(2, dbsession)
+
+    assert changes["version"] == 3
+    assert not changes["full"]
+    assert list(changes["sections"]) == ["grainbins"]
+    assert changes["sections"]["grainbins"][0]["name"] == "bin1"
+
+
+@pytest.mark.usefixtures("tables")
+def test_commit_bumps_section_versions(dbsession):
+    """Test that rows changed by attribute and committed bump their sections once each."""
+
+    device = Device(device_id="TEST01")
+    dbsession.add(device)
+    dbsession.add(Hardware())
+    dbsession.commit()
+    assert current_sync_version(dbsession) == 2
+
+    device.interior_sensor = "28.000000000001"
+    dbsession.commit()
+    changes = get_device_changes(2, dbsession)
+
+    assert changes["version"] == 3
+    assert list(changes["sections"]) == ["device"]
+
+
+@pytest.mark.usefixtures("tables")
+def test_full_sync(dbsession):
+    """Test that every section is sent without a version, or with an unknown one."""
+
+    Device(device_id="TEST01").save(dbsession)
+    software = Software()
+    software.software_version = "1.0"
+    software.save(dbsession)
+
+    for since in (None, 99):
+        changes = get_device_changes(since, dbsession)
+        assert changes["full"]
+        assert set(changes["sections"]) == {
+            "device",
+            "grainbins",
+            "hardware",
+            "software",
+            "interfaces",
+        }
+    assert changes["sections"]["device"]["id"] == "TEST01"
+    assert changes["sections"]["software"]["software_version"] == "1.0"
+    assert changes["sections"]["hardware"] is None
+
+    assert get_device_changes(changes["version"], dbsession)["sections"] == {}
+
+
+@pytest.mark.usefixtures("tables")
+def test_handle_sync(dbsession):
+    """Test the sync command replies with the changes, and rejects invalid versions."""
+
+    Device(device_id="TEST01").save(dbsession)
+
+    reply = service.handle_sync({"command": "sync", "since": 0}, None)
+    assert reply["command"] == "sync"
+    assert reply["version"] == 1
+    assert list(reply["sections"]) == ["device"]
+
+    reply = service.handle_sync({"command": "sync", "since": "1"}, None)
+    assert "error" in reply
@@ -0,0 +1,149 @@
+"""Test the sweep module."""
+import logging
+
+from fd_device.controller.flow import FlowControl
+from fd_device.controller.local_broker import LocalBroker, LocalConnection
+from fd_device.grainbin import sweep
+from fd_device.grainbin.sweep import GrainbinSweep
+
+
+class FakePublisher:  # pylint: disable=too-few-public-methods
+    """Record the messages sent."""
+
+    def __init__(self):
+        """Create the FakePublisher object."""
+        self.messages = []
+
+    def send(self, message, routing_key=None, priority=None):
+        """Record the message."""
+        # pylint: disable=unused-argument
+        self.messages.append(message)
+        return True
+
+
+def test_sweep_publishes_readings(monkeypatch):
+    """Test that sweeps run on schedule and publish their readings."""
+
+    monkeypatch.setattr(
+        sweep, "sweep_grainbins", lambda resolution, index: [{"bus_number": 0}]
+    )
+    connection = LocalConnection(LocalBroker())
+    publisher = FakePublisher()
+    grainbin_sweep = GrainbinSweep(
+        connection, publisher, logging.getLogger("fd.test"), interval=0.02
+    )
+
+    grainbin_sweep.start()
+    connection.ioloop.run_for(0.07)
+    grainbin_sweep.stop()
+
+    assert grainbin_sweep.sweep_count >= 2
+    assert grainbin_sweep.last_duration is not None
+    assert publisher.messages[0]["grainbin_data"] == [{"bus_number": 0}]
+
+
+def test_sweep_skipped_while_blocked(monkeypatch):
+    """Test that sweeps are skipped while publishing is blocked."""
+
+    monkeypatch.setattr(
+        sweep, "sweep_grainbins", lambda resolution, index: [{"bus_number": 0}]
+    )
+    connection = LocalConnection(LocalBroker())
+    flow_control = FlowControl()
+    flow_control.block()
+    publisher = FakePublisher()
+    grainbin_sweep = GrainbinSweep(
+        connection,
+        publisher,
+        logging.getLogger("fd.test"),
+        interval=0.02,
+        flow_control=flow_control,
+    )
+
+    grainbin_sweep.start()
+    connection.ioloop.run_for(0.05)
+    grainbin_sweep.stop()
+
+    assert grainbin_sweep.sweep_count == 0
+    assert grainbin_sweep.skipped >= 1
+    assert not publisher.messages
+
+
+def bus_reading(bus_number, *temperatures):
+    """Return a reading of a bus with a sensor for each temperature."""
+    return {
+        "bus_number": bus_number,
+        "sensors": [
+            {"id": f"28.{number}", "temperature": temperature}
+            for number, temperature in enumerate(temperatures)
+        ],
+    }
+
+
+def test_changed_readings():
+    """Test that only grainbins that moved by the deadband are published."""
+
+    published = {}
+    first = [bus_reading(0, "20.0", "21.0"), bus_reading(1, "None")]
+
+    assert sweep.changed_readings(first, published, 0.5) == first
+
+    second = [bus_reading(0, "20.2", "21.3"), bus_reading(1, "18.0")]
+    assert sweep.changed_readings(second, published, 0.5) == [second[1]]
+
+    # the change is measured from the last published temperature
+    third = [bus_reading(0, "20.6", "21.0"), bus_reading(1, "18.0")]
+    assert sweep.changed_readings(third, published, 0.5) == [third[0]]
+
+    assert sweep.changed_readings(third, published, 0) == third
+
+
+def test_sweep_configure_and_batches(monkeypatch):
+    """Test that configured sweeps use the resolution and batch size."""
+
+    resolutions = []
+
+    def sweep_grainbins(resolution, index):
+        resolutions.append(resolution)
+        return [bus_reading(number, "20.0") for number in range(5)]
+
+    monkeypatch.setattr(sweep, "sweep_grainbins", sweep_grainbins)
+    connection = LocalConnection(LocalBroker())
+    publisher = FakePublisher()
+    grainbin_sweep = GrainbinSweep(
+        connection, publisher, logging.getLogger("fd.test"), interval=10
+    )
+    grainbin_sweep.configure(
+        {
+            "sweep_interval": 0.02,
+            "sweep_resolution": "temperature12",
+            "sweep_deadband": 0.5,
+            "sweep_batch_size": 2,
+        }
+    )
+
+    grainbin_sweep.start()
+    connection.ioloop.run_for(0.07)
+    grainbin_sweep.stop()
+
+    assert grainbin_sweep.sweep_count >= 2
+    assert resolutions[0] == "temperature12"
+    # the first sweep in batches of 2, later sweeps are within the deadband
+    assert [len(message["grainbin_data"]) for message in publisher.messages] == [
+        2,
+        2,
+        1,
+    ]
+
+
+def test_changed_readings_missing_temperature():
+    """Test that a sensor without a temperature is compared without raising."""
+
+    published = {}
+    first = [bus_reading(0, "20.0", None)]
+    assert sweep.changed_readings(first, published, 0.5) == first
+
+    assert sweep.changed_readings([bus_reading(0, "20.1", None)], published, 0.5) == []
+
+    third = [bus_reading(0, "20.1", "19.0")]
+    assert sweep.changed_readings(third, published, 0.5) == third
@@ -0,0 +1,108 @@
+"""Test the grainbin update and cache modules."""
+# pylint: disable=redefined-outer-name
+import pytest
+
+from fd_device.grainbin import update
+from fd_device.grainbin.cache import READING_CACHE, ReadingCache
+
+
+@pytest.fixture()
+def bus(tmp_path, monkeypatch):
+    """Create a fake 1wire bus with two sensors."""
+
+    for name, temperature in (("28.000000000001", "20.5"), ("28.000000000002", "21")):
+        sensor = tmp_path / name
+        sensor.mkdir()
+        (sensor / "id").write_text(name)
+        (sensor / "temphigh").write_text("1")
+        (sensor / "templow").write_text("2")
+        (sensor / "temperature10").write_text(temperature)
+
+    monkeypatch.setattr(update, "get_bus_path", lambda bus_number: str(tmp_path))
+    READING_CACHE.clear()
+    yield tmp_path
+    READING_CACHE.clear()
+
+
+def test_reading_cache():
+    """Test storing and retrieving from the ReadingCache."""
+
+    cache = ReadingCache()
+    assert cache.get("key", 10) is None
+    assert cache.read_at("key") is None
+
+    cache.store("key", {"temperature": "20"})
+    data, age = cache.get("key", 10)
+
+    assert data == {"temperature": "20"}
+    assert 0 <= age < 10
+    assert cache.get("key", -1) is None
+    assert cache.read_at("key") is not None
+
+
+def test_read_grainbin(bus):
+    """Test reading all the sensors of a grainbin."""
+
+    info = update.read_grainbin(0)
+
+    assert info["bus_number"] == 0
+    assert not info["cached"]
+    assert sorted(sensor["temperature"] for sensor in info["sensors"]) == [
+        "20.5",
+        "21",
+    ]
+
+
+def test_read_grainbin_from_cache(bus):
+    """Test that a fresh reading is served from the cache."""
+
+    update.read_grainbin(0)
+    (bus / "28.000000000001" / "temperature10").write_text("30")
+
+    cached = update.read_grainbin(0, max_age=60)
+    fresh = update.read_grainbin(0, max_age=0)
+
+    assert cached["cached"]
+    assert "30" not in [sensor["temperature"] for sensor in cached["sensors"]]
+    assert not fresh["cached"]
+    assert "30" in [sensor["temperature"] for sensor in fresh["sensors"]]
+
+
+def test_read_grainbin_single_sensor(bus):
+    """Test reading a single sensor, and serving it from a bin sweep."""
+
+    update.read_grainbin(0)
+
+    info = update.read_grainbin(0, sensor="28.000000000002", max_age=60)
+
+    assert info["cached"]
+    assert len(info["sensors"]) == 1
+    assert info["sensors"][0]["id"] == "28.000000000002"
+
+
+def test_sweep_grainbins(bus, monkeypatch):
+    """Test reading every bus."""
+
+    monkeypatch.setattr(
+        update, "all_busses", lambda: ["/mnt/1wire/bus.1", "/mnt/1wire/bus.0"]
+    )
+
+    readings = update.sweep_grainbins()
+
+    assert [reading["bus_number"] for reading in readings] == [0, 1]
+    assert len(readings[0]["sensors"]) == 2
+
+
+def test_sweep_grainbins_from_sensor_index(bus, monkeypatch):
+    """Test that a sweep with a sensor index reads its sensors without listing the busses."""
+
+    monkeypatch.setattr(update, "all_busses", lambda: ["/mnt/1wire/bus.0"])
+    index = update.sensor_index()
+    assert index == {"0": ["28.000000000001", "28.000000000002"]}
+
+    monkeypatch.setattr(update, "all_busses", lambda: pytest.fail("busses listed"))
+    monkeypatch.setattr(update, "all_sensors", lambda path: pytest.fail("bus listed"))
+    readings = update.sweep_grainbins(index={"0": ["28.000000000002"]})
+
+    assert [reading["bus_number"] for reading in readings] == [0]
+    assert readings[0]["sensors"][0]["temperature"] == "21"
@@ -1,11 +1,13 @@
 """Tests for the wifi module.
 
-TODO: add tests for functions: refresh_interfaces, scan_wifi, wifi_info, wifi_ap_clients, wifi_dhcp_info,
+TODO: add tests for functions: scan_wifi, wifi_info, wifi_ap_clients, wifi_dhcp_info,
       set_interfaces, set_ap_mode, set_wpa_mode
 """
 import pytest
 
+from fd_device.database.database import SyncVersion
 from fd_device.database.system import Interface, Wifi
+from fd_device.network import wifi
 from fd_device.network.wifi import add_wifi_network, delete_wifi_network
 
 
@@ -77,3 +79,49 @@ def test_delete_wifi_network_not_exisit():
     confirm_deleted = delete_wifi_network("99")
 
     assert not confirm_deleted
+
+
+@pytest.mark.usefixtures("populate_interfaces")
+def test_refresh_interfaces(dbsession, monkeypatch):
+    """Test that refresh_interfaces adds the new interfaces and keeps the known ones."""
+
+    modes = []
+    monkeypatch.setattr(wifi, "get_interfaces", lambda: ["wlan0", "eth0"])
+    monkeypatch.setattr(wifi, "set_ap_mode", lambda: modes.append("ap"))
+    monkeypatch.setattr(wifi, "set_wpa_mode", lambda: modes.append("wpa"))
+
+    wifi.refresh_interfaces()
+
+    interfaces = {
+        interface.interface: interface for interface in dbsession.query(Interface)
+    }
+    assert interfaces["wlan0"].is_for_fm
+    assert interfaces["eth0"].is_active
+    assert not interfaces["eth0"].is_for_fm
+    assert interfaces["eth0"].state == "dhcp"
+    assert modes == ["wpa"]
+
+
+@pytest.mark.usefixtures("populate_interfaces")
+def test_refresh_interfaces_sync_version(dbsession, monkeypatch):
+    """Test that only a refresh that changes an interface bumps its version."""
+
+    found = ["wlan0", "eth0"]
+    monkeypatch.setattr(wifi, "get_interfaces", lambda: found)
+    monkeypatch.setattr(wifi, "set_ap_mode", lambda: None)
+    monkeypatch.setattr(wifi, "set_wpa_mode", lambda: None)
+
+    def interfaces_version():
+        dbsession.expire_all()
+        return dbsession.query(SyncVersion).get("interfaces").version
+
+    wifi.refresh_interfaces()
+    version = interfaces_version()
+
+    wifi.refresh_interfaces()
+    assert interfaces_version() == version
+
+    found.remove("eth0")
+    wifi.refresh_interfaces()
+    assert interfaces_version() > version
+    assert not dbsession.query(Interface).filter_by(interface="eth0").one().is_active
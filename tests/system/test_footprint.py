@@ -0,0 +1,13 @@
+"""Test the import footprint of the daemon."""
+from fd_device.system.footprint import measure_import
+
+
+def test_daemon_defers_heavy_imports():
+    """Test that starting the daemon imports none of the heavy dependencies."""
+
+    result = measure_import("fd_device.main")
+
+    assert result["module"] == "fd_device.main"
+    assert result["heavy"] == []
+    assert result["modules"] > 0
+    assert result["rss_kb"] >= result["baseline_rss_kb"] > 0
@@ -0,0 +1,90 @@
+"""Test recording and replaying the sensor reads."""
+# pylint: disable=redefined-outer-name
+import gzip
+import json
+
+import pytest
+
+from fd_device.grainbin import update
+from fd_device.grainbin.cache import READING_CACHE
+from fd_device.grainbin.temperature import read_sensor
+from fd_device.system import sensor_files
+from fd_device.system.sensor_files import Recorder, Replayer, SensorFiles
+
+
+@pytest.fixture()
+def bus(tmp_path, monkeypatch):
+    """Create a fake 1wire bus with two sensors."""
+
+    bus_path = tmp_path / "bus.0"
+    for name, temperature in (("28.000000000001", "20.5"), ("28.000000000002", "21")):
+        sensor = bus_path / name
+        sensor.mkdir(parents=True)
+        (sensor / "id").write_text(name)
+        (sensor / "temphigh").write_text("1")
+        (sensor / "templow").write_text("2")
+        (sensor / "temperature10").write_text(temperature)
+
+    monkeypatch.setattr(update, "get_bus_path", lambda bus_number: str(bus_path))
+    READING_CACHE.clear()
+    yield bus_path
+    READING_CACHE.clear()
+    sensor_files.set_backend(SensorFiles())
+
+
+def test_record_and_replay_grainbin(bus, tmp_path):
+    """Test that a replayed grainbin read returns what was recorded."""
+
+    recording = str(tmp_path / "sweep.jsonl.gz")
+    recorder = Recorder(recording, flush_every=3)
+    sensor_files.set_backend(recorder)
+    recorded = update.read_grainbin(0)
+    recorder.close()
+
+    # glob, then id, temphigh, templow and temperature10 of both sensors
+    assert recorder.count == 9
+    for sensor in bus.iterdir():
+        (sensor / "temperature10").write_text("99")
+
+    sensor_files.set_backend(Replayer(recording, speed=0))
+    READING_CACHE.clear()
+    replayed = update.read_grainbin(0)
+
+    assert replayed["sensors"] == recorded["sensors"]
+
+
+def test_replay_errors_and_latency(tmp_path, monkeypatch):
+    """Test that recorded errors are raised again, after the recorded latency."""
+
+    recording = str(tmp_path / "errors.jsonl.gz")
+    recorder = Recorder(recording)
+    sensor_files.set_backend(recorder)
+    data = read_sensor(str(tmp_path / "missing"))
+    recorder.close()
+    assert data["temperature"] == "None"
+
+    sleeps = []
+    monkeypatch.setattr(sensor_files.time, "sleep", sleeps.append)
+    replayer = Replayer(recording, speed=4)
+    sensor_files.set_backend(replayer)
+    try:
+        assert read_sensor(str(tmp_path / "missing")) == data
+    finally:
+        sensor_files.set_backend(SensorFiles())
+
+    with gzip.open(recording, "rt") as f:
+        latencies = [json.loads(line)[4] for line in f.readlines()[1:]]
+    assert sleeps == pytest.approx([latency / 4 for latency in latencies])
+    with pytest.raises(FileNotFoundError):
+        replayer.read_line(str(tmp_path / "never_read"))
+
+
+def test_replay_rejects_other_files(tmp_path):
+    """Test that a file without the recording header can not be replayed."""
+
+    path = tmp_path / "other.jsonl.gz"
+    with gzip.open(path, "wt") as f:
+        f.write(json.dumps({"version": 99}) + "\n")
+
+    with pytest.raises(ValueError):
+        Replayer(str(path))
@@ -0,0 +1,40 @@
+"""Test the startup profile."""
+from fd_device.system.startup_profile import StartupProfile
+
+
+def test_marks_ignored_until_started():
+    """Test that a profile that was never started records nothing."""
+
+    profile = StartupProfile()
+    profile.mark("cli_import")
+    profile.finish("first_heartbeat_ack")
+
+    assert profile.phases() == []
+
+
+def test_startup_profile_breakdown(capsys):
+    """Test that each phase is timed once, and the breakdown is printed when finished."""
+
+    profile = StartupProfile()
+    profile.echo = True
+    profile.start()
+    profile.mark("cli_import")
+    profile.mark("configure_logging")
+    profile.mark("cli_import")
+    profile.finish("first_heartbeat_ack")
+    profile.mark("connection_open")
+    profile.finish("first_heartbeat_ack")
+
+    phases = profile.phases()
+    assert [phase for phase, _ in phases] == [
+        "cli_import",
+        "configure_logging",
+        "first_heartbeat_ack",
+    ]
+    assert all(seconds >= 0 for _, seconds in phases)
+    assert not profile.running
+
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 1
+    assert output[0].startswith("Startup took ")
+    assert "configure_logging " in output[0]
@@ -0,0 +1,48 @@
+"""Test the main module."""
+import logging
+
+from fd_device import main
+from fd_device.settings import get_config
+
+
+class FakeProcess:
+    """Stand in for a multiprocessing Process, recording the started targets."""
+
+    started = []
+
+    def __init__(self, target):
+        """Create the FakeProcess object."""
+        self.target = target
+
+    def start(self):
+        """Record the target instead of starting a process."""
+        self.started.append(self.target)
+
+    def join(self):
+        """Return at once, as nothing was started."""
+
+
+def run_main(monkeypatch, **config):
+    """Run main with the config changes, no broker and no processes, and return the started targets."""
+
+    for name, value in config.items():
+        monkeypatch.setattr(get_config(), name, value)
+    monkeypatch.setattr(
+        main, "configure_logging", lambda config: logging.getLogger("fd.test")
+    )
+    monkeypatch.setattr(main, "get_rabbitmq_address", lambda logger, session: False)
+    monkeypatch.setattr(main.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(main, "Process", FakeProcess)
+    FakeProcess.started = []
+    main.main()
+    return FakeProcess.started
+
+
+def test_peer_mode_starts_without_a_broker(monkeypatch):
+    """Test that a peer starts without looking for a broker, and not without a gateway."""
+
+    assert run_main(monkeypatch, GATEWAY_MODE="peer", GATEWAY_ADDRESS="10.0.0.2") == [
+        main.run_connection
+    ]
+    assert run_main(monkeypatch, GATEWAY_MODE="peer", GATEWAY_ADDRESS=None) == []
+    assert run_main(monkeypatch, GATEWAY_MODE=None) == []
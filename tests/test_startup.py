@@ -0,0 +1,112 @@
+"""Test finding the RabbitMQ server at startup."""
+import logging
+import threading
+import time
+
+import pytest
+
+from fd_device import startup
+from fd_device.database.device import Connection
+from fd_device.settings import get_config
+
+LOGGER = logging.getLogger("fd.test.startup")
+
+
+def test_discovery_races_the_candidates(monkeypatch):
+    """Test that the first address to pass the check wins, without waiting for slower ones."""
+
+    release = threading.Event()
+
+    def check(logger, address):
+        if address == "127.0.0.1":
+            release.wait(5)
+            return True
+        return address == "127.0.0.2"
+
+    monkeypatch.setattr(startup, "check_rabbitmq_address", check)
+    monkeypatch.setattr(get_config(), "DISCOVERY_JOIN_TIMEOUT", 0.1)
+
+    start = time.monotonic()
+    found = startup.discover_rabbitmq_address(
+        LOGGER, ["127.0.0.1", "127.0.0.3", "127.0.0.2", "no-such-host.invalid"]
+    )
+    elapsed = time.monotonic() - start
+    release.set()
+
+    assert found == "127.0.0.2"
+    assert elapsed < 2
+
+
+def test_discovery_deadline(monkeypatch):
+    """Test that discovery gives up at the deadline."""
+
+    release = threading.Event()
+    monkeypatch.setattr(
+        startup, "check_rabbitmq_address", lambda logger, address: release.wait(5)
+    )
+    monkeypatch.setattr(get_config(), "DISCOVERY_JOIN_TIMEOUT", 0.1)
+
+    start = time.monotonic()
+    found = startup.discover_rabbitmq_address(LOGGER, ["127.0.0.1"], deadline=0.3)
+    elapsed = time.monotonic() - start
+    release.set()
+
+    assert found is None
+    assert elapsed < 2
+
+
+def test_discovery_trusts_the_connected_address(monkeypatch):
+    """Test that the address the device connection last used only needs a TCP probe."""
+
+    monkeypatch.setattr(
+        startup, "check_rabbitmq_address", lambda logger, address: False
+    )
+    monkeypatch.setattr(startup, "probe_latency", lambda address, timeout: 0.01)
+
+    found = startup.discover_rabbitmq_address(
+        LOGGER, ["127.0.0.1", "127.0.0.2"], deadline=2, trusted="127.0.0.2"
+    )
+
+    assert found == "127.0.0.2"
+
+
+@pytest.mark.usefixtures("tables")
+def test_discovery_without_presence_interface(dbsession, monkeypatch):
+    """Test that a presence interface without an address does not stop the candidates."""
+
+    def no_address(interface, broadcast=False):
+        raise ValueError(f"{interface} has no IPv4 address")
+
+    monkeypatch.setattr(startup, "get_ip_of_interface", no_address)
+    monkeypatch.setattr(startup, "DEFAULT_ADDRESSES", ["127.0.0.1"])
+    monkeypatch.setattr(
+        startup, "check_rabbitmq_address", lambda logger, address: True
+    )
+    monkeypatch.setattr(startup, "probe_latency", lambda address, timeout: 0.01)
+
+    assert startup.get_rabbitmq_address(LOGGER, dbsession)
+    assert dbsession.query(Connection).one().address == "127.0.0.1"
+
+
+def test_discovery_waits_for_the_checks(monkeypatch):
+    """Test that the checks still running have stopped when discovery returns."""
+
+    started = threading.Event()
+    stopped = []
+
+    def check(logger, address):
+        if address == "127.0.0.1":
+            return started.wait(1)
+        started.set()
+        time.sleep(0.2)
+        stopped.append(address)
+        return False
+
+    monkeypatch.setattr(startup, "check_rabbitmq_address", check)
+
+    found = startup.discover_rabbitmq_address(
+        LOGGER, ["127.0.0.1", "127.0.0.2"], deadline=2
+    )
+
+    assert found == "127.0.0.1"
+    assert stopped == ["127.0.0.2"]